@@ -0,0 +1,371 @@
+"""
+generate_synthetic_ljk.py — Generator LJK sintetis berlabel
+===========================================================
+Render LJK dengan layout yang diasumsikan pipeline (kanvas 1000x1414:
+marker sudut di pojok kanvas, ROW_Y_CENTERS, dua kolom jawaban, grid
+Nama / Nomor Induk seperti yang dicari OCR), isi bubble secara acak
+(kosong, satu jawaban, DOUBLE) plus nama & nomor induk yang diketahui,
+lalu rusak seperti foto HP: perspektif, resolusi, bayangan, blur, noise,
+kompresi JPEG. Setiap lembar punya label ground truth.
+
+    # Tulis 1000 JPEG + labels.jsonl ke synthetic_ljk/
+    python generate_synthetic_ljk.py --count 1000 --out synthetic_ljk
+
+    # Tanpa menulis ke disk: baca langsung dengan pipeline, laporkan akurasi
+    python generate_synthetic_ljk.py --count 200 --evaluate
+
+Dari script lain (benchmark, load generator):
+
+    from generate_synthetic_ljk import iter_sheets
+    for filename, jpeg_bytes, label in iter_sheets(100, seed=1):
+        ...
+
+Lembar ke-i hanya bergantung pada (seed, i), jadi --count berapa pun
+menghasilkan lembar yang sama untuk indeks yang sama.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from omr_core.detect_answers import OPTIONS, ROW_Y_CENTERS, OPTION_BOUNDS, ROW_HALF_HEIGHT
+
+# ---------------------------------------------------------------------------
+# Layout, in canonical canvas units (marker centers = canvas corners)
+# ---------------------------------------------------------------------------
+CANVAS_W, CANVAS_H = 1000, 1414
+MARKER_SIDE = 42
+# Paper beyond the marker centers (left, top, right, bottom)
+PAGE_MARGINS = (45, 45, 45, 160)
+
+ANSWER_COLUMNS = ((90, 350), (594, 854))  # same as detect_answers._columns
+NUMBER_COLUMNS = ((0, 75), (500, 575))
+TABLE_TOP = ROW_Y_CENTERS[0] - ROW_HALF_HEIGHT
+TABLE_BOTTOM = ROW_Y_CENTERS[-1] + ROW_HALF_HEIGHT
+
+# Name / ID grid as searched by omr_core.ocr (get_name_id_y_coords, get_grid_x_bounds)
+GRID_Y = (189, 219, 249)
+GRID_X_START = 222
+GRID_CELL_W = 42.5
+NAME_CELLS, ID_CELLS = 13, 10
+GRID_LABEL_X = 100
+
+NAME_SYLLABLES = ("AN", "DI", "SA", "RI", "PU", "TRA", "DEW", "NA", "BU", "DI", "AH",
+                  "MAD", "SI", "TI", "AR", "YA", "NO", "WI", "LA", "RA", "FA", "JAR")
+
+DEFAULT_MIX = {"answer": 0.8, "empty": 0.12, "double": 0.08}
+
+
+# ---------------------------------------------------------------------------
+# Clean sheet rendering
+# ---------------------------------------------------------------------------
+def _pt(x, y, s):
+    """Canonical canvas point -> page pixel (page origin includes the margin)."""
+    return int(round((x + PAGE_MARGINS[0]) * s)), int(round((y + PAGE_MARGINS[1]) * s))
+
+
+def page_size(s):
+    return (int(round((CANVAS_W + PAGE_MARGINS[0] + PAGE_MARGINS[2]) * s)),
+            int(round((CANVAS_H + PAGE_MARGINS[1] + PAGE_MARGINS[3]) * s)))
+
+
+def marker_centers(s):
+    """Marker centers (TL, TR, BR, BL) in page pixels."""
+    return np.array([_pt(0, 0, s), _pt(CANVAS_W, 0, s), _pt(CANVAS_W, CANVAS_H, s),
+                     _pt(0, CANVAS_H, s)], dtype=np.float32)
+
+
+def _option_centers(x_start, x_end):
+    col_w = x_end - x_start
+    return [x_start + col_w * (a + b) / 2 for a, b in OPTION_BOUNDS]
+
+
+def random_name(rng):
+    words = []
+    for _ in range(rng.integers(1, 3)):
+        words.append("".join(rng.choice(NAME_SYLLABLES, size=rng.integers(2, 4))))
+    return " ".join(words)[:NAME_CELLS]
+
+
+def random_id(rng):
+    return "".join(str(d) for d in rng.integers(0, 10, size=ID_CELLS))
+
+
+def random_answers(rng, num_questions=30, mix=DEFAULT_MIX):
+    kinds = list(mix)
+    probs = np.array([mix[k] for k in kinds], dtype=float)
+    answers = {}
+    for q in range(1, num_questions + 1):
+        kind = kinds[rng.choice(len(kinds), p=probs / probs.sum())]
+        if kind == "empty":
+            answers[q] = None
+        elif kind == "double":
+            answers[q] = "DOUBLE"
+        else:
+            answers[q] = OPTIONS[rng.integers(0, 5)]
+    return answers
+
+
+def render_sheet(answers, name, student_id, rng, s=2.0):
+    """
+    Clean grayscale sheet for `answers` {q: 'A'–'E' | 'DOUBLE' | None},
+    rendered at `s` pixels per canvas unit. Returns (page, double_marks)
+    where double_marks are the option pairs drawn for DOUBLE questions.
+    """
+    w, h = page_size(s)
+    page = np.full((h, w), 255, dtype=np.uint8)
+    ink, pencil = 20, int(rng.integers(25, 75))
+    lw = max(1, int(round(2.5 * s)))  # printed lines; thinner ones vanish in the marker threshold
+    font = cv2.FONT_HERSHEY_SIMPLEX
+
+    # Corner markers
+    for cx, cy in marker_centers(s):
+        half = MARKER_SIDE * s / 2
+        cv2.rectangle(page, (int(cx - half), int(cy - half)), (int(cx + half), int(cy + half)),
+                      ink, -1)
+
+    cv2.putText(page, "LEMBAR JAWABAN UJIAN", _pt(285, 95, s), cv2.FONT_HERSHEY_DUPLEX,
+                1.25 * s / 2, ink, max(1, int(2 * s / 2 + 1)))
+
+    # Name / ID grid, with handwritten-ish letters in the cells
+    y_top, y_mid, y_bot = GRID_Y
+    name_end = GRID_X_START + NAME_CELLS * GRID_CELL_W
+    id_end = GRID_X_START + ID_CELLS * GRID_CELL_W
+    cv2.rectangle(page, _pt(GRID_LABEL_X, y_top, s), _pt(name_end, y_mid, s), ink, lw)
+    cv2.rectangle(page, _pt(GRID_LABEL_X, y_mid, s), _pt(id_end, y_bot, s), ink, lw)
+    for k in range(NAME_CELLS + 1):
+        x = GRID_X_START + k * GRID_CELL_W
+        cv2.line(page, _pt(x, y_top, s), _pt(x, y_mid, s), ink, lw)
+    for k in range(ID_CELLS + 1):
+        x = GRID_X_START + k * GRID_CELL_W
+        cv2.line(page, _pt(x, y_mid, s), _pt(x, y_bot, s), ink, lw)
+    cv2.putText(page, "Nama :", _pt(GRID_LABEL_X + 6, y_mid - 8, s), font, 0.5 * s, ink, lw)
+    cv2.putText(page, "Nomor Induk :", _pt(GRID_LABEL_X + 6, y_bot - 8, s), font, 0.45 * s, ink, lw)
+    for row_y, text in ((y_top, name), (y_mid, student_id)):
+        for k, ch in enumerate(text):
+            if ch == " ":
+                continue
+            x = GRID_X_START + k * GRID_CELL_W + 10 + rng.uniform(-3, 3)
+            y = row_y + 25 + rng.uniform(-2, 2)
+            cv2.putText(page, ch, _pt(x, y, s), font, 0.75 * s, pencil, max(1, int(1.5 * s)))
+
+    # Answer table
+    cv2.rectangle(page, _pt(0, TABLE_TOP, s), _pt(CANVAS_W, TABLE_BOTTOM, s), ink, lw)
+    for x0, x1 in NUMBER_COLUMNS:
+        cv2.line(page, _pt(x0, TABLE_TOP, s), _pt(x0, TABLE_BOTTOM, s), ink, lw)
+        cv2.line(page, _pt(x1, TABLE_TOP, s), _pt(x1, TABLE_BOTTOM, s), ink, lw)
+    for y0, y1 in zip(ROW_Y_CENTERS, ROW_Y_CENTERS[1:]):
+        y = (y0 + y1) / 2
+        cv2.line(page, _pt(0, y, s), _pt(CANVAS_W, y, s), ink, lw)
+
+    double_marks = {}
+    for col, ((x0, x1), (nx, _)) in enumerate(zip(ANSWER_COLUMNS, NUMBER_COLUMNS)):
+        centers = _option_centers(x0, x1)
+        for row, yc in enumerate(ROW_Y_CENTERS):
+            q = col * len(ROW_Y_CENTERS) + row + 1
+            cv2.putText(page, f"{q}.", _pt(nx + 10, yc - 12, s), font, 0.45 * s, ink, lw)
+            for cx in centers:
+                cv2.ellipse(page, _pt(cx, yc, s), (int(15 * s), int(11 * s)), 0, 0, 360, ink, lw,
+                            cv2.LINE_AA)
+
+            answer = answers.get(q)
+            if answer is None:
+                continue
+            if answer == "DOUBLE":
+                picks = sorted(rng.choice(5, size=2, replace=False).tolist())
+                double_marks[q] = [OPTIONS[i] for i in picks]
+            else:
+                picks = [OPTIONS.index(answer)]
+            # Pencil marks: slightly off-center, somewhat bigger than the bubble
+            # (both marks of a DOUBLE alike, or it would read as one answer)
+            grow = rng.uniform(1.0, 1.3)
+            for i in picks:
+                center = _pt(centers[i] + rng.uniform(-3, 3), yc + rng.uniform(-2, 2), s)
+                cv2.ellipse(page, center, (int(16 * grow * s), int(12 * grow * s)),
+                            rng.uniform(-10, 10), 0, 360, pencil, -1, cv2.LINE_AA)
+    return page, double_marks
+
+
+# ---------------------------------------------------------------------------
+# Photo degradations
+# ---------------------------------------------------------------------------
+def degrade(page, rng, strength=0.5):
+    """
+    Turn a clean page into a phone-photo-like BGR image. `strength` in [0, 1]
+    scales every effect. Returns (image, params) where params records what
+    was applied, plus "homography" (page pixel -> image pixel).
+    """
+    ph, pw = page.shape[:2]
+
+    # Resolution: long side of the sheet in the photo
+    out_w = int(rng.uniform(900, 2600))
+    scale = out_w / pw
+    border = rng.uniform(0.03, 0.03 + 0.12 * strength)
+    frame_w = int(pw * scale * (1 + 2 * border))
+    frame_h = int(ph * scale * (1 + 2 * border))
+
+    # Perspective: each page corner lands near its place, jittered
+    jitter = 0.06 * strength * out_w
+    bx, by = pw * scale * border, ph * scale * border
+    dst = np.array([[bx, by], [bx + pw * scale, by], [bx + pw * scale, by + ph * scale],
+                    [bx, by + ph * scale]], dtype=np.float32)
+    dst += rng.uniform(-jitter, jitter, size=dst.shape).astype(np.float32)
+    src = np.array([[0, 0], [pw, 0], [pw, ph], [0, ph]], dtype=np.float32)
+    H = cv2.getPerspectiveTransform(src, dst)
+
+    background = int(rng.integers(40, 150))
+    gray = cv2.warpPerspective(page, H, (frame_w, frame_h), flags=cv2.INTER_AREA,
+                               borderMode=cv2.BORDER_CONSTANT, borderValue=background)
+
+    # Lighting: smooth gradient plus a soft-edged shadow (e.g. a hand or phone).
+    # Both are smooth, so they are computed on a small grid and upscaled.
+    lw, lh = max(frame_w // 8, 2), max(frame_h // 8, 2)
+    yy, xx = np.mgrid[0:lh, 0:lw].astype(np.float32)
+    xx, yy = xx / lw, yy / lh
+    angle = rng.uniform(0, 2 * np.pi)
+    ramp = np.cos(angle) * xx + np.sin(angle) * yy
+    light = 1.0 - 0.25 * strength * rng.uniform(0, 1) * (ramp - ramp.min()) / (np.ptp(ramp) + 1e-6)
+    shadow = 0.0
+    if rng.uniform() < 0.7 * strength + 0.1:
+        shadow = rng.uniform(0.15, 0.45) * strength
+        a = rng.uniform(0, 2 * np.pi)
+        offset = rng.uniform(0.2, 0.5)
+        edge = np.cos(a) * (xx - 0.5) + np.sin(a) * (yy - 0.5) - offset + 0.5
+        soft = max(3, int(0.05 * lw) | 1)
+        mask = cv2.GaussianBlur((edge > 0.5).astype(np.float32), (soft, soft), 0)
+        light *= 1.0 - shadow * mask
+    img = gray.astype(np.float32)
+    img *= cv2.resize(light, (frame_w, frame_h), interpolation=cv2.INTER_LINEAR)
+
+    # Focus blur and sensor noise
+    sigma = rng.uniform(0, 1.8 * strength) * max(scale, 0.5)
+    if sigma > 0.3:
+        img = cv2.GaussianBlur(img, (0, 0), sigma)
+    noise = rng.uniform(0, 6 * strength)
+    if noise > 0.5:
+        img += rng.standard_normal(img.shape, dtype=np.float32) * noise
+    gray = np.clip(img, 0, 255).astype(np.uint8)
+
+    # Paper / light color tint
+    tint = (rng.uniform(0.85, 1.0), rng.uniform(0.92, 1.0), 1.0)
+    image = cv2.merge([cv2.convertScaleAbs(gray, alpha=t) for t in tint])
+
+    params = {
+        "width": frame_w, "height": frame_h, "perspective_jitter_px": round(jitter, 1),
+        "background": background, "shadow": round(float(shadow), 3),
+        "blur_sigma": round(float(sigma), 2), "noise_sigma": round(float(noise), 2),
+        "homography": H.tolist(),
+    }
+    return image, params
+
+
+# ---------------------------------------------------------------------------
+# Labelled sheets
+# ---------------------------------------------------------------------------
+def make_sheet(seed, index, strength=0.5, num_questions=30, mix=DEFAULT_MIX):
+    """One labelled synthetic photo: (jpeg_bytes, label)."""
+    rng = np.random.default_rng([seed, index])
+    answers = random_answers(rng, num_questions, mix)
+    name, student_id = random_name(rng), random_id(rng)
+
+    s = 2.0
+    page, double_marks = render_sheet(answers, name, student_id, rng, s=s)
+    image, params = degrade(page, rng, strength)
+
+    quality = int(rng.uniform(95 - 60 * strength, 96))
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    params["jpeg_quality"] = quality
+
+    # Ground-truth marker centers in the photo
+    H = np.array(params["homography"], dtype=np.float64)
+    markers = cv2.perspectiveTransform(marker_centers(s)[None].astype(np.float64), H)[0]
+    label = {
+        "seed": seed,
+        "index": index,
+        "num_questions": num_questions,
+        "answers": {str(q): a for q, a in answers.items()},
+        "double_marks": {str(q): m for q, m in double_marks.items()},
+        "student_name": name,
+        "student_id": student_id,
+        "markers": np.round(markers, 1).tolist(),
+        "params": params,
+    }
+    return buf.tobytes(), label
+
+
+def iter_sheets(count, seed=0, strength=0.5, num_questions=30, start=0, mix=DEFAULT_MIX):
+    """Yields (filename, jpeg_bytes, label) for sheets start .. start+count-1."""
+    for index in range(start, start + count):
+        contents, label = make_sheet(seed, index, strength, num_questions, mix)
+        yield f"ljk_{seed}_{index:06d}.jpg", contents, label
+
+
+def write_dataset(out_dir, count, seed=0, strength=0.5, num_questions=30):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "labels.jsonl"), "w") as labels:
+        for n, (filename, contents, label) in enumerate(
+                iter_sheets(count, seed, strength, num_questions), 1):
+            with open(os.path.join(out_dir, filename), "wb") as f:
+                f.write(contents)
+            labels.write(json.dumps({"file": filename, **label}) + "\n")
+            if n % 100 == 0 or n == count:
+                print(f"  {n}/{count} lembar")
+
+
+def evaluate(count, seed=0, strength=0.5, num_questions=30):
+    """Read generated sheets with the production pipeline and report accuracy."""
+    import contextlib
+    import io
+
+    from omr_core.pipeline import prepare_sheet
+
+    found = correct = total = 0
+    errors = {}
+    start = time.perf_counter()
+    for filename, contents, label in iter_sheets(count, seed, strength, num_questions):
+        with contextlib.redirect_stdout(io.StringIO()):
+            error, answers, _, _, _ = prepare_sheet(contents, num_questions, stages=("answers",))
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+            continue
+        found += 1
+        for q, expected in label["answers"].items():
+            total += 1
+            correct += answers.get(int(q)) == expected
+    elapsed = time.perf_counter() - start
+
+    print("\n=============================================")
+    print(f"  EVALUASI {count} lembar sintetis (seed={seed}, strength={strength})")
+    print("=============================================")
+    print(f"  Marker terdeteksi : {found}/{count} ({found / max(count, 1) * 100:.1f}%)")
+    for error, n in sorted(errors.items()):
+        print(f"    {error:<16}: {n}")
+    if total:
+        print(f"  Akurasi jawaban   : {correct}/{total} ({correct / total * 100:.2f}%)")
+    print(f"  Waktu             : {elapsed:.1f}s ({elapsed / max(count, 1) * 1e3:.0f} ms/lembar, "
+          f"termasuk generate)")
+    print("=============================================\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic labelled LJK generator")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strength", type=float, default=0.5,
+                        help="degradation strength, 0 (clean scan) .. 1 (bad phone photo)")
+    parser.add_argument("--num-questions", type=int, default=30)
+    parser.add_argument("--out", default="synthetic_ljk", help="output directory")
+    parser.add_argument("--evaluate", action="store_true",
+                        help="do not write files; read the sheets with the pipeline instead")
+    args = parser.parse_args()
+
+    if args.evaluate:
+        evaluate(args.count, args.seed, args.strength, args.num_questions)
+    else:
+        write_dataset(args.out, args.count, args.seed, args.strength, args.num_questions)
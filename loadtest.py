@@ -0,0 +1,473 @@
+"""
+loadtest.py — Load test lokal untuk API OMR
+===========================================
+Kirim /scan (atau /scan-batch) ke server lokal dengan concurrency dan/atau
+arrival rate tertentu, lalu laporkan throughput, latency p50/p95/p99,
+error rate, dan CPU / RSS server (dibaca dari /proc, termasuk semua proses
+anak: worker pool batch dan job worker) per interval. Hanya butuh stdlib,
+jalan penuh offline.
+
+    # Start uvicorn sendiri, 4 request paralel selama 60 detik
+    python loadtest.py --start-server --concurrency 4 --duration 60
+
+    # Server yang sudah jalan: arrival rate tetap 3 req/s (open loop)
+    python loadtest.py --url http://127.0.0.1:8000 --server-pid 1234 --rate 3 --duration 60
+
+    # /scan-batch dengan 20 lembar sintetis per request
+    python loadtest.py --start-server --endpoint scan-batch --batch-size 20 \\
+        --synthetic 200 --requests 30
+
+Gambar: --images (default semua sample image di repo) atau --synthetic N
+(generate_synthetic_ljk.py). Tiap upload diberi beberapa byte unik di
+akhir file supaya result cache server tidak membuat hasil terlalu bagus;
+pakai --allow-cache untuk mengukur jalur cache.
+
+Dengan --rate, latency dihitung dari waktu kirim yang dijadwalkan (bukan
+saat request benar-benar keluar), jadi antrean di sisi client ikut
+terhitung (tidak ada coordinated omission). Kalau server punya /metrics,
+rata-rata waktu per stage selama run juga dilaporkan.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_IMAGES = [
+    "sample.png", "IMG_3344.PNG", "IMG_3345.PNG", "IMG_3346.PNG",
+    "Kunjab.jpg", "LJK_REVISI.png",
+]
+CONTENT_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg",
+                 ".webp": "image/webp"}
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+def encode_multipart(fields, files):
+    """(body, content_type) for form `fields` {name: str} and files [(field, filename, bytes)]."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f'{value}\r\n'.encode())
+    for field, filename, contents in files:
+        ctype = CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), "application/octet-stream")
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                     f'filename="{filename}"\r\nContent-Type: {ctype}\r\n\r\n'.encode())
+        parts.append(contents)
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def post(url, body, content_type, timeout):
+    """Returns the HTTP status, or an exception class name when no response came back."""
+    request = urllib.request.Request(url, data=body, method="POST",
+                                     headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    except Exception as e:
+        return type(e).__name__
+
+
+def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def scrape_stage_seconds(base_url):
+    """{stage: (sum, count)} from /metrics, or None if unavailable."""
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as response:
+            text = response.read().decode()
+    except Exception:
+        return None
+    stages = {}
+    for m in re.finditer(r'^omr_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', text, re.M):
+        kind, stage, value = m.groups()
+        total, count = stages.get(stage, (0.0, 0))
+        if kind == "sum":
+            total = float(value)
+        else:
+            count = int(float(value))
+        stages[stage] = (total, count)
+    return stages
+
+
+# ---------------------------------------------------------------------------
+# Server CPU / RSS from /proc
+# ---------------------------------------------------------------------------
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_stat(pid):
+    """(ppid, cpu_seconds, rss_bytes) of one process, or None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    # comm may contain spaces; the fields after it are fixed
+    fields = raw[raw.rindex(")") + 2:].split()
+    ppid = int(fields[1])
+    cpu = (int(fields[11]) + int(fields[12])) / _CLK_TCK
+    rss = int(fields[21]) * _PAGE_SIZE
+    return ppid, cpu, rss
+
+
+def process_tree_usage(root_pid):
+    """(cpu_seconds, rss_bytes) summed over root_pid and all its descendants."""
+    stats = {}
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            st = _proc_stat(int(name))
+            if st is not None:
+                stats[int(name)] = st
+    children = {}
+    for pid, (ppid, _, _) in stats.items():
+        children.setdefault(ppid, []).append(pid)
+
+    cpu = rss = 0
+    todo = [root_pid]
+    while todo:
+        pid = todo.pop()
+        if pid in stats:
+            cpu += stats[pid][1]
+            rss += stats[pid][2]
+        todo.extend(children.get(pid, ()))
+    return cpu, rss
+
+
+class ServerSampler(threading.Thread):
+    """Samples CPU % (of one core) and RSS of a process tree every `interval` seconds."""
+
+    def __init__(self, pid, interval):
+        super().__init__(name="loadtest-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (t, cpu_percent, rss_mb)
+        self._done = threading.Event()
+
+    def run(self):
+        start = time.monotonic()
+        last_t, last_cpu = start, process_tree_usage(self.pid)[0]
+        while not self._done.wait(self.interval):
+            now = time.monotonic()
+            cpu, rss = process_tree_usage(self.pid)
+            percent = (cpu - last_cpu) / (now - last_t) * 100 if now > last_t else 0.0
+            self.samples.append((now - start, percent, rss / 2**20))
+            last_t, last_cpu = now, cpu
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+def load_payloads(args):
+    """[(filename, bytes)] to upload, in rotation."""
+    if args.synthetic:
+        from generate_synthetic_ljk import iter_sheets
+        print(f"  Generate {args.synthetic} lembar sintetis ...")
+        return [(name, data) for name, data, _ in
+                iter_sheets(args.synthetic, seed=args.seed, strength=args.strength)]
+    paths = []
+    for pattern in args.images or SAMPLE_IMAGES:
+        paths.extend(sorted(glob.glob(pattern)))
+    payloads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            payloads.append((os.path.basename(path), f.read()))
+    if not payloads:
+        raise SystemExit("Tidak ada gambar untuk dikirim (--images / --synthetic).")
+    return payloads
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    k = (len(sorted_values) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class LoadRun:
+    def __init__(self, args, payloads):
+        self.args = args
+        self.payloads = payloads
+        self.url = f"{args.url.rstrip('/')}/{args.endpoint}"
+        self.fields = {"stages": args.stages}
+        if args.exam_id:
+            self.fields["exam_id"] = args.exam_id
+        elif "answers" in args.stages:
+            key = {str(q): "ABCDE"[(q - 1) % 5] for q in range(1, args.num_questions + 1)}
+            self.fields["answer_key_json"] = json.dumps(key)
+        self.per_request = args.batch_size if args.endpoint == "scan-batch" else 1
+        self.results = []  # (t_done, latency_s, status)
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def _body(self):
+        with self._lock:
+            start = self._next
+            self._next += self.per_request
+        files = []
+        for k in range(start, start + self.per_request):
+            filename, contents = self.payloads[k % len(self.payloads)]
+            if not self.args.allow_cache:
+                # Trailing bytes are ignored by the decoders but change the content hash
+                contents = contents + uuid.uuid4().bytes
+            field = "files" if self.args.endpoint == "scan-batch" else "file"
+            files.append((field, filename, contents))
+        return encode_multipart(self.fields, files)
+
+    def _send(self, scheduled, t0):
+        body, content_type = self._body()
+        status = post(self.url, body, content_type, self.args.timeout)
+        done = time.monotonic()
+        with self._lock:
+            self.results.append((done - t0, done - scheduled, status))
+
+    def run(self):
+        args = self.args
+        t0 = time.monotonic()
+        deadline = t0 + args.duration if args.duration else None
+        limit = args.requests
+
+        def more(n_sent):
+            if limit is not None and n_sent >= limit:
+                return False
+            return deadline is None or time.monotonic() < deadline
+
+        if args.rate:
+            # Open loop: arrivals on a fixed schedule, executor capped at --concurrency
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                n = 0
+                while more(n):
+                    scheduled = t0 + n / args.rate
+                    delay = scheduled - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(self._send, scheduled, t0)
+                    n += 1
+        else:
+            # Closed loop: --concurrency clients, each sends again as soon as it is answered
+            sent = [0]
+
+            def client():
+                while True:
+                    with self._lock:
+                        if not more(sent[0]):
+                            return
+                        sent[0] += 1
+                    self._send(time.monotonic(), t0)
+
+            threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        return time.monotonic() - t0
+
+
+def summarize(run, elapsed, sampler, stages_before, stages_after, interval):
+    results = sorted(run.results)
+    ok = [lat for _, lat, status in results if status == 200]
+    statuses = {}
+    for _, _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    latencies = sorted(lat for _, lat, _ in results)
+    ok_sorted = sorted(ok)
+
+    report = {
+        "endpoint": run.url,
+        "duration_s": round(elapsed, 2),
+        "requests": len(results),
+        "sheets_per_request": run.per_request,
+        "statuses": statuses,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else None,
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+        "throughput_sheets_per_s": round(len(ok) * run.per_request / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(ok_sorted, 50) * 1e3, 1),
+            "p95": round(percentile(ok_sorted, 95) * 1e3, 1),
+            "p99": round(percentile(ok_sorted, 99) * 1e3, 1),
+            "max": round(ok_sorted[-1] * 1e3, 1) if ok_sorted else None,
+        },
+        "latency_all_ms": {"p50": round(percentile(latencies, 50) * 1e3, 1),
+                           "p99": round(percentile(latencies, 99) * 1e3, 1)},
+    }
+
+    # Time series: completions, latency and server usage per interval
+    series = []
+    n_buckets = int(elapsed // interval) + 1
+    for b in range(n_buckets):
+        lo, hi = b * interval, (b + 1) * interval
+        bucket = sorted(lat for t, lat, status in results if lo <= t < hi and status == 200)
+        errors = sum(1 for t, _, status in results if lo <= t < hi and status != 200)
+        row = {"t": round(hi, 1), "ok": len(bucket), "errors": errors,
+               "p95_ms": round(percentile(bucket, 95) * 1e3, 1) if bucket else None}
+        usage = [s for s in (sampler.samples if sampler else []) if lo < s[0] <= hi]
+        if usage:
+            row["cpu_percent"] = round(max(s[1] for s in usage), 1)
+            row["rss_mb"] = round(max(s[2] for s in usage), 1)
+        series.append(row)
+    report["series"] = series
+    if sampler and sampler.samples:
+        report["server"] = {
+            "cpu_percent_mean": round(sum(s[1] for s in sampler.samples) / len(sampler.samples), 1),
+            "cpu_percent_max": round(max(s[1] for s in sampler.samples), 1),
+            "rss_mb_max": round(max(s[2] for s in sampler.samples), 1),
+        }
+
+    if stages_before is not None and stages_after is not None:
+        report["stage_mean_ms"] = {}
+        for stage, (total, count) in sorted(stages_after.items()):
+            total0, count0 = stages_before.get(stage, (0.0, 0))
+            if count > count0:
+                report["stage_mean_ms"][stage] = round((total - total0) / (count - count0) * 1e3, 2)
+    return report
+
+
+def print_report(report):
+    print("\n=====================================================================")
+    print(f"  LOAD TEST {report['endpoint']}")
+    print("=====================================================================")
+    print(f"  Durasi      : {report['duration_s']}s, {report['requests']} request "
+          f"({report['sheets_per_request']} lembar/request)")
+    print(f"  Status      : {report['statuses']}  (error rate {report['error_rate']})")
+    print(f"  Throughput  : {report['throughput_rps']} req/s, "
+          f"{report['throughput_sheets_per_s']} lembar/s")
+    lat = report["latency_ms"]
+    print(f"  Latency OK  : p50 {lat['p50']}ms | p95 {lat['p95']}ms | p99 {lat['p99']}ms | "
+          f"max {lat['max']}ms")
+    if "server" in report:
+        s = report["server"]
+        print(f"  Server      : CPU rata-rata {s['cpu_percent_mean']}% (max {s['cpu_percent_max']}%), "
+              f"RSS max {s['rss_mb_max']} MB")
+    if report.get("stage_mean_ms"):
+        print("  Stage (rata-rata, dari /metrics):")
+        for stage, ms in report["stage_mean_ms"].items():
+            print(f"    {stage:<24} {ms:9.2f}ms")
+
+    print("\n  t(s) |    ok | err |   p95 ms |  CPU % | RSS MB")
+    print("  ---------------------------------------------------")
+    for row in report["series"]:
+        p95 = f"{row['p95_ms']:8.1f}" if row["p95_ms"] is not None else "       -"
+        cpu = f"{row['cpu_percent']:6.1f}" if "cpu_percent" in row else "     -"
+        rss = f"{row['rss_mb']:7.1f}" if "rss_mb" in row else "      -"
+        print(f"  {row['t']:4.0f} | {row['ok']:5d} | {row['errors']:3d} | {p95} | {cpu} | {rss}")
+    print("=====================================================================\n")
+
+
+def start_server(args):
+    """Start a local uvicorn (OCR warm-up off unless the stages need OCR)."""
+    env = dict(os.environ)
+    env.setdefault("OMR_OCR_WARMUP", "1" if ("name" in args.stages or "id" in args.stages) else "0")
+    host, port = "127.0.0.1", args.port
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(port),
+           "--log-level", "warning"]
+    print(f"  Start server: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL)
+    args.url = f"http://{host}:{port}"
+    if not wait_ready(args.url, args.startup_timeout):
+        proc.terminate()
+        raise SystemExit("Server tidak siap (cek /health).")
+    return proc
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OMR API load generator")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=("scan", "scan-batch"), default="scan")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="parallel clients (closed loop) or max in-flight requests (--rate)")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="arrival rate in requests/s (open loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds (0 = until --requests)")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests")
+    parser.add_argument("--batch-size", type=int, default=10, help="sheets per /scan-batch request")
+    parser.add_argument("--images", nargs="*", help="image files / globs (default: repo samples)")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic sheets instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strength", type=float, default=0.5)
+    parser.add_argument("--stages", default="answers", help="stages form field (e.g. answers,name,id)")
+    parser.add_argument("--num-questions", type=int, default=30)
+    parser.add_argument("--exam-id", help="use the server's key of this exam instead of a sent key")
+    parser.add_argument("--allow-cache", action="store_true",
+                        help="send identical bytes again (measures the result cache path)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--interval", type=float, default=1.0, help="report / sampling interval (s)")
+    parser.add_argument("--server-pid", type=int, help="PID of the server to sample from /proc")
+    parser.add_argument("--start-server", action="store_true", help="start uvicorn main:app locally")
+    parser.add_argument("--port", type=int, default=8765, help="port for --start-server")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="write the report here")
+    args = parser.parse_args()
+    if not args.duration and args.requests is None:
+        parser.error("--duration 0 needs --requests")
+
+    payloads = load_payloads(args)
+    server = start_server(args) if args.start_server else None
+    pid = server.pid if server else args.server_pid
+    if pid is not None and not os.path.exists(f"/proc/{pid}"):
+        print(f"  PID {pid} tidak ada di /proc: CPU/RSS server tidak diukur")
+        pid = None
+
+    try:
+        base_url = args.url.rstrip("/")
+        if not wait_ready(base_url, 5):
+            raise SystemExit(f"Server {base_url} tidak menjawab /health.")
+        sampler = ServerSampler(pid, args.interval) if pid else None
+        stages_before = scrape_stage_seconds(base_url)
+        if sampler:
+            sampler.start()
+
+        run = LoadRun(args, payloads)
+        mode = f"rate {args.rate}/s" if args.rate else "closed loop"
+        print(f"  Kirim ke {run.url}: concurrency {args.concurrency}, {mode}, "
+              f"durasi {f'{args.duration:g}s' if args.duration else '-'}, request {args.requests or '-'}")
+        elapsed = run.run()
+
+        if sampler:
+            sampler.stop()
+        stages_after = scrape_stage_seconds(base_url)
+        report = summarize(run, elapsed, sampler, stages_before, stages_after, args.interval)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"  Hasil disimpan ke {args.json}")
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
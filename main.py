@@ -8,18 +8,99 @@ os.environ["FLAGS_enable_pir_in_executor"] = "0"
 os.environ["PADDLE_PDX_DISABLE_MODEL_SOURCE_CHECK"] = "1"
 
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import (
+    FastAPI, UploadFile, File, HTTPException, Form, Header, Query, WebSocket, WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-import cv2
-import numpy as np
+from fastapi.responses import FileResponse, JSONResponse, Response
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List
+import asyncio
+import hmac
+import io
+import multiprocessing
+import threading
+import time
 import json
+import zipfile
 
-from omr_core.preprocess import preprocess_for_markers, preprocess_for_answers
-from omr_core.detect_sheet import find_paper, order_points
-from omr_core.detect_answers import detect_answers
+from omr_core.answer_keys import (
+    AnswerKeyStore, AnswerKeyFormatError, DEFAULT_EXAM_ID, validate_exam_id,
+)
+from omr_core.debug_artifacts import DebugArtifactStore
+from omr_core.jobs import JobQueue, run_worker
+from omr_core.ocr import read_names_and_ids, warm_up_ocr_engine, is_ocr_ready
 from omr_core.grading import grade_answers
+from omr_core import metrics
+from omr_core.pipeline import (
+    STAGES, SCAN_ERRORS, parse_stages, decode_image,
+    process_ljk, init_batch_worker, scan_sheet, prepare_sheet, build_scan_response,
+    record_sheet_stats, record_scan_failure, marker_attempt_counts, rig_lookup_counts,
+    collect_batch_results, read_located_sheet,
+)
+from omr_core.quality import REJECT_REASONS
+from omr_core.profiling import PROFILE_KINDS, ProfileStore, profile_call
+from omr_core.result_cache import ResultCache, content_hash, result_cache_key
+from omr_core.score_store import ScoreStore, regrade_exam
+from omr_core.stream import StreamTracker
+
+# Load + warm up PaddleOCR at startup (disable with OMR_OCR_WARMUP=0)
+OCR_WARMUP = os.environ.get("OMR_OCR_WARMUP", "1") != "0"
+
+_warmup_error = None
+
 
-app = FastAPI()
+def _warm_up():
+    global _warmup_error
+    try:
+        start = time.perf_counter()
+        warm_up_ocr_engine()
+        print(f"[startup] OCR engine warm in {time.perf_counter() - start:.1f}s.")
+    except Exception as e:
+        _warmup_error = str(e)
+        print(f"[startup] OCR warm-up failed: {e}")
+
+
+def start_job_workers():
+    """Start the local job worker processes (after requeueing interrupted jobs)."""
+    job_queue.init()
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    workers = []
+    for i in range(JOB_WORKERS):
+        p = ctx.Process(target=run_worker, args=(JOBS_DB_PATH, stop_event),
+                        kwargs={"scores_dir": SCORES_DIR, "scores_limits": SCORES_LIMITS},
+                        name=f"omr-job-worker-{i}", daemon=True)
+        p.start()
+        workers.append(p)
+    return stop_event, workers
+
+
+def stop_job_workers(stop_event, workers):
+    stop_event.set()
+    for p in workers:
+        # A worker mid-job finishes its sheet loop late; it is requeued on next start
+        p.join(timeout=10)
+        if p.is_alive():
+            p.terminate()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background so /health answers while the model loads.
+    # It holds a pipeline worker, so it counts against the queue like a request
+    if OCR_WARMUP:
+        _submit_pipeline(_warm_up)
+    stop_event, workers = start_job_workers()
+    yield
+    stop_job_workers(stop_event, workers)
+    if _batch_pool is not None:
+        _batch_pool.shutdown(wait=False, cancel_futures=True)
+    _pipeline_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,100 +110,295 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Legacy single key file, still served as the "default" exam until replaced
 ANSWER_KEY_PATH = "answer_key.json"
+ANSWER_KEYS_DIR = os.environ.get("OMR_ANSWER_KEYS_DIR", "answer_keys")
+
+answer_keys = AnswerKeyStore(
+    ANSWER_KEYS_DIR, legacy_path=ANSWER_KEY_PATH,
+    recheck_seconds=float(os.environ.get("OMR_ANSWER_KEY_RECHECK", 2.0)))
+
+ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/jpg"}
+ALLOWED_ZIP_TYPES = {"application/zip", "application/x-zip-compressed"}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Largest accepted image, uploaded directly or inside a zip
+UPLOAD_MAX_BYTES = int(os.environ.get("OMR_UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+
+# Batch grading: one worker process per core unless overridden
+BATCH_WORKERS = int(os.environ.get("OMR_BATCH_WORKERS", 0)) or os.cpu_count() or 1
+BATCH_MAX_FILES = int(os.environ.get("OMR_BATCH_MAX_FILES", 200))
+# Total image bytes of one batch, after zip expansion
+BATCH_MAX_BYTES = int(os.environ.get("OMR_BATCH_MAX_BYTES", 512 * 1024 * 1024))
+
+_batch_pool = None
+
+# Asynchronous jobs: persistent SQLite queue + local worker processes
+JOBS_DB_PATH = os.environ.get("OMR_JOBS_DB", "jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("OMR_JOB_WORKERS", 1))
+
+job_queue = JobQueue(JOBS_DB_PATH)
+
+# Debug stage images (opt-in per request, in memory, LRU-evicted)
+debug_artifacts = DebugArtifactStore(int(os.environ.get("OMR_DEBUG_MAX_REQUESTS", 16)))
+
+# Readings of already-seen uploads (same bytes + num_questions + stages);
+# optional on-disk tier shared across processes and restarts
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("OMR_RESULT_CACHE_SIZE", 256)),
+    disk_dir=os.environ.get("OMR_RESULT_CACHE_DIR") or None,
+    disk_max_bytes=int(os.environ.get("OMR_RESULT_CACHE_MAX_MB", 256)) * 1024 * 1024)
+
+# Raw bubble scores per exam, for regrading without rescanning. Only scans
+# that name their exam (exam_id) are stored
+SCORES_DIR = os.environ.get("OMR_SCORES_DIR", "scores")
+SCORES_LIMITS = {"max_exams": int(os.environ.get("OMR_SCORES_MAX_EXAMS", 100)),
+                 "max_sheets": int(os.environ.get("OMR_SCORES_MAX_SHEETS", 5000))}
+score_store = ScoreStore(SCORES_DIR, **SCORES_LIMITS)
+
+# Opt-in profiling of single /scan requests (X-OMR-Profile header carrying
+# OMR_PROFILE_TOKEN); disabled while no token is set
+PROFILE_TOKEN = os.environ.get("OMR_PROFILE_TOKEN") or None
+profile_store = ProfileStore(os.environ.get("OMR_PROFILES_DIR", "profiles"),
+                             max_profiles=int(os.environ.get("OMR_PROFILES_MAX", 20)))
+
+# Single-sheet pipeline: runs off the event loop with bounded concurrency.
+# Requests beyond PIPELINE_CONCURRENCY wait in a queue of PIPELINE_QUEUE_SIZE;
+# past that the server answers 503 + Retry-After instead of piling up uploads.
+PIPELINE_CONCURRENCY = int(os.environ.get("OMR_PIPELINE_CONCURRENCY", 2))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("OMR_PIPELINE_QUEUE_SIZE", 8))
+PIPELINE_RETRY_AFTER = int(os.environ.get("OMR_PIPELINE_RETRY_AFTER", 5))
+
+_pipeline_executor = ThreadPoolExecutor(
+    max_workers=PIPELINE_CONCURRENCY, thread_name_prefix="omr-pipeline")
+_pipeline_lock = threading.Lock()
+_pipeline_pending = 0  # running + waiting
+_pipeline_running = 0
+
+
+def _pipeline_call(func, *args):
+    global _pipeline_running
+    with _pipeline_lock:
+        _pipeline_running += 1
+    try:
+        return func(*args)
+    finally:
+        with _pipeline_lock:
+            _pipeline_running -= 1
+
+
+def _pipeline_done(_future):
+    global _pipeline_pending
+    with _pipeline_lock:
+        _pipeline_pending -= 1
+
+
+def _submit_pipeline(func, *args, admit=False):
+    """
+    Submit to the pipeline executor, counted in _pipeline_pending until done.
+    With admit=True returns None instead when the wait queue is full.
+    """
+    global _pipeline_pending
+    with _pipeline_lock:
+        if admit and _pipeline_pending >= PIPELINE_CONCURRENCY + PIPELINE_QUEUE_SIZE:
+            return None
+        _pipeline_pending += 1
+    # Released when the work actually finishes, even if the client disconnects
+    future = _pipeline_executor.submit(_pipeline_call, func, *args)
+    future.add_done_callback(_pipeline_done)
+    return future
 
 
-def load_answer_key():
-    if not os.path.exists(ANSWER_KEY_PATH):
-        raise HTTPException(status_code=400,
-            detail="Answer key not found. Please upload key first.")
-    with open(ANSWER_KEY_PATH, "r") as f:
-        try:
-            data = json.load(f)
-            return {int(k): v for k, v in data.items()}
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500,
-                detail="Format Answer Key rusak/salah.")
+def _pipeline_busy():
+    return HTTPException(status_code=503,
+        detail="Server sedang sibuk, silakan coba lagi.",
+        headers={"Retry-After": str(PIPELINE_RETRY_AFTER)})
 
 
-async def read_image_file(file: UploadFile) -> np.ndarray:
-    """Read uploaded image file and return BGR ndarray."""
-    allowed = {"image/jpeg", "image/png", "image/webp", "image/jpg"}
-    if file.content_type and file.content_type not in allowed:
-        raise HTTPException(status_code=400,
-            detail=f"Format tidak didukung: {file.content_type}. Gunakan JPG/PNG/WebP.")
+def check_pipeline_admission():
+    """Raise 503 when the pipeline wait queue is full (for work submitted later)."""
+    with _pipeline_lock:
+        if _pipeline_pending >= PIPELINE_CONCURRENCY + PIPELINE_QUEUE_SIZE:
+            raise _pipeline_busy()
 
-    await file.seek(0)
-    contents = await file.read()
-    if len(contents) == 0:
-        raise HTTPException(status_code=400, detail="File gambar kosong.")
 
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    if image is None:
+async def run_pipeline(func, *args):
+    """
+    Run a CPU-bound pipeline call in the dedicated executor.
+    Raises 503 when the wait queue is full.
+    """
+    future = _submit_pipeline(func, *args, admit=True)
+    if future is None:
+        raise _pipeline_busy()
+    return await asyncio.wrap_future(future)
+
+
+_batch_in_flight = 0  # sheets submitted to the batch pool and not finished yet
+_stream_sessions = 0  # open /stream websockets
+
+
+def get_batch_pool():
+    global _batch_pool
+    if _batch_pool is None:
+        # spawn (not fork): PaddlePaddle and OpenCV thread pools are not fork-safe
+        _batch_pool = ProcessPoolExecutor(
+            max_workers=BATCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_batch_worker,
+        )
+    return _batch_pool
+
+
+def load_answer_key(exam_id=None):
+    """Saved key for an exam, served from the in-memory registry."""
+    try:
+        found = answer_keys.get(exam_id or DEFAULT_EXAM_ID)
+    except AnswerKeyFormatError:
+        raise HTTPException(status_code=500,
+            detail="Format Answer Key rusak/salah.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if found is None:
         raise HTTPException(status_code=400,
-            detail="Format gambar tidak valid atau file rusak.")
-    return image
+            detail="Answer key not found. Please upload key first.")
+    return found[0]
 
 
-def find_paper_with_fallback(image: np.ndarray):
+def resolve_answer_key(answer_key_json, exam_id=None):
+    """Answer key from the request form, falling back to the saved key."""
+    if answer_key_json:
+        try:
+            raw_key = json.loads(answer_key_json)
+            return {int(k): v for k, v in raw_key.items()}
+        except (json.JSONDecodeError, ValueError, KeyError, AttributeError):
+            raise HTTPException(status_code=400,
+                detail="Format kunci jawaban (JSON) tidak valid.")
+    return load_answer_key(exam_id)
 
 
-    def _try_detect(src_image):
-        """Attempt marker detection on a source image. Returns (warped_ready, warped_gray) or None."""
-        thresh = preprocess_for_markers(src_image)
-        result = find_paper(thresh)
+def resolve_exam_id(exam_id):
+    if not exam_id:
+        return DEFAULT_EXAM_ID
+    try:
+        return validate_exam_id(exam_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        if result is None:
-            return None
 
-        warped_binary, M_warp = result
+def resolve_device_id(device_id):
+    """Fixed-rig device id (only a key of the in-memory marker cache), or None."""
+    if not device_id:
+        return None
+    if len(device_id) > 64:
+        raise HTTPException(status_code=400, detail="device_id maksimal 64 karakter.")
+    return device_id
 
-        # Warp the ORIGINAL grayscale image (not binary) for bubble detection
-        src_gray = cv2.cvtColor(src_image, cv2.COLOR_BGR2GRAY)
-        warped_gray = cv2.warpPerspective(src_gray, M_warp, (1000, 1414))
 
-        # Enhance for answer detection
-        warped_ready = preprocess_for_answers(warped_gray)
+def resolve_stages(stages, default=STAGES):
+    try:
+        return parse_stages(stages, default)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        return warped_ready, warped_gray
 
-    # --- Attempt 1: direct ---
-    result = _try_detect(image)
-    if result is not None:
-        print("[pipeline] Markers found on 1st attempt.")
-        return result
+def resolve_key_and_questions(stages, answer_key_json, num_questions, exam_id=None):
+    """
+    Answer key and question count for a scan. No key is needed (or loaded)
+    when the answers stage is skipped.
+    """
+    answer_key = None
+    if "answers" in stages:
+        answer_key = resolve_answer_key(answer_key_json, exam_id)
 
-    # --- Attempt 2: add white padding (handles aggressive auto-crop scanners) ---
-    PAD = 50
-    padded = cv2.copyMakeBorder(image, PAD, PAD, PAD, PAD,
-                                cv2.BORDER_CONSTANT, value=[255, 255, 255])
-    result = _try_detect(padded)
-    if result is not None:
-        print("[pipeline] Markers found after padding (auto-crop fallback).")
-        return result
+    # Automatically set num_questions based on answer key length if not provided
+    if num_questions is None:
+        num_questions = len(answer_key) if answer_key else 30
+    return answer_key, num_questions
 
-    return None
 
+async def read_upload_bytes(file: UploadFile) -> bytes:
+    """Read uploaded image file and return its raw bytes."""
+    if file.content_type and file.content_type not in ALLOWED_IMAGE_TYPES:
+        raise HTTPException(status_code=400,
+            detail=f"Format tidak didukung: {file.content_type}. Gunakan JPG/PNG/WebP.")
+
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise _image_too_large(file.filename)
+    await file.seek(0)
+    contents = await file.read()
+    if len(contents) == 0:
+        raise HTTPException(status_code=400, detail="File gambar kosong.")
+    if len(contents) > UPLOAD_MAX_BYTES:
+        raise _image_too_large(file.filename)
+    return contents
 
-def process_ljk(image: np.ndarray, num_questions: int = 30, debug: bool = False):
 
-    result = find_paper_with_fallback(image)
+def _image_too_large(name):
+    return HTTPException(status_code=413,
+        detail=f"Gambar {name} melebihi {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
 
-    if result is None:
-        return None, None, None, None
 
-    warped_ready, warped_gray = result
+async def read_batch_uploads(files: List[UploadFile]):
+    """
+    Flatten a batch upload into [(filename, bytes), ...] in upload order.
+    Zip archives are expanded in archive order. Member sizes are checked
+    against the limits before anything is decompressed (zip bombs).
+    """
+    items = []
+    total_bytes = 0
 
-    # Detect answers on enhanced grayscale
-    answers = detect_answers(warped_ready, num_questions=num_questions, debug=debug)
+    def _add(name, size, read):
+        nonlocal total_bytes
+        if len(items) >= BATCH_MAX_FILES:
+            raise HTTPException(status_code=400,
+                detail=f"Maksimal {BATCH_MAX_FILES} lembar per batch.")
+        if size > UPLOAD_MAX_BYTES:
+            raise _image_too_large(name)
+        total_bytes += size
+        if total_bytes > BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413,
+                detail=f"Total ukuran batch melebihi {BATCH_MAX_BYTES // (1024 * 1024)} MB.")
+        items.append((name, read()))
+
+    for file in files:
+        name = file.filename or f"file_{len(items)}"
+        is_zip = (file.content_type in ALLOWED_ZIP_TYPES
+                  or name.lower().endswith(".zip"))
+        if not is_zip:
+            contents = await read_upload_bytes(file)
+            _add(name, len(contents), lambda: contents)
+            continue
+
+        if file.size is not None and file.size > BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413,
+                detail=f"Total ukuran batch melebihi {BATCH_MAX_BYTES // (1024 * 1024)} MB.")
+        await file.seek(0)
+        try:
+            with zipfile.ZipFile(io.BytesIO(await file.read())) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    # zipfile never inflates a member past its declared file_size
+                    _add(info.filename, info.file_size, lambda: zf.read(info))
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400,
+                detail=f"File zip rusak: {name}")
 
-    # Perform Name & ID OCR
-    from omr_core.ocr import extract_name_and_id
-    student_name, student_id = extract_name_and_id(warped_gray)
+    if len(items) == 0:
+        raise HTTPException(status_code=400, detail="Tidak ada gambar LJK dalam upload.")
+    return items
 
-    return answers, warped_ready, student_name, student_id
 
+async def store_scores(exam_id, sheets):
+    """Persist bubble score matrices for regrading; never fails the scan itself."""
+    sheets = [s for s in sheets if s["scores"] is not None]
+    if not sheets:
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, score_store.add_many, exam_id, sheets)
+    except OSError as e:
+        print(f"[scores] Failed to store scores for {exam_id}: {e}")
 
 
 # ENDPOINTS
@@ -132,20 +408,169 @@ async def health():
     return {"status": "ok", "version": "3.0"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 only once the OCR engine is loaded and warm."""
+    if not OCR_WARMUP or is_ocr_ready():
+        return {"status": "ready"}
+    body = {"status": "warming_up"}
+    if _warmup_error:
+        body = {"status": "error", "detail": _warmup_error}
+    return JSONResponse(status_code=503, content=body)
+
+
+@app.get("/stats")
+async def stats():
+    """
+    Counters of this API process. marker_attempts shows which step of the
+    marker-search cascade located the sheet (rig / coarse / direct / padded)
+    or that none did; rig the fixed-rig cache hit rate of scans sent with a
+    device_id. Sheets processed by background job workers are not included.
+    """
+    return {"marker_attempts": marker_attempt_counts(),
+            "rig": rig_lookup_counts(),
+            "result_cache": result_cache.stats()}
+
+
+def _job_queue_depth():
+    try:
+        return job_queue.depth()
+    except Exception:
+        return float("nan")
+
+
+# Read at scrape time only; nothing is sampled between scrapes
+metrics.Gauge("omr_pipeline_in_flight",
+              "Single-sheet pipeline calls currently running.", lambda: _pipeline_running)
+metrics.Gauge("omr_pipeline_queue_depth",
+              "Single-sheet pipeline calls waiting for a free worker.",
+              lambda: _pipeline_pending - _pipeline_running)
+metrics.Gauge("omr_batch_in_flight",
+              "Sheets submitted to the batch process pool and not finished yet.",
+              lambda: _batch_in_flight)
+metrics.Gauge("omr_stream_sessions", "Open live camera streams (/stream).",
+              lambda: _stream_sessions)
+metrics.Gauge("omr_job_queue_depth", "Background jobs waiting for a worker.", _job_queue_depth)
+metrics.Gauge("omr_result_cache_hits_total", "Result cache hits.",
+              lambda: result_cache.stats()["hits"], kind="counter")
+metrics.Gauge("omr_result_cache_misses_total", "Result cache misses.",
+              lambda: result_cache.stats()["misses"], kind="counter")
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus text exposition of this API process: stage latency
+    histograms (decode, marker search, warp, answer detection, OCR,
+    grading), marker-cascade and failure counters, queue gauges. Batch
+    sheets count here too (their pool workers send the timings back);
+    background job workers are separate processes and are not included.
+    """
+    return Response(content=metrics.render(),
+                    media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def check_profile_token(token: str):
+    if PROFILE_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Profiling tidak diaktifkan (OMR_PROFILE_TOKEN).")
+    if not hmac.compare_digest(token or "", PROFILE_TOKEN):
+        raise HTTPException(status_code=403, detail="Token profiling tidak valid.")
+
+
+@app.get("/profiles")
+async def list_profiles(x_omr_profile: str = Header(None)):
+    check_profile_token(x_omr_profile)
+    profiles = profile_store.list()
+    for meta in profiles:
+        meta["files"] = {kind: f"/profiles/{meta['profile_id']}/{kind}" for kind in PROFILE_KINDS}
+    return {"profiles": profiles}
+
+
+@app.get("/profiles/{profile_id}/{kind}")
+async def get_profile(profile_id: str, kind: str, x_omr_profile: str = Header(None)):
+    check_profile_token(x_omr_profile)
+    path = profile_store.path(profile_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile tidak ditemukan (mungkin sudah dihapus).")
+    return FileResponse(path, media_type=PROFILE_KINDS[kind],
+                        filename=os.path.basename(path))
+
+
+@app.get("/answer-keys")
+async def list_answer_keys():
+    return {"exam_ids": answer_keys.exam_ids()}
+
+
+@app.get("/answer-keys/{exam_id}")
+async def get_answer_key(exam_id: str):
+    exam_id = resolve_exam_id(exam_id)
+    try:
+        found = answer_keys.get(exam_id)
+    except AnswerKeyFormatError:
+        raise HTTPException(status_code=500, detail="Format Answer Key rusak/salah.")
+    if found is None:
+        raise HTTPException(status_code=404, detail="Answer key not found.")
+    key, version = found
+    return {"exam_id": exam_id, "version": version, "key": key}
+
+
+@app.get("/debug/{debug_id}")
+async def list_debug_artifacts(debug_id: str):
+    names = debug_artifacts.names(debug_id)
+    if names is None:
+        raise HTTPException(status_code=404, detail="Debug artifacts tidak ditemukan (mungkin sudah dihapus).")
+    return {"debug_id": debug_id,
+            "artifacts": {name: f"/debug/{debug_id}/{name}.png" for name in names}}
+
+
+@app.get("/debug/{debug_id}/{name}.png")
+async def get_debug_artifact(debug_id: str, name: str):
+    png = debug_artifacts.get_png(debug_id, name)
+    if png is None:
+        raise HTTPException(status_code=404, detail="Debug artifact tidak ditemukan.")
+    return Response(content=png, media_type="image/png")
+
+
+def _read_key_sheet(contents: bytes, stages):
+    image = decode_image(contents)
+    if image is None:
+        raise HTTPException(status_code=400,
+            detail="Format gambar tidak valid atau file rusak.")
+    key, _, name, student_id = process_ljk(image, num_questions=30, debug=False, stages=stages)
+    return key, name, student_id
+
+
 @app.post("/upload-key")
-async def upload_key(file: UploadFile = File(...)):
-    image = await read_image_file(file)
+async def upload_key(
+    file: UploadFile = File(...),
+    stages: str = Form(None),
+    exam_id: str = Form(None),
+):
+    exam_id = resolve_exam_id(exam_id)
+    # Key sheets only need the answers; OCR runs only if explicitly requested
+    stages = resolve_stages(stages, default=("answers",))
+    if "answers" not in stages:
+        raise HTTPException(status_code=400,
+            detail="Stage 'answers' wajib untuk upload kunci jawaban.")
+
+    contents = await read_upload_bytes(file)
     try:
-        key, _, _, _ = process_ljk(image, num_questions=30, debug=False)
+        key, name, student_id = await run_pipeline(_read_key_sheet, contents, stages)
         if key is None:
             raise HTTPException(status_code=400,
                 detail="Kertas LJK tidak terdeteksi. Pastikan foto jelas & background kontras.")
 
-        # Save key
-        with open(ANSWER_KEY_PATH, "w") as f:
-            json.dump(key, f, indent=4)
+        # Save key (atomic, new version; fsync off the event loop)
+        version = await asyncio.get_running_loop().run_in_executor(
+            None, answer_keys.put, exam_id, key)
 
-        return {"message": "Key saved successfully", "key": key}
+        response = {"message": "Key saved successfully", "exam_id": exam_id,
+                    "version": version, "key": key}
+        if "name" in stages:
+            response["name"] = name
+        if "id" in stages:
+            response["id"] = student_id
+        return response
 
     except HTTPException:
         raise
@@ -159,59 +584,362 @@ async def scan(
     file: UploadFile = File(...),
     answer_key_json: str = Form(None),
     num_questions: int = Form(None),
+    stages: str = Form(None),
+    exam_id: str = Form(None),
+    device_id: str = Form(None),
+    debug: bool = Form(False),
+    x_omr_profile: str = Header(None),
 ):
-    # 1. Resolve answer key
-    if answer_key_json:
-        try:
-            raw_key = json.loads(answer_key_json)
-            answer_key = {int(k): v for k, v in raw_key.items()}
-        except (json.JSONDecodeError, ValueError, KeyError):
-            raise HTTPException(status_code=400,
-                detail="Format kunci jawaban (JSON) tidak valid.")
-    else:
-        answer_key = load_answer_key()
-
-    # Automatically set num_questions based on answer key length if not provided
-    if num_questions is None:
-        num_questions = len(answer_key) if answer_key else 30
+    # 0. Profiling is opt-in and token-guarded; with profiling off the scan
+    # just runs normally
+    profile_token = x_omr_profile
+    if profile_token and PROFILE_TOKEN is None:
+        print("[profile] Ignoring profiling request: OMR_PROFILE_TOKEN is not set.")
+        profile_token = None
+    elif profile_token:
+        check_profile_token(profile_token)
+
+    # 1. Resolve stages and answer key
+    stages = resolve_stages(stages)
+    keep_scores = bool(exam_id)
+    exam_id = resolve_exam_id(exam_id)
+    device_id = resolve_device_id(device_id)
+    answer_key, num_questions = resolve_key_and_questions(
+        stages, answer_key_json, num_questions, exam_id)
 
     # 2. Read image
-    image = await read_image_file(file)
+    contents = await read_upload_bytes(file)
 
-    try:
-        # 3. Full OMR pipeline
-        student_answers, _, student_name, student_id = process_ljk(image, num_questions=num_questions, debug=False)
+    # Stage images are only collected when explicitly requested
+    artifacts = {} if debug else None
 
-        if student_answers is None:
-            raise HTTPException(status_code=400,
-                detail="Kertas LJK tidak terdeteksi. Pastikan foto jelas & 4 marker sudut terlihat.")
-
-        # 4. Grade
-        result = grade_answers(student_answers, answer_key)
-
-        # 5. Build response 
-        details_list = []
-        if "details" in result:
-            for q_num, info in result["details"].items():
-                details_list.append({
-                    "question_no": int(q_num),
-                    "student_answer": str(info["student"]) if info["student"] else "-",
-                    "correct_answer": str(info["correct"]) if info["correct"] else "?",
-                    "status": str(info["status"]),
-                })
-        details_list.sort(key=lambda x: x["question_no"])
-
-        return {
-            "score": result.get("score", 0),
-            "student_name": student_name,
-            "student_id": student_id,
-            "summary": result.get("summary", {}),
-            "student_answers": student_answers,
-            "details": details_list,
-        }
+    try:
+        # 3. Same photo seen before: reuse the reading, only re-grade.
+        # Hashing and the on-disk cache tier stay off the event loop
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, content_hash, contents)
+        cache_key = result_cache_key(digest, num_questions, stages)
+        use_cache = result_cache.enabled and not debug and not profile_token
+        cached = await loop.run_in_executor(None, result_cache.get, cache_key) if use_cache else None
+        profile_info = {}
+        if cached is not None:
+            error, student_answers, student_name, student_id, scores = cached
+            result = None
+            if error is None and "answers" in stages:
+                with metrics.timed("grade"):
+                    result = grade_answers(student_answers, answer_key)
+        elif profile_token:
+            # Same pipeline, run under the profilers in its worker thread
+            outcome, prof, stacks, seconds = await run_pipeline(
+                profile_call, scan_sheet, contents, answer_key, num_questions, stages, artifacts,
+                device_id)
+            error, student_answers, student_name, student_id, result, scores = outcome
+            try:
+                profile_id = await loop.run_in_executor(
+                    None, profile_store.save, prof, stacks,
+                    {"route": "/scan", "filename": file.filename, "seconds": round(seconds, 4),
+                     "stages": sorted(stages), "error": error})
+                print(f"[profile] Saved {profile_id} ({seconds:.3f}s).")
+                profile_info = {"profile_id": profile_id}
+            except OSError as e:
+                print(f"[profile] Could not save profile: {e}")
+        else:
+            # Decode, full OMR pipeline and grading, off the event loop
+            error, student_answers, student_name, student_id, result, scores = await run_pipeline(
+                scan_sheet, contents, answer_key, num_questions, stages, artifacts, device_id)
+            # Gate rejections are cheap to redo and depend on tunable thresholds
+            if error != "invalid_image" and error not in REJECT_REASONS and result_cache.enabled:
+                await loop.run_in_executor(None, result_cache.put, cache_key,
+                                           (error, student_answers, student_name, student_id, scores))
+
+        if error is None and keep_scores:
+            await store_scores(exam_id, [{"hash": digest, "scores": scores, "filename": file.filename,
+                                          "name": student_name, "id": student_id}])
+
+        debug_info = {}
+        if artifacts:
+            debug_id = debug_artifacts.new_id()
+            debug_artifacts.put(debug_id, artifacts)
+            debug_info = {"debug_id": debug_id, "debug_artifacts": list(artifacts)}
+        debug_info.update(profile_info)
+
+        if error is not None:
+            record_scan_failure(error)
+            detail = SCAN_ERRORS[error]
+            if error in REJECT_REASONS:
+                # Specific, machine-readable reason so the client can ask for a retake
+                raise HTTPException(status_code=422,
+                                    detail={"message": detail, "reason": error, **debug_info})
+            if debug_info:
+                detail = {"message": detail, **debug_info}
+            raise HTTPException(status_code=400, detail=detail)
+
+        # 4. Build response 
+        response = build_scan_response(result, student_answers, student_name, student_id)
+        response.update(debug_info)
+        return response
 
     except HTTPException:
         raise
     except Exception as e:
         print(f"[scan] Error: {e}")
         raise HTTPException(status_code=500, detail=f"Gagal memproses LJK: {str(e)}")
+
+
+@app.post("/scan-batch")
+async def scan_batch(
+    files: List[UploadFile] = File(...),
+    answer_key_json: str = Form(None),
+    num_questions: int = Form(None),
+    stages: str = Form(None),
+    exam_id: str = Form(None),
+    device_id: str = Form(None),
+):
+    stages = resolve_stages(stages)
+    keep_scores = bool(exam_id)
+    exam_id = resolve_exam_id(exam_id)
+    device_id = resolve_device_id(device_id)
+    answer_key, num_questions = resolve_key_and_questions(
+        stages, answer_key_json, num_questions, exam_id)
+
+    items = await read_batch_uploads(files)
+
+    # Sheets seen before reuse their cached reading; only the rest is processed
+    loop = asyncio.get_running_loop()
+    digests = await loop.run_in_executor(None, lambda: [
+        content_hash(contents) for _, contents in items])
+    cache_keys = [result_cache_key(d, num_questions, stages) for d in digests]
+    outcomes = [None] * len(items)
+    names_ids = {}
+    if result_cache.enabled:
+        cached_all = await loop.run_in_executor(None, lambda: [
+            result_cache.get(key) for key in cache_keys])
+        for i, cached in enumerate(cached_all):
+            if cached is not None:
+                error, student_answers, student_name, student_id, scores = cached
+                outcomes[i] = (error, student_answers, None, None, scores)
+                names_ids[i] = (student_name, student_id)
+    todo = [i for i, o in enumerate(outcomes) if o is None]
+    # The batch's OCR pass runs on the pipeline executor once every sheet is
+    # prepared; admit it now, so a busy queue never discards prepared sheets
+    if todo and ("name" in stages or "id" in stages):
+        check_pipeline_admission()
+
+    # Fan sheets out over the process pool; gather keeps upload order
+    global _batch_in_flight
+    pool = get_batch_pool()
+    futures = [
+        loop.run_in_executor(pool, prepare_sheet, items[i][1], num_questions, stages, device_id)
+        for i in todo
+    ]
+    _batch_in_flight += len(futures)
+    try:
+        prepared = await asyncio.gather(*futures, return_exceptions=True)
+    finally:
+        _batch_in_flight -= len(futures)
+    for i, o in zip(todo, prepared):
+        outcomes[i] = o
+        if not isinstance(o, BaseException):
+            record_sheet_stats(o[3])
+
+    # One batched OCR pass over the Name/ID crops of every newly detected sheet
+    ok_indices = [i for i in todo
+                  if not isinstance(outcomes[i], BaseException) and outcomes[i][0] is None]
+    if ok_indices and ("name" in stages or "id" in stages):
+        crop_pairs = [outcomes[i][2] for i in ok_indices]
+        texts = await asyncio.wrap_future(_submit_pipeline(
+            read_names_and_ids, crop_pairs, "name" in stages, "id" in stages))
+        names_ids.update(zip(ok_indices, texts))
+
+    if result_cache.enabled:
+        entries = []
+        for i in todo:
+            o = outcomes[i]
+            if isinstance(o, BaseException) or o[0] == "invalid_image" or o[0] in REJECT_REASONS:
+                continue
+            student_name, student_id = names_ids.get(i, (None, None))
+            entries.append((cache_keys[i], (o[0], o[1], student_name, student_id, o[4])))
+        await loop.run_in_executor(None, lambda: [result_cache.put(*e) for e in entries])
+
+    if keep_scores:
+        sheets = []
+        for i, o in enumerate(outcomes):
+            if isinstance(o, BaseException) or o[0] is not None:
+                continue
+            student_name, student_id = names_ids.get(i, (None, None))
+            sheets.append({"hash": digests[i], "scores": o[4], "filename": items[i][0],
+                           "name": student_name, "id": student_id})
+        await store_scores(exam_id, sheets)
+
+    results, failed = collect_batch_results(
+        [name for name, _ in items], outcomes, names_ids, answer_key, stages)
+    for f in failed:
+        record_scan_failure(f["reason"])
+
+    return {
+        "total": len(items),
+        "processed": len(items) - len(failed),
+        "failed": failed,
+        "results": results,
+    }
+
+
+@app.websocket("/stream")
+async def stream(
+    websocket: WebSocket,
+    answer_key_json: str = Query(None),
+    num_questions: int = Query(None),
+    stages: str = Query(None),
+    exam_id: str = Query(None),
+):
+    """
+    Live camera mode. The client sends encoded frames (JPEG, ~960-1280 px
+    long side) as binary messages, one at a time, waiting for each reply.
+    Every frame gets {"type": "frame", ...} alignment/sharpness feedback;
+    the markers are tracked between frames in small windows. The first
+    aligned, sharp and still frame of each sheet is read and graded and
+    answered with {"type": "result", ...} (same fields as /scan).
+    """
+    global _stream_sessions
+    await websocket.accept()
+    try:
+        stages = resolve_stages(stages)
+        keep_scores = bool(exam_id)
+        exam_id = resolve_exam_id(exam_id)
+        answer_key, num_questions = resolve_key_and_questions(
+            stages, answer_key_json, num_questions, exam_id)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=1008)
+        return
+
+    tracker = StreamTracker()
+    _stream_sessions += 1
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            contents = message.get("bytes")
+            if not contents:
+                await websocket.send_json({"type": "error",
+                                           "detail": "Kirim frame kamera sebagai pesan biner."})
+                continue
+
+            try:
+                feedback, frame, M_warp = await run_pipeline(tracker.process, contents)
+            except Exception as e:
+                # Pipeline saturated or the frame broke the tracker: drop this
+                # frame, the client sends the next one
+                if isinstance(e, HTTPException):
+                    detail = e.detail
+                else:
+                    print(f"[stream] Frame failed: {e}")
+                    detail = f"Gagal memproses frame: {e}"
+                await websocket.send_json({"type": "error", "detail": detail})
+                continue
+            await websocket.send_json({"type": "frame", **feedback})
+            if M_warp is None:
+                continue
+
+            try:
+                error, student_answers, student_name, student_id, result, scores = await run_pipeline(
+                    read_located_sheet, frame, M_warp, answer_key, num_questions, stages)
+            except Exception as e:
+                print(f"[stream] Capture failed: {e}")
+                tracker.rearm()
+                detail = e.detail if isinstance(e, HTTPException) else f"Gagal memproses LJK: {e}"
+                await websocket.send_json({"type": "error", "detail": detail})
+                continue
+            metrics.STREAM_CAPTURES.inc()
+
+            if keep_scores:
+                digest = await asyncio.get_running_loop().run_in_executor(
+                    None, content_hash, contents)
+                await store_scores(exam_id, [{"hash": digest, "scores": scores,
+                                              "filename": f"stream-frame-{feedback['frame']}",
+                                              "name": student_name, "id": student_id}])
+            response = build_scan_response(result, student_answers, student_name, student_id)
+            await websocket.send_json({"type": "result", "frame": feedback["frame"], **response})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _stream_sessions -= 1
+
+
+@app.post("/exams/{exam_id}/regrade")
+async def regrade(
+    exam_id: str,
+    answer_key_json: str = Form(None),
+    z_thresh: float = Form(None),
+    min_abs_diff: float = Form(None),
+    min_std_score: float = Form(None),
+    double_ratio: float = Form(None),
+    double_min_gap: float = Form(None),
+):
+    """
+    Regrade every stored sheet of an exam from its saved bubble scores: with
+    the exam's current key (or answer_key_json) and optionally other
+    decision thresholds. No image is re-processed.
+    """
+    exam_id = resolve_exam_id(exam_id)
+    answer_key = resolve_answer_key(answer_key_json, exam_id)
+    thresholds = {name: value for name, value in {
+        "z_thresh": z_thresh, "min_abs_diff": min_abs_diff, "min_std_score": min_std_score,
+        "double_ratio": double_ratio, "double_min_gap": double_min_gap,
+    }.items() if value is not None}
+
+    loop = asyncio.get_running_loop()
+    sheets = await loop.run_in_executor(
+        None, lambda: regrade_exam(score_store, exam_id, answer_key, **thresholds))
+    if not sheets:
+        raise HTTPException(status_code=404,
+            detail=f"Belum ada hasil scan tersimpan untuk exam '{exam_id}'.")
+
+    results = []
+    for sheet in sheets:
+        grade = sheet["grade"]
+        results.append({
+            "filename": sheet["filename"],
+            "student_name": sheet["student_name"],
+            "student_id": sheet["student_id"],
+            "score": grade["score"],
+            "summary": grade["summary"],
+            "student_answers": sheet["student_answers"],
+        })
+    return {"exam_id": exam_id, "total": len(results), "thresholds": thresholds,
+            "results": results}
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    files: List[UploadFile] = File(...),
+    answer_key_json: str = Form(None),
+    num_questions: int = Form(None),
+    stages: str = Form(None),
+    exam_id: str = Form(None),
+):
+    """Queue sheets for background grading; poll GET /jobs/{job_id} for results."""
+    stages = resolve_stages(stages)
+    keep_scores = bool(exam_id)
+    exam_id = resolve_exam_id(exam_id)
+    # The key is resolved now, so later key uploads don't change a queued job
+    answer_key, num_questions = resolve_key_and_questions(
+        stages, answer_key_json, num_questions, exam_id)
+
+    items = await read_batch_uploads(files)
+    loop = asyncio.get_running_loop()
+    job_id = await loop.run_in_executor(
+        None, job_queue.submit, items, answer_key, num_questions, stages,
+        exam_id if keep_scores else None)
+
+    return {"job_id": job_id, "status": "queued", "total": len(items)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    loop = asyncio.get_running_loop()
+    job = await loop.run_in_executor(None, job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job tidak ditemukan.")
+    return job
@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+DEFAULT_EXAM_ID = "default"
+
+# Exam IDs become file names, so keep them to a safe character set
+_EXAM_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+class AnswerKeyFormatError(ValueError):
+    """Stored answer key exists but cannot be parsed."""
+
+
+def validate_exam_id(exam_id: str) -> str:
+    if not exam_id or not _EXAM_ID_RE.match(exam_id) or exam_id.startswith("."):
+        raise ValueError(
+            "exam_id hanya boleh berisi huruf, angka, '_', '-', '.' (maks 64 karakter).")
+    return exam_id
+
+
+def _parse_key(raw: dict) -> dict:
+    return {int(k): v for k, v in raw.items()}
+
+
+class AnswerKeyStore:
+    """
+    Answer keys per exam ID, parsed once and served from memory.
+
+    On disk each exam is <root>/<exam_id>.json:
+        {"exam_id": ..., "version": N, "updated_at": ..., "key": {"1": "A", ...}}
+    Writes go to a temp file and are swapped in with os.replace, so readers
+    never see a half-written key; every write bumps the version.
+
+    Cached entries are re-validated with os.stat at most every
+    `recheck_seconds`, so a file changed by another process/replica is
+    picked up without re-parsing JSON on every request.
+
+    The legacy single-key file (answer_key.json, flat {"1": "A"} format) is
+    served as version 0 of the default exam until a key is uploaded for it.
+    """
+
+    def __init__(self, root: str, legacy_path: str = None, recheck_seconds: float = 2.0):
+        self.root = root
+        self.legacy_path = legacy_path
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        # exam_id -> {"key", "version", "path", "stat", "checked_at"}
+        self._cache = {}
+
+    def _path(self, exam_id: str) -> str:
+        return os.path.join(self.root, f"{exam_id}.json")
+
+    def _source(self, exam_id: str):
+        """(path, is_legacy) of the file backing an exam, or (None, False)."""
+        path = self._path(exam_id)
+        if os.path.exists(path):
+            return path, False
+        if exam_id == DEFAULT_EXAM_ID and self.legacy_path and os.path.exists(self.legacy_path):
+            return self.legacy_path, True
+        return None, False
+
+    @staticmethod
+    def _stat(path: str):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, exam_id: str):
+        path, is_legacy = self._source(exam_id)
+        if path is None:
+            return None
+
+        stat = self._stat(path)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if is_legacy:
+                key, version = _parse_key(data), 0
+            else:
+                key, version = _parse_key(data["key"]), int(data["version"])
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+            raise AnswerKeyFormatError(f"Answer key rusak: {path}")
+
+        entry = {"key": key, "version": version, "path": path,
+                 "stat": stat, "checked_at": time.monotonic()}
+        self._cache[exam_id] = entry
+        return entry
+
+    def _entry(self, exam_id: str):
+        entry = self._cache.get(exam_id)
+        if entry is None:
+            return self._load(exam_id)
+
+        now = time.monotonic()
+        if now - entry["checked_at"] < self.recheck_seconds:
+            return entry
+
+        # Invalidate when the backing file changed (or a non-legacy file appeared)
+        path, _ = self._source(exam_id)
+        try:
+            changed = path != entry["path"] or self._stat(path) != entry["stat"]
+        except (OSError, TypeError):
+            changed = True
+        if changed:
+            self._cache.pop(exam_id, None)
+            return self._load(exam_id)
+        entry["checked_at"] = now
+        return entry
+
+    def get(self, exam_id: str = DEFAULT_EXAM_ID):
+        """
+        Returns (key, version) or None if the exam has no key. The key dict is
+        shared with the cache and must not be modified by callers.
+        """
+        validate_exam_id(exam_id)
+        with self._lock:
+            entry = self._entry(exam_id)
+        if entry is None:
+            return None
+        return entry["key"], entry["version"]
+
+    def put(self, exam_id: str, key: dict) -> int:
+        """Atomically store a new version of an exam's key. Returns the new version."""
+        validate_exam_id(exam_id)
+        parsed = _parse_key(key)
+
+        with self._lock:
+            try:
+                current = self._entry(exam_id)
+            except AnswerKeyFormatError:
+                current = None
+            version = (current["version"] if current else 0) + 1
+
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(exam_id)
+            payload = {
+                "exam_id": exam_id,
+                "version": version,
+                "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "key": {str(q): a for q, a in sorted(parsed.items())},
+            }
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=f".{exam_id}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(payload, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self._cache[exam_id] = {"key": parsed, "version": version, "path": path,
+                                    "stat": self._stat(path), "checked_at": time.monotonic()}
+        return version
+
+    def exam_ids(self):
+        ids = set()
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if name.endswith(".json") and not name.startswith("."):
+                    ids.add(name[:-len(".json")])
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            ids.add(DEFAULT_EXAM_ID)
+        return sorted(ids)
@@ -0,0 +1,52 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+import cv2
+
+
+class DebugArtifactStore:
+    """
+    In-memory stage images of debug requests, keyed per request.
+
+    Images are kept as raw ndarrays and only PNG-encoded when fetched; the
+    least recently used requests are evicted beyond `max_requests`.
+    Normal (non-debug) scans never touch this store.
+    """
+
+    def __init__(self, max_requests: int = 16):
+        self.max_requests = max_requests
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # debug_id -> {name: ndarray}
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def put(self, debug_id: str, artifacts: dict):
+        with self._lock:
+            self._items[debug_id] = dict(artifacts)
+            self._items.move_to_end(debug_id)
+            while len(self._items) > self.max_requests:
+                self._items.popitem(last=False)
+
+    def names(self, debug_id: str):
+        """Artifact names of a request, or None if unknown/evicted."""
+        with self._lock:
+            artifacts = self._items.get(debug_id)
+            if artifacts is None:
+                return None
+            self._items.move_to_end(debug_id)
+            return list(artifacts)
+
+    def get_png(self, debug_id: str, name: str):
+        """PNG bytes of one artifact, or None if unknown/evicted."""
+        with self._lock:
+            artifacts = self._items.get(debug_id)
+            if artifacts is None or name not in artifacts:
+                return None
+            self._items.move_to_end(debug_id)
+            image = artifacts[name]
+
+        ok, buf = cv2.imencode(".png", image)
+        return buf.tobytes() if ok else None
@@ -1,5 +1,8 @@
 import cv2
 import numpy as np
+from functools import lru_cache
+
+from omr_core.grading import ANSWER_LABELS, EMPTY, DOUBLE
 
 
 # Option constants
@@ -11,153 +14,206 @@ ROW_Y_CENTERS = [
 ]
 
 
-def _score_bubble(cell_img):
+# Option column bounds as fractions of the column width (5 options evenly spaced)
+OPTION_BOUNDS = [
+    (0.00, 0.20),  # Option A
+    (0.20, 0.40),  # Option B
+    (0.40, 0.60),  # Option C
+    (0.60, 0.80),  # Option D
+    (0.80, 1.00),  # Option E
+]
+
+ROW_HALF_HEIGHT = 35
+CELL_INSET = 8  # Avoid cell borders
+
+# Tuned thresholds to avoid false positives
+Z_THRESH = 1.2
+MIN_ABS_DIFF = 10.0
+MIN_STD_SCORE = 5.0
+DOUBLE_RATIO = 0.85
+DOUBLE_MIN_GAP = 10.0
+
+
+@lru_cache(maxsize=32)
+def _column_cells(x_start, x_end, n_questions):
+    """
+    Cell rectangles (y0, y1, x0, x1) of a column as (n_questions, 5) arrays,
+    using the same inset geometry as the per-cell slicing. Cached per template;
+    callers must not modify the returned arrays.
+    """
+    col_w = x_end - x_start
+    xt = np.array([x_start + int(col_w * xs_r) for xs_r, _ in OPTION_BOUNDS])
+    xb = np.array([x_start + int(col_w * xe_r) for _, xe_r in OPTION_BOUNDS])
+    yc = np.array(ROW_Y_CENTERS[:max(n_questions, 0)], dtype=int)
+
+    n_rows = len(yc)
+
+    y0 = np.repeat((yc - ROW_HALF_HEIGHT + CELL_INSET)[:, None], 5, axis=1)
+    y1 = np.repeat((yc + ROW_HALF_HEIGHT - CELL_INSET)[:, None], 5, axis=1)
+    x0 = np.repeat((xt + CELL_INSET)[None, :], n_rows, axis=0)
+    x1 = np.repeat((xb - CELL_INSET)[None, :], n_rows, axis=0)
+    return y0, y1, x0, x1
 
-    if cell_img.size == 0:
-        return 0.0
 
-    mean_val = np.mean(cell_img)
+def _score_cells(integral, cells):
+    """
+    Darkness score (255 - mean) of every cell from one integral image.
+    Empty cells score 0, like an empty slice did.
+    """
+    h, w = integral.shape[0] - 1, integral.shape[1] - 1
+    y0, y1, x0, x1 = cells
+    # Clamp like ndarray slicing does
+    y0, y1 = np.clip(y0, 0, h), np.clip(y1, 0, h)
+    x0, x1 = np.clip(x0, 0, w), np.clip(x1, 0, w)
+    y1, x1 = np.maximum(y1, y0), np.maximum(x1, x0)
+
+    sums = (integral[y1, x1] - integral[y0, x1]
+            - integral[y1, x0] + integral[y0, x0]).astype(np.float64)
+    counts = (y1 - y0) * (x1 - x0)
+
+    scores = np.zeros(sums.shape, dtype=np.float64)
+    nonempty = counts > 0
     # Invert so that black (0) = 255 score, white (255) = 0 score
-    return 255.0 - mean_val
+    scores[nonempty] = 255.0 - sums[nonempty] / counts[nonempty]
+    return scores
 
 
-def _read_column(working_gray, x_start, x_end, y_start, y_end,
-                 n_questions, debug_img=None):
+def decide_codes(scores, z_thresh=Z_THRESH, min_abs_diff=MIN_ABS_DIFF,
+                 min_std_score=MIN_STD_SCORE, double_ratio=DOUBLE_RATIO,
+                 double_min_gap=DOUBLE_MIN_GAP):
     """
-    Scan n_questions rows in a column region.
-    Returns list of 'A'–'E', 'DOUBLE', or None per question.
+    Apply the z-score / DOUBLE rules to a (rows x 5) score matrix. Rows are
+    independent, so the questions of many sheets can be decided in one call.
+    Returns one grading answer code per row (see omr_core.grading).
     """
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int8)
+
+    max_score = scores.max(axis=1)
+    mean_score = scores.mean(axis=1)
+    std_score = scores.std(axis=1)
+
+    # Very uniform scores (std < min_std_score) = all empty (no filled bubble)
+    threshold = mean_score + z_thresh * std_score
+    filled = ((scores >= threshold[:, None])
+              & ((scores - mean_score[:, None]) >= min_abs_diff)
+              & (std_score >= min_std_score)[:, None])
+    n_filled = filled.sum(axis=1)
+
+    # DOUBLE bubble: second max close to max and significantly above empty baseline
+    scores_sorted = np.sort(scores, axis=1)
+    second_max = scores_sorted[:, -2]
+    mean_other = scores_sorted[:, :-2].mean(axis=1)
+    double = (second_max >= max_score * double_ratio) & ((second_max - mean_other) > double_min_gap)
+
+    # A single filled bubble is always the first maximum
+    top_idx = scores.argmax(axis=1)
+
+    return np.where(n_filled == 0, EMPTY, np.where(double, DOUBLE, top_idx + 1)).astype(np.int8)
+
+
+_LABELS = np.array(ANSWER_LABELS, dtype=object)
+
+
+def answers_from_scores(scores, **thresholds):
+    """
+    Like decide_codes (same `thresholds`), but as a list of 'A'–'E',
+    'DOUBLE', or None per row.
+    """
+    return _LABELS[decide_codes(scores, **thresholds)].tolist()
+
+
+def _draw_column(debug_img, x_start, x_end, scores, answers):
+    """Debug overlay of scanned cells, chosen options and scores."""
     col_w = x_end - x_start
-    
-    # Standard bounds for 5 options evenly spaced
-    OPTION_BOUNDS = [
-        (0.00, 0.20),  # Option A
-        (0.20, 0.40),  # Option B
-        (0.40, 0.60),  # Option C
-        (0.60, 0.80),  # Option D
-        (0.80, 1.00),  # Option E
-    ]
-
-    answers = []
-
-    for q_idx in range(n_questions):
+
+    for q_idx, answer in enumerate(answers):
         yc = ROW_Y_CENTERS[q_idx]
-        yt = yc - 35
-        yb = yc + 35
-
-        # Score each of 5 options
-        scores = []
-        for (xs_r, xe_r) in OPTION_BOUNDS:
-            xt = x_start + int(col_w * xs_r)
-            xb = x_start + int(col_w * xe_r)
-            inset = 8  # Avoid cell borders
-            cell = working_gray[yt + inset: yb - inset, xt + inset: xb - inset]
-            scores.append(_score_bubble(cell))
-
-        max_score = max(scores) if scores else 0
-        mean_score = np.mean(scores)
-        std_score = np.std(scores)
-
-        # Tuned thresholds to avoid false positives
-        Z_THRESH = 1.2
-        MIN_ABS_DIFF = 10.0
-        MIN_STD_SCORE = 5.0
-
-        if std_score < MIN_STD_SCORE:
-            # Very uniform scores = all empty (no filled bubble)
-            filled = []
-        else:
-            threshold = mean_score + Z_THRESH * std_score
-            filled = [
-                i for i, s in enumerate(scores)
-                if s >= threshold and (s - mean_score) >= MIN_ABS_DIFF
-            ]
-
-        # Initialize second_max for debug overlay
-        scores_sorted = sorted(scores)
-        second_max = scores_sorted[-2]
-
-        if len(filled) == 0:
-            answer = None
-        else:
-            top_idx = scores.index(max_score)
-            # Check for DOUBLE bubble: if second max is close to max and significantly above empty baseline
-            mean_other = np.mean(scores_sorted[:-2])
-            if second_max >= max_score * 0.85 and (second_max - mean_other) > 10.0:
-                answer = "DOUBLE"
-            elif len(filled) == 1:
-                answer = OPTIONS[filled[0]]
+        yt = yc - ROW_HALF_HEIGHT
+        yb = yc + ROW_HALF_HEIGHT
+        second_max = np.sort(scores[q_idx])[-2]
+
+        for opt_idx, (xs_r, xe_r) in enumerate(OPTION_BOUNDS):
+            gx1 = x_start + int(col_w * xs_r) + 4
+            gx2 = x_start + int(col_w * xe_r) - 4
+            gy1 = yt + 4
+            gy2 = yb - 4
+            
+            # Pick color
+            if answer == "DOUBLE" and scores[q_idx, opt_idx] >= second_max:
+                color = (0, 0, 255) # Red for double
+            elif answer == OPTIONS[opt_idx]:
+                color = (0, 255, 0) # Green for chosen
             else:
-                answer = OPTIONS[top_idx]
+                color = (255, 255, 0) # Cyan for scanned options
 
-        answers.append(answer)
+            cv2.rectangle(debug_img, (gx1, gy1), (gx2, gy2), color, 1)
 
-        # ── Debug overlay ───────────────────────────────────────
-        if debug_img is not None:
-            for opt_idx, (xs_r, xe_r) in enumerate(OPTION_BOUNDS):
-                gx1 = x_start + int(col_w * xs_r) + 4
-                gx2 = x_start + int(col_w * xe_r) - 4
-                gy1 = yt + 4
-                gy2 = yb - 4
-                
-                # Pick color
-                if answer == "DOUBLE" and scores[opt_idx] >= second_max:
-                    color = (0, 0, 255) # Red for double
-                elif answer == OPTIONS[opt_idx]:
-                    color = (0, 255, 0) # Green for chosen
-                else:
-                    color = (255, 255, 0) # Cyan for scanned options
+            # Overlay score value
+            score_str = f"{scores[q_idx, opt_idx]:.0f}"
+            cv2.putText(debug_img, score_str, (gx1 + 2, gy2 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.35, color, 1)
 
-                cv2.rectangle(debug_img, (gx1, gy1), (gx2, gy2), color, 1)
 
-                # Overlay score value
-                score_str = f"{scores[opt_idx]:.0f}"
-                cv2.putText(debug_img, score_str, (gx1 + 2, gy2 - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.35, color, 1)
+def _columns(w, num_questions):
+    """(x_start, x_end, first_row, n_questions) of each answer column."""
+    # Geometry relative to 1000x1414 canonical canvas
+    c1_xs = int(w * 0.090)  # 90
+    c1_xe = int(w * 0.350)  # 350
 
-    return answers
+    c2_xs = 594
+    c2_xe = 854
 
+    columns = [(c1_xs, c1_xe, 0, max(min(num_questions, 15), 0))]
+    if num_questions > 15:
+        columns.append((c2_xs, c2_xe, 15, min(num_questions - 15, 15)))
+    return columns
 
-def detect_answers(warped_ready, num_questions=30, debug=False):
 
+def score_bubbles(warped_ready, num_questions=30):
+    """
+    Darkness score of every bubble as a (questions x 5) float array, question 1
+    first. Feed it to answers_from_scores (possibly later, with other thresholds).
+    """
+    # One integral image serves every cell of both columns
+    integral = cv2.integral(warped_ready)
+    parts = [_score_cells(integral, _column_cells(xs, xe, n))
+             for xs, xe, _, n in _columns(warped_ready.shape[1], num_questions)]
+    return np.concatenate(parts) if parts else np.zeros((0, 5))
+
+
+def detect_answers(warped_ready, num_questions=30, debug=False, artifacts=None,
+                   return_scores=False):
+    """
+    Read answers from the enhanced warped canvas.
+    With debug=True a recap is printed. The grid overlay is only drawn when an
+    `artifacts` dict is given, and is kept there (in memory) as "grid_overlay".
+    With return_scores=True returns (answers, score matrix) instead of answers.
+    """
     h, w = warped_ready.shape[:2]
     
     if debug:
+        print(f"[detect_answers] Canvas: {w}x{h}  Questions: {num_questions}")
+
+    if artifacts is not None:
         # Create a BGR copy for colored overlay
         debug_img = cv2.cvtColor(warped_ready, cv2.COLOR_GRAY2BGR)
-        print(f"[detect_answers] Canvas: {w}x{h}  Questions: {num_questions}")
     else:
         debug_img = None
 
-    # Geometry relative to 1000x1414 canonical canvas
-    y_start = 285
-    y_end   = 1342
+    scores = score_bubbles(warped_ready, num_questions)
+    answers = answers_from_scores(scores)
+    all_answers = {i + 1: a for i, a in enumerate(answers)}
 
-    c1_xs = int(w * 0.090)  # 90
-    c1_xe = int(w * 0.350)  # 350
+    if debug_img is not None:
+        for xs, xe, first, n in _columns(w, num_questions):
+            _draw_column(debug_img, xs, xe, scores[first:first + n], answers[first:first + n])
 
-    c2_xs = 594
-    c2_xe = 854
-
-    all_answers = {}
-    
-    # Process Column 1
-    q_col1 = min(num_questions, 15)
-    col1_ans = _read_column(warped_ready, c1_xs, c1_xe, y_start, y_end, q_col1, debug_img)
-    for i, a in enumerate(col1_ans):
-        all_answers[i + 1] = a
-
-    # Process Column 2
-    if num_questions > 15:
-        q_col2 = min(num_questions - 15, 15)
-        col2_ans = _read_column(warped_ready, c2_xs, c2_xe, y_start, y_end, q_col2, debug_img)
-        for i, a in enumerate(col2_ans):
-            all_answers[15 + i + 1] = a
+    if artifacts is not None:
+        artifacts["grid_overlay"] = debug_img
 
     if debug:
-        cv2.imwrite("debug_grid_overlay.png", debug_img)
-        print("[detect_answers] Saved: debug_grid_overlay.png")
-
         # Basic text log
         print("\n=============================================")
         print("  REKAP HASIL DETEKSI")
@@ -174,4 +230,6 @@ def detect_answers(warped_ready, num_questions=30, debug=False):
                 print(f"  Q{i:<4} | {val}")
         print("=============================================\n")
 
+    if return_scores:
+        return all_answers, scores
     return all_answers
\ No newline at end of file
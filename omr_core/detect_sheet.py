@@ -29,7 +29,12 @@ def is_near_edge(x, y, w, h, img_w, img_h, margin=0.25):
     return (near_left or near_right) and (near_top or near_bottom)
 
 
-def find_paper(thresh, debug_image=None):
+def locate_markers(thresh, debug_image=None):
+    """
+    Find the 4 corner markers in a binary (marker = white) threshold map.
+    Returns [TL, TR, BR, BL] as dicts {"center": (x, y), "area", "bbox"} in
+    `thresh` coordinates, or None when no valid marker set is found.
+    """
 
     # 1. PADDING — prevent markers touching image border from being lost
     padding = 20
@@ -166,7 +171,7 @@ def find_paper(thresh, debug_image=None):
             
             for zone in ["TL", "TR", "BR", "BL"]:
                 cand = best_match["combo"][zone]
-                final_markers.append(cand["approx"])
+                final_markers.append(cand)
                 
                 if debug_image is not None:
                     cv2.drawContours(padded_debug, [cand["approx"]], -1, (0, 255, 0), 4)
@@ -196,23 +201,138 @@ def find_paper(thresh, debug_image=None):
     if debug_image is not None:
         debug_image[:] = padded_debug[padding:-padding, padding:-padding]
 
-    # 5. COMPUTE PERSPECTIVE WARP
-    centers = []
+    # 5. MARKER CENTERS (without padding offset)
+    markers = []
     for m in final_markers:
-        M = cv2.moments(m)
-        centers.append((int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])))
+        M = cv2.moments(m["approx"])
+        x, y, w, h = m["bbox"]
+        markers.append({
+            "center": (int(M["m10"] / M["m00"]) - padding, int(M["m01"] / M["m00"]) - padding),
+            "area": m["area"],
+            "bbox": (x - padding, y - padding, w, h),
+        })
+
+    return markers
+
 
-    rect_pts = np.array(centers, dtype="float32")
-    rect_pts -= padding  # Remove padding offset
+# Marker side / sqrt(area of the marker-center quad): ~0.0365 on every sample
+# photo, whatever the distance or resolution
+MARKER_SIZE = 0.0365
 
-    rect = order_points(rect_pts)
+# Height/width of the marker-center quad (the canvas)
+SHEET_ASPECT = 1414 / 1000
+
+
+def quad_shape(quad):
+    """
+    (tilt, shape error) of the TL, TR, BR, BL marker quad: the largest
+    relative length difference between opposite sides, and the relative
+    deviation of its height/width from the sheet's.
+    """
+    top, right, bottom, left = np.hypot(*(np.roll(quad, -1, axis=0) - quad).T)
+    tilt = max(1.0 - min(a, b) / max(a, b, 1e-6) for a, b in ((top, bottom), (left, right)))
+    aspect = (left + right) / max(top + bottom, 1e-6)
+    return float(tilt), float(abs(aspect / SHEET_ASPECT - 1.0))
+
+
+def marker_size_error(markers, quad):
+    """
+    Relative deviation of the mean marker side / sqrt(quad area) from
+    MARKER_SIZE; a wrong marker set (e.g. bubbles) is far off.
+    """
+    area = max(float(cv2.contourArea(quad)), 1.0)
+    size = float(np.sqrt(np.mean([m["area"] for m in markers]) / area))
+    return abs(size / MARKER_SIZE - 1.0)
+
+
+def warp_from_centers(centers):
+    """Perspective transform mapping the 4 marker centers onto the canonical canvas."""
+    rect = order_points(np.array(centers, dtype="float32"))
 
     # Output: canonical A4-ish canvas
     dst = np.array([
         [0, 0], [1000, 0], [1000, 1414], [0, 1414]
     ], dtype="float32")
 
-    M_warp = cv2.getPerspectiveTransform(rect, dst)
-    warped = cv2.warpPerspective(thresh, M_warp, (1000, 1414))
+    return cv2.getPerspectiveTransform(rect, dst)
+
+
+def _marker_near(gray, cx, cy, side, half, max_dist):
+    """
+    Center and area of the marker blob closest to (cx, cy), searched in the
+    window of +-`half` px around it and at most `max_dist` away.
+    Returns ((x, y), area) or None when the window holds no plausible blob.
+    """
+    h_img, w_img = gray.shape[:2]
+    x0, y0 = max(0, int(cx) - half), max(0, int(cy) - half)
+    x1, y1 = min(w_img, int(cx) + half + 1), min(h_img, int(cy) + half + 1)
+    window = gray[y0:y1, x0:x1]
+    if window.size == 0:
+        return None
+
+    # Marker is solid black on white paper: Otsu separates it cleanly
+    _, win_thresh = cv2.threshold(window, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(win_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    best, best_dist = None, max_dist
+    for c in contours:
+        area = cv2.contourArea(c)
+        if not (0.4 * side * side <= area <= 2.5 * side * side):
+            continue
+        M = cv2.moments(c)
+        if M["m00"] == 0:
+            continue
+        mx, my = M["m10"] / M["m00"] + x0, M["m01"] / M["m00"] + y0
+        dist = np.hypot(mx - cx, my - cy)
+        if dist < best_dist:
+            best, best_dist = ((mx, my), area), dist
+
+    return best
+
+
+def refine_markers(gray, markers, scale):
+    """
+    Refine marker centers found on a downscaled image (factor `scale`) by
+    re-locating each marker inside a small window of the full-resolution
+    grayscale image. Falls back to the scaled coarse center when a window
+    holds no plausible marker blob. Returns 4 (x, y) float centers.
+    """
+    centers = []
+
+    for m in markers:
+        cx, cy = m["center"][0] / scale, m["center"][1] / scale
+        side = np.sqrt(m["area"]) / scale
+        found = _marker_near(gray, cx, cy, side, int(side * 1.5) + 8, side)
+        centers.append(found[0] if found is not None else (cx, cy))
+
+    return centers
+
+
+def track_markers(gray, markers, reach=2.5):
+    """
+    Follow markers ({"center", "area"}, e.g. from the previous video frame)
+    into `gray`: each one is re-located in a window of `reach` marker sides
+    around its last position. Returns the updated markers, or None as soon
+    as one of them is lost.
+    """
+    tracked = []
+    for m in markers:
+        side = np.sqrt(m["area"])
+        found = _marker_near(gray, m["center"][0], m["center"][1], side,
+                             int(side * reach) + 8, side * reach)
+        if found is None:
+            return None
+        center, area = found
+        tracked.append({"center": center, "area": area})
+    return tracked
+
+
+def find_paper(thresh, debug_image=None):
+    """Perspective transform (M_warp) onto the 1000x1414 canvas, or None."""
+
+    markers = locate_markers(thresh, debug_image)
+    if markers is None:
+        return None
 
-    return (warped, M_warp)
\ No newline at end of file
+    # COMPUTE PERSPECTIVE WARP
+    return warp_from_centers([m["center"] for m in markers])
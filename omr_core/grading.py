@@ -1,46 +1,110 @@
-def grade_answers(student_answers, answer_key):
-    correct = 0
-    wrong = 0
-    empty = 0
-    double = 0
-    details = {}
-    
-    # Use the answer key's questions as the source of truth for total questions
-    total_questions = len(answer_key)
-    
-    for q_num in sorted(answer_key.keys()):
-        student_ans = student_answers.get(q_num) # Use .get() for safety
-        correct_ans = answer_key.get(q_num)
-        
-        status = ""
-        if student_ans == "DOUBLE":
-            double += 1
-            status = "DOUBLE"
-        elif student_ans is None or student_ans == '-':
-            empty += 1
-            status = "EMPTY"
-        elif student_ans == correct_ans:
-            correct += 1
-            status = "CORRECT"
+import numpy as np
+
+
+# Integer answer codes for batch grading: code = index into ANSWER_LABELS
+ANSWER_LABELS = (None, "A", "B", "C", "D", "E", "DOUBLE")
+EMPTY, DOUBLE = 0, 6
+OTHER = 7  # any other student value: never matches the key
+
+_STUDENT_CODES = {label: code for code, label in enumerate(ANSWER_LABELS)}
+_STUDENT_CODES["-"] = EMPTY
+_KEY_CODES = {label: code for code, label in enumerate(ANSWER_LABELS[1:6], start=1)}
+
+_STATUS = np.array(["CORRECT", "WRONG", "EMPTY", "DOUBLE"], dtype=object)
+
+
+def encode_answers(values):
+    """Student answers ('A'–'E', 'DOUBLE', None/'-') as an int8 code array."""
+    return np.array([_STUDENT_CODES.get(v, OTHER) for v in values], dtype=np.int8)
+
+
+class GradeBatch:
+    """
+    Grades of many sheets against one answer key, computed at once with NumPy
+    over a (sheets x key questions) code matrix. The key's questions are the
+    source of truth for the total. Per-question details are only built when
+    result(i) is asked for them.
+    """
+
+    def __init__(self, codes, answer_key: dict):
+        self.questions = sorted(answer_key.keys())
+        self.key_labels = [answer_key[q] for q in self.questions]
+        key_codes = np.array([_KEY_CODES.get(a, -1) for a in self.key_labels], dtype=np.int8)
+
+        self.total = len(self.questions)
+        codes = np.asarray(codes, dtype=np.int8)
+        self.codes = codes.reshape(len(codes), self.total)
+        self._student_values = None  # raw answers, when graded from dicts
+
+        self._double = self.codes == DOUBLE
+        self._empty = self.codes == EMPTY
+        self._correct = ~self._double & ~self._empty & (self.codes == key_codes)
+
+        self.double = self._double.sum(axis=1)
+        self.empty = self._empty.sum(axis=1)
+        self.correct = self._correct.sum(axis=1)
+        self.wrong = self.total - self.double - self.empty - self.correct
+        if self.total > 0:
+            self.scores = np.round(self.correct / self.total * 100, 2)
         else:
-            wrong += 1
-            status = "WRONG"
-        
-        details[q_num] = {'student': student_ans, 'correct': correct_ans, 'status': status}
-    
-    score = (correct / total_questions) * 100 if total_questions > 0 else 0
-
-
-    summary_data = {
-        'correct': correct, 
-        'wrong': wrong, 
-        'empty': empty, 
-        'double': double,
-        'total': total_questions
-    }
-
-    return {
-        'score': round(score, 2), 
-        'summary': summary_data,
-        'details': details
-    }
+            self.scores = np.zeros(len(self.codes))
+
+    @classmethod
+    def from_answers(cls, answer_dicts, answer_key: dict):
+        """Grade student answer dicts {q_num: answer} (missing questions = empty)."""
+        questions = sorted(answer_key.keys())
+        values = [[answers.get(q) for q in questions] for answers in answer_dicts]
+        batch = cls([encode_answers(v) for v in values], answer_key)
+        batch._student_values = values
+        return batch
+
+    @classmethod
+    def from_question_codes(cls, codes, answer_key: dict):
+        """Grade a (sheets x n) code matrix whose column j holds question j + 1."""
+        codes = np.asarray(codes, dtype=np.int8)
+        questions = sorted(answer_key.keys())
+        cols = np.array(questions, dtype=int) - 1
+        valid = (cols >= 0) & (cols < codes.shape[1])
+        aligned = np.full((len(codes), len(questions)), EMPTY, dtype=np.int8)
+        aligned[:, valid] = codes[:, cols[valid]]
+        return cls(aligned, answer_key)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def summary(self, i: int) -> dict:
+        return {
+            'correct': int(self.correct[i]),
+            'wrong': int(self.wrong[i]),
+            'empty': int(self.empty[i]),
+            'double': int(self.double[i]),
+            'total': self.total,
+        }
+
+    def details(self, i: int) -> dict:
+        """{q_num: {'student', 'correct', 'status'}} of one sheet, in question order."""
+        status_idx = np.select([self._correct[i], self._empty[i], self._double[i]], [0, 2, 3], 1)
+        statuses = _STATUS[status_idx]
+        if self._student_values is not None:
+            students = self._student_values[i]
+        else:
+            students = [ANSWER_LABELS[c] if c < OTHER else None for c in self.codes[i].tolist()]
+        return {
+            q: {'student': student, 'correct': correct, 'status': status}
+            for q, student, correct, status in zip(self.questions, students,
+                                                    self.key_labels, statuses)
+        }
+
+    def result(self, i: int, details: bool = True) -> dict:
+        """One sheet's grade in the grade_answers() format."""
+        result = {
+            'score': float(self.scores[i]) if self.total > 0 else 0,
+            'summary': self.summary(i),
+        }
+        if details:
+            result['details'] = self.details(i)
+        return result
+
+
+def grade_answers(student_answers, answer_key):
+    return GradeBatch.from_answers([student_answers], answer_key).result(0)
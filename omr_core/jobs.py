@@ -0,0 +1,339 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from omr_core.pipeline import init_batch_worker, prepare_sheet, collect_batch_results
+from omr_core.result_cache import content_hash
+from omr_core.score_store import ScoreStore
+
+
+# A job interrupted this many times (worker crash, restart, stale claim) is
+# marked failed instead of being requeued again
+JOB_MAX_ATTEMPTS = int(os.getenv("OMR_JOB_MAX_ATTEMPTS", "3"))
+
+# A running job whose worker has not checked in (progress or heartbeat) for
+# this long (seconds) is assumed lost with its worker and requeued
+JOB_STALE_AFTER = float(os.getenv("OMR_JOB_STALE_AFTER", "1800"))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,           -- queued | running | done | failed
+    created_at    REAL NOT NULL,
+    started_at    REAL,
+    heartbeat_at  REAL,                    -- last sign of life from the claiming worker
+    finished_at   REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    total         INTEGER NOT NULL,
+    done          INTEGER NOT NULL DEFAULT 0,
+    params        TEXT NOT NULL,           -- answer_key, num_questions, stages, exam_id
+    result        TEXT,
+    error         TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_images (
+    job_id    TEXT NOT NULL,
+    idx       INTEGER NOT NULL,
+    filename  TEXT NOT NULL,
+    data      BLOB NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class ClaimLost(Exception):
+    """The job was requeued or finished elsewhere after this worker claimed it."""
+
+
+class JobQueue:
+    """
+    Persistent FIFO of scan jobs in a local SQLite file. Uploaded images are
+    stored with the job until it finishes, so queued and interrupted jobs
+    survive a restart. Safe to use from several processes (one connection
+    per call, WAL journal, claims under BEGIN IMMEDIATE).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def init(self):
+        """Create tables and requeue jobs interrupted by a crash/restart."""
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+            # Queues created before heartbeats were tracked
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat_at" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+            conn.execute("BEGIN IMMEDIATE")
+            self._recover(conn, seen_before=float("inf"))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _recover(self, conn, seen_before: float):
+        """
+        Requeue running jobs whose worker was last heard from before
+        `seen_before`, or mark them failed once they have used up
+        JOB_MAX_ATTEMPTS. Runs inside the caller's transaction.
+        """
+        now = time.time()
+        failed = [r["id"] for r in conn.execute(
+            "SELECT id FROM jobs WHERE status = 'running' "
+            "AND COALESCE(heartbeat_at, started_at) < ? AND attempts >= ?",
+            (seen_before, JOB_MAX_ATTEMPTS))]
+        for job_id in failed:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                (now, f"Job terhenti {JOB_MAX_ATTEMPTS} kali, tidak dicoba lagi", job_id))
+            conn.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL, done = 0 "
+            "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?",
+            (seen_before,))
+        if failed:
+            print(f"[jobs] Failed {len(failed)} job(s) interrupted {JOB_MAX_ATTEMPTS} times.")
+        if cur.rowcount:
+            print(f"[jobs] Requeued {cur.rowcount} interrupted job(s).")
+
+    def submit(self, items, answer_key, num_questions, stages, exam_id=None) -> str:
+        """Store a job with its images [(filename, bytes), ...]. Returns the job ID."""
+        job_id = uuid.uuid4().hex
+        params = {
+            "answer_key": {str(k): v for k, v in (answer_key or {}).items()},
+            "num_questions": num_questions,
+            "stages": sorted(stages),
+            "exam_id": exam_id,
+        }
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, status, created_at, total, params) "
+                "VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, time.time(), len(items), json.dumps(params)))
+            conn.executemany(
+                "INSERT INTO job_images (job_id, idx, filename, data) VALUES (?, ?, ?, ?)",
+                [(job_id, i, name, sqlite3.Binary(data)) for i, (name, data) in enumerate(items)])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self):
+        """
+        Atomically take the oldest queued job. Returns (job_id, params, attempt)
+        or None; `attempt` identifies this claim in later progress/finish calls.
+        Running jobs without a sign of life for JOB_STALE_AFTER seconds are
+        requeued (or failed) first.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            self._recover(conn, seen_before=now - JOB_STALE_AFTER)
+            row = conn.execute(
+                "SELECT id, params, attempts FROM jobs WHERE status = 'queued' "
+                "ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?", (now, now, row["id"]))
+            conn.execute("COMMIT")
+            return row["id"], json.loads(row["params"]), row["attempts"] + 1
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def load_images(self, job_id: str):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT filename, data FROM job_images WHERE job_id = ? ORDER BY idx",
+                (job_id,)).fetchall()
+            return [(r["filename"], bytes(r["data"])) for r in rows]
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: str, attempt: int, done: int = None):
+        """
+        Record that the worker holding claim `attempt` is still alive (and,
+        if given, its progress). Raises ClaimLost if the job was requeued.
+        """
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ?, done = COALESCE(?, done) "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (time.time(), done, job_id, attempt))
+        finally:
+            conn.close()
+        if cur.rowcount == 0:
+            raise ClaimLost(job_id)
+
+    def set_progress(self, job_id: str, attempt: int, done: int):
+        self.heartbeat(job_id, attempt, done)
+
+    def finish(self, job_id: str, attempt: int, result=None, error: str = None) -> bool:
+        """
+        Mark a job done (or failed) and drop its stored images. Ignored
+        (returns False) unless claim `attempt` still holds the job.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, "
+                "done = CASE WHEN ? IS NULL THEN total ELSE done END "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                ("failed" if error else "done", time.time(),
+                 json.dumps(result) if result is not None else None, error, error,
+                 job_id, attempt))
+            if cur.rowcount:
+                conn.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+            conn.execute("COMMIT")
+            return cur.rowcount > 0
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get(self, job_id: str):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "total": row["total"],
+            "done": row["done"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+        if row["error"]:
+            job["error"] = row["error"]
+        if row["result"]:
+            job.update(json.loads(row["result"]))
+        return job
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        finally:
+            conn.close()
+
+
+def run_job(queue: JobQueue, job_id: str, attempt: int, params: dict,
+            score_store: ScoreStore = None):
+    """
+    Process every sheet of a job; the result mirrors the /scan-batch response.
+    Bubble scores of read sheets are kept in `score_store` for regrading when
+    the job names its exam.
+    Raises ClaimLost (before storing anything) if the job was requeued meanwhile.
+    """
+    from omr_core.ocr import OCR_BATCH_SIZE, read_names_and_ids
+
+    answer_key = {int(k): v for k, v in params["answer_key"].items()}
+    num_questions = params["num_questions"]
+    stages = frozenset(params["stages"])
+    items = queue.load_images(job_id)
+
+    outcomes = []
+    for i, (filename, contents) in enumerate(items):
+        try:
+            outcomes.append(prepare_sheet(contents, num_questions, stages))
+        except Exception as e:
+            outcomes.append(e)
+        queue.set_progress(job_id, attempt, i + 1)
+
+    # Batched OCR over the job's Name/ID crops, checking in between chunks
+    ok_indices = [i for i, o in enumerate(outcomes)
+                  if not isinstance(o, Exception) and o[0] is None]
+    names_ids = {}
+    if ok_indices and ("name" in stages or "id" in stages):
+        for start in range(0, len(ok_indices), OCR_BATCH_SIZE):
+            chunk = ok_indices[start:start + OCR_BATCH_SIZE]
+            texts = read_names_and_ids([outcomes[i][2] for i in chunk],
+                                       "name" in stages, "id" in stages)
+            names_ids.update(zip(chunk, texts))
+            queue.heartbeat(job_id, attempt)
+
+    results, failed = collect_batch_results(
+        [name for name, _ in items], outcomes, names_ids, answer_key, stages)
+
+    exam_id = params.get("exam_id")
+    if score_store is not None and exam_id and "answers" in stages:
+        sheets = []
+        for i in ok_indices:
+            student_name, student_id = names_ids.get(i, (None, None))
+            sheets.append({"hash": content_hash(items[i][1]), "scores": outcomes[i][4],
+                           "filename": items[i][0], "name": student_name, "id": student_id})
+        try:
+            score_store.add_many(exam_id, sheets)
+        except OSError as e:
+            print(f"[jobs] Failed to store scores of job {job_id}: {e}")
+
+    return {
+        "exam_id": exam_id,
+        "processed": len(items) - len(failed),
+        "failed": failed,
+        "results": results,
+    }
+
+
+def run_worker(db_path: str, stop_event, poll_interval: float = 0.5, scores_dir: str = None,
+               scores_limits: dict = None):
+    """Worker process main loop: claim, process, store, repeat until stopped."""
+    init_batch_worker()
+    queue = JobQueue(db_path)
+    score_store = ScoreStore(scores_dir, **(scores_limits or {})) if scores_dir else None
+    print(f"[jobs] Worker started, queue: {db_path}")
+
+    while not stop_event.is_set():
+        claimed = queue.claim()
+        if claimed is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        job_id, params, attempt = claimed
+        try:
+            result = run_job(queue, job_id, attempt, params, score_store)
+            finished = queue.finish(job_id, attempt, result=result)
+        except ClaimLost:
+            finished = False
+        except Exception as e:
+            print(f"[jobs] Job {job_id} failed: {e}")
+            finished = queue.finish(job_id, attempt, error=str(e))
+        if not finished:
+            print(f"[jobs] Job {job_id} was requeued while running, result dropped.")
@@ -0,0 +1,203 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Stage timing can be switched off entirely (counters stay on, they are free)
+TIMING_ENABLED = os.getenv("OMR_METRICS", "1") != "0"
+
+# Latency buckets (seconds) covering cheap stages (~1 ms) up to slow OCR calls
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY = []
+
+
+def _fmt(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, label: str = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _label_pairs(self, value):
+        return [(self.label, value)] if self.label else []
+
+    def samples(self):
+        """Yields (name suffix, label pairs, value)."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, pairs, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(pairs)} {_fmt(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic counter, optionally split by one label."""
+    kind = "counter"
+
+    def __init__(self, name, help, label=None):
+        super().__init__(name, help, label)
+        self._values = {}
+
+    def inc(self, label_value=None, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value=None):
+        with self._lock:
+            return self._values.get(label_value, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda kv: str(kv[0]))
+        for label_value, value in items:
+            yield "", self._label_pairs(label_value), value
+
+
+class Gauge(_Metric):
+    """
+    Value read from a callback at scrape time, so it costs nothing between
+    scrapes. `fn` returns a number, or {label_value: number} with a label.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, label=None, kind=None):
+        super().__init__(name, help, label)
+        self.fn = fn
+        if kind:
+            self.kind = kind
+
+    def samples(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            for label_value, v in sorted(value.items(), key=lambda kv: str(kv[0])):
+                yield "", self._label_pairs(label_value), v
+        else:
+            yield "", [], value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram, optionally split by one label."""
+    kind = "histogram"
+
+    def __init__(self, name, help, label=None, buckets=STAGE_BUCKETS):
+        super().__init__(name, help, label)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label_value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, label_value=None):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[idx] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(((k, list(v)) for k, v in self._series.items()), key=lambda kv: str(kv[0]))
+        for label_value, series in items:
+            pairs = self._label_pairs(label_value)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                yield "_bucket", pairs + [("le", _fmt(float(bound)))], cumulative
+            yield "_sum", pairs, series[-1]
+            yield "_count", pairs, cumulative
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(m.render() for m in _REGISTRY) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Pipeline metrics
+# ---------------------------------------------------------------------------
+STAGE_SECONDS = Histogram(
+    "omr_stage_seconds", "Latency of OMR pipeline stages.", label="stage")
+MARKER_ATTEMPTS = Counter(
+    "omr_marker_attempts_total",
+    "Marker-search cascade attempt that located the sheet (not_found = none did).",
+    label="attempt")
+SCAN_FAILURES = Counter(
+    "omr_scan_failures_total", "Sheets that could not be read, by reason.", label="reason")
+QUALITY_REJECTIONS = Counter(
+    "omr_quality_rejections_total",
+    "Uploads turned away by the image-quality gate before the pipeline, by reason.",
+    label="reason")
+RIG_LOOKUPS = Counter(
+    "omr_rig_lookups_total",
+    "Fixed-rig marker lookups: hit = the device's cached markers were verified, "
+    "miss = the full marker search ran.",
+    label="result")
+STREAM_FRAMES = Counter(
+    "omr_stream_frames_total",
+    "Live-stream frames, by how the markers were found (tracked, searched, lost).",
+    label="result")
+STREAM_CAPTURES = Counter(
+    "omr_stream_captures_total", "Sheets read from a live camera stream.")
+
+_local = threading.local()
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a block into omr_stage_seconds{stage=...}."""
+    if not TIMING_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        collected = getattr(_local, "collected", None)
+        if collected is not None:
+            collected.append((stage, elapsed))
+
+
+@contextmanager
+def collect():
+    """
+    Also gather the stage timings of this thread into a list, so a worker
+    process can return them for the parent to merge() into its metrics.
+    """
+    previous = getattr(_local, "collected", None)
+    _local.collected = collected = []
+    try:
+        yield collected
+    finally:
+        _local.collected = previous
+
+
+def merge(timings):
+    """Record [(stage, seconds), ...] collected in another process."""
+    for stage, elapsed in timings or ():
+        STAGE_SECONDS.observe(elapsed, stage)
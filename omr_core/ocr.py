@@ -1,6 +1,10 @@
 import cv2
 import numpy as np
 import os
+import threading
+import unicodedata
+
+from omr_core.metrics import timed
 
 # HARUS sebelum import paddle/paddleocr apapun
 os.environ["FLAGS_use_onednn"]              = "0"
@@ -9,11 +13,34 @@ os.environ["FLAGS_enable_pir_api"]          = "0"
 os.environ["FLAGS_enable_pir_in_executor"]  = "0"
 os.environ["PADDLE_PDX_DISABLE_MODEL_SOURCE_CHECK"] = "1"
 
+# Cell dividers of the Name/ID rows: vertical ink runs spanning at least
+# DIVIDER_HEIGHT of the crop, on a comb of period DIVIDER_PERIODS (px, the
+# cell width varies with the warp) within DIVIDER_SLACK px
+DIVIDER_HEIGHT = 0.8
+DIVIDER_PERIODS = np.arange(360, 481) / 10.0
+DIVIDER_SLACK = 2
+_DIVIDER_OFFSETS = np.arange(0, 48)
+# Row borders and cell underlines: horizontal ink runs of at least this many px
+# (longer than any handwritten stroke of a 30 px tall row)
+LINE_MIN_WIDTH = 30
+# Handwriting extent: columns with at least TEXT_MIN_INK ink px, plus
+# TEXT_MARGIN px on each side
+TEXT_MIN_INK = 2
+TEXT_MARGIN = 10
+
+# Crops per recognizer call (also the recognizer's internal batch size)
+OCR_BATCH_SIZE = int(os.environ.get("OMR_OCR_BATCH_SIZE", 16))
+
 _ocr_engine = None
+_ocr_ready = threading.Event()
+# PaddleOCR predictors are not thread-safe; the pipeline runs in a thread pool
+_ocr_lock = threading.Lock()
 
 def get_ocr_engine():
     global _ocr_engine
-    if _ocr_engine is None:
+    with _ocr_lock:
+        if _ocr_engine is not None:
+            return _ocr_engine
         # Import paddleocr locally to prevent import delay during startup
         from paddleocr import PaddleOCR 
         # Initialize PaddleOCR engine for CPU with orientation classifiers disabled
@@ -25,20 +52,96 @@ def get_ocr_engine():
             use_gpu=False,
             enable_mkldnn=False,     # eksplisit disable MKL-DNN di level PaddleOCR
             ocr_version='PP-OCRv4', # PP-OCRv4 stabil di CPU, hindari v6
+            rec_batch_num=OCR_BATCH_SIZE,
             show_log=False
         )
     return _ocr_engine
 
 
+def warm_up_ocr_engine():
+    """
+    Load the engine and run one recognition on a blank Name-row sized crop so
+    the first real request doesn't pay model loading and first-inference cost.
+    The crop is generated here (image files are not shipped in the container).
+    """
+    blank = cv2.cvtColor(remove_grid_lines(np.full((31, 556), 255, dtype=np.uint8)),
+                         cv2.COLOR_GRAY2BGR)
+    engine = get_ocr_engine()
+    # Errors propagate: a failed warm-up must not report ready
+    with _ocr_lock:
+        engine.ocr([blank, blank], det=False, rec=True, cls=False)
+    _ocr_ready.set()
+
+
+def is_ocr_ready() -> bool:
+    return _ocr_ready.is_set()
+
+
+def _divider_teeth(verticals):
+    """
+    Teeth of the cell-divider comb: the regularly spaced columns
+    (DIVIDER_PERIODS) that hit the most full-height ink runs of the
+    `verticals` mask, within DIVIDER_SLACK px. Runs off the comb are
+    handwriting strokes. None when fewer than 3 teeth hit.
+    """
+    w = verticals.shape[1]
+    present = verticals.any(axis=0)
+    # A tooth hits when a run lies within DIVIDER_SLACK px of it
+    near = np.convolve(present, np.ones(2 * DIVIDER_SLACK + 1), mode="same") > 0
+    teeth = np.rint(_DIVIDER_OFFSETS[:, None, None]
+                    + np.arange(16)[None, None, :] * DIVIDER_PERIODS[None, :, None]).astype(np.intp)
+    hits = np.where(teeth < w, near[np.minimum(teeth, w - 1)], False).sum(axis=2)
+    best = np.unravel_index(np.argmax(hits), hits.shape)
+    if hits[best] < 3:
+        return None
+    return teeth[best][teeth[best] < w]
+
+
 def remove_grid_lines(crop_img):
     """
-    Pad the crop with white space for OCR engine.
-    (Grid line removal is skipped to keep the printed lines intact).
+    Whiten the printed grid of a Name/ID row crop and pad it with white space
+    for the OCR engine. The recognizer reads the whole row at once, so a cell
+    divider left in comes out as an extra '1'/'I'. Removed: the row borders
+    and cell underlines (horizontal ink runs) and the vertical ink runs
+    spanning most of the crop height that sit on the regular divider comb;
+    handwriting strokes off the comb are kept. The empty cells left and right
+    of the handwriting are cut off.
     """
     if len(crop_img.shape) == 3:
         gray = cv2.cvtColor(crop_img, cv2.COLOR_BGR2GRAY)
     else:
         gray = crop_img.copy()
+
+    h, w = gray.shape[:2]
+    if h >= 10 and w >= 10:
+        # Printed lines can be lighter than the handwriting: anything halfway
+        # between the Otsu ink level and white counts
+        t, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        ink = np.where(gray < (t + 255) / 2, 255, 0).astype(np.uint8)
+        lines = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(
+            cv2.MORPH_RECT, (min(w // 4, LINE_MIN_WIDTH), 1)))
+        verticals = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(
+            cv2.MORPH_RECT, (1, int(h * DIVIDER_HEIGHT))))
+        teeth = _divider_teeth(verticals)
+        if teeth is not None:
+            # Whole runs (a line can be several px wide) touching a tooth
+            present = verticals.any(axis=0)
+            near = np.zeros(w, dtype=bool)
+            for x in teeth:
+                near[max(0, x - DIVIDER_SLACK):x + DIVIDER_SLACK + 1] = True
+            _, run_of = cv2.connectedComponents(present[None, :].astype(np.uint8))
+            on_comb = np.isin(run_of[0], np.unique(run_of[0][near & present]))
+            verticals[:, ~(on_comb & present)] = 0
+            lines |= verticals
+        lines = cv2.dilate(lines, np.ones((3, 3), np.uint8))
+        gray[lines > 0] = 255
+        # Drop the empty cells around the handwriting: the ghosts of their
+        # lines are what the recognizer still reads as '1'
+        _, strokes = cv2.threshold(gray, t, 255, cv2.THRESH_BINARY_INV)
+        cols = np.flatnonzero((strokes > 0).sum(axis=0) >= TEXT_MIN_INK)
+        if cols.size:
+            gray = gray[:, max(0, cols[0] - TEXT_MARGIN):cols[-1] + TEXT_MARGIN + 1]
+
     padded = cv2.copyMakeBorder(gray, 15, 15, 20, 20, cv2.BORDER_CONSTANT, value=255)
     return padded
 
@@ -83,6 +186,17 @@ def map_lookalike_digits(text: str) -> str:
     return "".join(mapping.get(char, char) for char in text)
 
 
+# Comb search over the Name/ID cell grid: x_start in [215:230), cell width in
+# [41.5:43.5] (0.1 px steps) and 14 vertical dividers per candidate.
+# Index matrix (x_start, width, divider) -> column, rounded like round().
+_COMB_X_STARTS = np.arange(215, 230)
+_COMB_WIDTHS = np.arange(415, 436) / 10.0
+_COMB_IDX = np.rint(
+    _COMB_X_STARTS[:, None, None]
+    + np.arange(14)[None, None, :] * _COMB_WIDTHS[None, :, None]
+).astype(np.intp)
+
+
 def get_name_id_y_coords(warped_gray):
     """
     Locate the exact top, middle, and bottom boundaries of the Name/ID boxes
@@ -96,24 +210,33 @@ def get_name_id_y_coords(warped_gray):
     
     roi = warped_gray[y_start:y_end, x_start:x_end]
     row_means = np.mean(roi, axis=1)
-    
-    # Find local minima (where the black horizontal border lines lie)
+    n = len(row_means)
+    if n < 5:
+        return 189, 219, 249
+
+    # Find strict local minima over a +-2 row window (where the black
+    # horizontal border lines lie). Grid lines are significantly darker than paper.
+    center = row_means[2:n - 2]
+    is_min = ((center < row_means[1:n - 3]) & (center < row_means[0:n - 4])
+              & (center < row_means[3:n - 1]) & (center < row_means[4:n])
+              & (center < 220))
+    candidates = np.flatnonzero(is_min) + 2 + y_start
+
+    # Merge minima closer than 10 rows, keeping the first (only a handful of candidates)
     minima = []
-    for y in range(2, len(row_means) - 2):
-        val = row_means[y]
-        if val < row_means[y-1] and val < row_means[y-2] and val < row_means[y+1] and val < row_means[y+2]:
-            if val < 220:  # Grid lines are significantly darker than paper background
-                actual_y = y + y_start
-                if not minima or actual_y - minima[-1] > 10:
-                    minima.append(actual_y)
+    for actual_y in candidates.tolist():
+        if not minima or actual_y - minima[-1] > 10:
+            minima.append(actual_y)
                     
     # We expect 3 horizontal borders (Name top, middle divider, ID bottom)
     if len(minima) >= 3:
-        # Search for a sequence of 3 peaks with reasonable spacing (each row is ~30px tall)
-        for i in range(len(minima) - 2):
-            p1, p2, p3 = minima[i], minima[i+1], minima[i+2]
-            if 20 <= (p2 - p1) <= 45 and 20 <= (p3 - p2) <= 45:
-                return p1, p2, p3
+        # First sequence of 3 peaks with reasonable spacing (each row is ~30px tall)
+        gaps = np.diff(minima)
+        ok = (gaps >= 20) & (gaps <= 45)
+        hits = np.flatnonzero(ok[:-1] & ok[1:])
+        if len(hits) > 0:
+            i = hits[0]
+            return minima[i], minima[i + 1], minima[i + 2]
                 
     # Fallback to defaults if detection fails
     return 189, 219, 249
@@ -127,24 +250,26 @@ def get_grid_x_bounds(warped_gray, y_top, y_bot):
     roi = warped_gray[y_top:y_bot, :]
     _, thresh = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
     col_sums = np.sum(thresh, axis=0)
-    
+    n = len(col_sums)
+
+    # Max over each 3-column window [idx - 1, idx + 1] (truncated at the border)
+    window_max = col_sums.copy()
+    window_max[1:] = np.maximum(window_max[1:], col_sums[:-1])
+    window_max[:-1] = np.maximum(window_max[:-1], col_sums[1:])
+
+    # Score every (x_start, width) candidate with one gather-and-reduce;
+    # dividers falling outside the image contribute nothing
+    valid = _COMB_IDX < n
+    hits = np.where(valid, window_max[np.minimum(_COMB_IDX, n - 1)], 0)
+    scores = hits.sum(axis=2)
+
     best_x_start = 220
     best_cell_width = 42.7
-    max_score = 0
-    
-    # Search grid start X in range [215:230] and cell width in [41.5:43.5]
-    for x_start in range(215, 230):
-        for w_val in range(415, 436, 1):
-            cell_width = w_val / 10.0
-            score = 0
-            for i in range(14):  # 14 vertical line dividers
-                idx = int(round(x_start + i * cell_width))
-                if idx < len(col_sums):
-                    score += np.max(col_sums[idx - 1 : idx + 2])
-            if score > max_score:
-                max_score = score
-                best_x_start = x_start
-                best_cell_width = cell_width
+    # argmax picks the first maximum, in the same order the search loops used
+    best = np.unravel_index(np.argmax(scores), scores.shape)
+    if scores[best] > 0:
+        best_x_start = int(_COMB_X_STARTS[best[0]])
+        best_cell_width = float(_COMB_WIDTHS[best[1]])
                 
     x_end_name = int(round(best_x_start + 13 * best_cell_width))
     x_end_id = int(round(best_x_start + 10 * best_cell_width))
@@ -152,42 +277,56 @@ def get_grid_x_bounds(warped_gray, y_top, y_bot):
     return best_x_start, x_end_name, x_end_id
 
 
-def _extract_text_from_result(ocr_res) -> str:
+def _extract_texts_from_rec_result(ocr_res, n_crops):
     """
-    Parse PaddleOCR 2.x output format:
-    [ [ [ [bbox], (text, confidence) ], ... ] ]
+    Parse PaddleOCR 2.x recognition-only output (det=False) for a list of crops:
+    [ [ (text, confidence), ... ] ]  -> one string per crop.
     """
-    if not ocr_res:
-        return ""
-    
-    texts = []
-    # PaddleOCR 2.x: ocr_res[0] adalah list of lines per page
-    page = ocr_res[0]
-    if not page:
-        return ""
-    
-    for line in page:
+    texts = [""] * n_crops
+    if not ocr_res or not ocr_res[0]:
+        return texts
+
+    for i, text_info in enumerate(ocr_res[0][:n_crops]):
         try:
-            # line = [ [bbox_points], (text_str, confidence_float) ]
-            text_info = line[1]
             if isinstance(text_info, (list, tuple)) and len(text_info) >= 1:
-                texts.append(str(text_info[0]))
+                texts[i] = str(text_info[0])
         except (IndexError, TypeError):
             continue
-    
-    return " ".join(texts)
 
+    return texts
+
+
+def _clean_name(raw_name: str) -> str:
+    # Fullwidth forms (e.g. 'Ａ') to ASCII
+    raw_name = unicodedata.normalize("NFKC", raw_name).strip().upper()
+    # Map lookalike numbers to letters (e.g. '1' -> 'I', '5' -> 'S')
+    mapped_name = map_lookalike_letters(raw_name)
+    # Clean: keep only letters and spaces
+    name_text = "".join([c for c in mapped_name if c.isalpha() or c.isspace()]).strip()
+    # Normalize spaces (collapse multiple spaces to single space)
+    return " ".join(name_text.split())
+
+
+def _clean_id(raw_id: str) -> str:
+    # Map lookalike characters to digits (e.g. 'i'/'I' -> '1', 'g' -> '9')
+    mapped_id = map_lookalike_digits(unicodedata.normalize("NFKC", raw_id).strip())
+    # Clean: keep only digits
+    return "".join([c for c in mapped_id if c.isdigit()])
 
-def extract_name_and_id(warped_gray):
+
+def crop_name_and_id(warped_gray, artifacts=None):
     """
-    Extract Name and ID (Nomor Induk) text from the warped grayscale sheet image.
+    Cut the Name and ID (Nomor Induk) rows out of the warped grayscale sheet.
     Determines coordinates dynamically to handle vertical and horizontal offsets.
+    Returns (name_cleaned, id_cleaned) grayscale crops ready for recognition.
+    If an `artifacts` dict is given, the cleaned crops are kept there for debugging.
     """
-    # Dynamically locate horizontal line coordinates
-    y_top, y_mid, y_bot = get_name_id_y_coords(warped_gray)
+    with timed("ocr_crop"):
+        # Dynamically locate horizontal line coordinates
+        y_top, y_mid, y_bot = get_name_id_y_coords(warped_gray)
 
-    # Dynamically locate the vertical divider lines of the cell grid
-    x_start, x_end_name, x_end_id = get_grid_x_bounds(warped_gray, y_top, y_bot)
+        # Dynamically locate the vertical divider lines of the cell grid
+        x_start, x_end_name, x_end_id = get_grid_x_bounds(warped_gray, y_top, y_bot)
 
     # Crop Name and ID ROIs using precise dynamic coordinates matching the grid lines
     name_crop = warped_gray[y_top : y_mid + 1, x_start : x_end_name + 1]
@@ -197,41 +336,66 @@ def extract_name_and_id(warped_gray):
     name_cleaned = remove_grid_lines(name_crop)
     id_cleaned = remove_grid_lines(id_crop)
 
-    # Save cleaned images to the root directory for inspection and user/frontend visibility
-    cv2.imwrite("scratch_ocr_cleaned_name.png", name_cleaned)
-    cv2.imwrite("scratch_ocr_cleaned_id.png", id_cleaned)
+    # Keep cleaned crops in memory for inspection (debug requests only)
+    if artifacts is not None:
+        artifacts["ocr_name"] = name_cleaned
+        artifacts["ocr_id"] = id_cleaned
+
+    return name_cleaned, id_cleaned
+
 
-    # Convert to BGR format (expected by PaddleOCR)
-    name_bgr = cv2.cvtColor(name_cleaned, cv2.COLOR_GRAY2BGR)
-    id_bgr = cv2.cvtColor(id_cleaned, cv2.COLOR_GRAY2BGR)
+def recognize_crops(crops):
+    """
+    Run the text recognizer on many single-line crops, OCR_BATCH_SIZE at a time.
+    The text detector is skipped: each crop is already exactly one text row.
+    Returns one raw string per crop ("" when recognition fails).
+    """
+    texts = []
+    if not crops:
+        return texts
 
-    # Perform OCR
     engine = get_ocr_engine()
-    
-    # 1. OCR Name
-    name_text = ""
-    try:
-        name_res = engine.ocr(name_bgr)
-        raw_name = _extract_text_from_result(name_res).strip().upper()
-        # Map lookalike numbers to letters (e.g. '1' -> 'I', '5' -> 'S')
-        mapped_name = map_lookalike_letters(raw_name)
-        # Clean: keep only letters and spaces
-        name_text = "".join([c for c in mapped_name if c.isalpha() or c.isspace()]).strip()
-        # Normalize spaces (collapse multiple spaces to single space)
-        name_text = " ".join(name_text.split())
-    except Exception as e:
-        print(f"[OCR] Error scanning name: {e}")
-
-    # 2. OCR ID
-    id_text = ""
-    try:
-        id_res = engine.ocr(id_bgr)
-        raw_id = _extract_text_from_result(id_res).strip()
-        # Map lookalike characters to digits (e.g. 'i'/'I' -> '1', 'g' -> '9')
-        mapped_id = map_lookalike_digits(raw_id)
-        # Clean: keep only digits
-        id_text = "".join([c for c in mapped_id if c.isdigit()])
-    except Exception as e:
-        print(f"[OCR] Error scanning ID: {e}")
-
-    return name_text, id_text
+    for start in range(0, len(crops), OCR_BATCH_SIZE):
+        chunk = crops[start : start + OCR_BATCH_SIZE]
+        # Convert to BGR format (expected by PaddleOCR)
+        chunk_bgr = [cv2.cvtColor(c, cv2.COLOR_GRAY2BGR) if c.ndim == 2 else c for c in chunk]
+        try:
+            with _ocr_lock, timed("ocr"):
+                res = engine.ocr(chunk_bgr, det=False, rec=True, cls=False)
+            texts.extend(_extract_texts_from_rec_result(res, len(chunk)))
+        except Exception as e:
+            print(f"[OCR] Error recognizing batch of {len(chunk)} crops: {e}")
+            texts.extend([""] * len(chunk))
+
+    return texts
+
+
+def read_names_and_ids(crop_pairs, read_name=True, read_id=True):
+    """
+    Batched OCR for many sheets. crop_pairs is a list of (name_crop, id_crop)
+    from crop_name_and_id; returns [(name_text, id_text), ...] in the same order.
+    Fields that are not requested are never recognized and come back as None.
+    """
+    crops = []
+    for name_crop, id_crop in crop_pairs:
+        if read_name:
+            crops.append(name_crop)
+        if read_id:
+            crops.append(id_crop)
+
+    texts = iter(recognize_crops(crops))
+    results = []
+    for _ in crop_pairs:
+        name_text = _clean_name(next(texts)) if read_name else None
+        id_text = _clean_id(next(texts)) if read_id else None
+        results.append((name_text, id_text))
+    return results
+
+
+def extract_name_and_id(warped_gray, read_name=True, read_id=True, artifacts=None):
+    """
+    Extract Name and ID (Nomor Induk) text from the warped grayscale sheet image.
+    Both crops go through the recognizer in a single call.
+    """
+    crops = crop_name_and_id(warped_gray, artifacts)
+    return read_names_and_ids([crops], read_name, read_id)[0]
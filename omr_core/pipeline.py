@@ -0,0 +1,486 @@
+import os
+
+import cv2
+import numpy as np
+
+from omr_core.preprocess import marker_blur, threshold_markers, preprocess_for_answers
+from omr_core.detect_sheet import find_paper, locate_markers, refine_markers, warp_from_centers
+from omr_core.detect_answers import detect_answers
+from omr_core.grading import grade_answers, GradeBatch
+from omr_core.quality import QUALITY_GATE_ENABLED, REJECT_REASONS, check_quality
+from omr_core.rig import RIG_MODE_ENABLED, RIG_RESULTS, rig_cache
+from omr_core import metrics
+from omr_core.metrics import timed
+
+
+# Independently selectable pipeline stages
+STAGES = ("answers", "name", "id")
+
+# Marker search runs on a copy downscaled to this long side (coarse-to-fine);
+# 0 disables it and searches the full-resolution frame directly.
+COARSE_MAX_SIDE = int(os.getenv("OMR_COARSE_MAX_SIDE", "1200"))
+
+# Marker-search attempts in the fallback cascade, in order ("rig": the
+# device's cached markers, only tried for requests with a device id)
+MARKER_ATTEMPTS = ("rig", "coarse", "direct", "padded", "not_found")
+
+# Canvas rows (y0, y1) each stage reads from the warped sheet. Answers: the
+# bubble rows plus what preprocess_for_answers looks at around them (its
+# background window, and the CLAHE tile row of 177 px holding the first
+# bubble row). Name/ID: the band get_name_id_y_coords searches, plus the last
+# crop row. Rows no stage reads are left white instead of being warped.
+STAGE_ROWS = {"answers": (177, 1414), "name": (160, 282), "id": (160, 282)}
+
+
+def record_marker_attempt(attempt: str, count: int = 1):
+    """Count which cascade attempt located the markers (this process only)."""
+    metrics.MARKER_ATTEMPTS.inc(attempt, count)
+
+
+def marker_attempt_counts() -> dict:
+    return {a: metrics.MARKER_ATTEMPTS.value(a) for a in MARKER_ATTEMPTS}
+
+
+def rig_result(attempt, device_id):
+    """Fixed-rig lookup result of a marker search (None when rig mode was not used)."""
+    if device_id is None or not RIG_MODE_ENABLED or attempt is None:
+        return None
+    return "hit" if attempt == "rig" else "miss"
+
+
+def record_rig_lookup(result):
+    """Count a fixed-rig lookup (this process only); None is ignored."""
+    if result is not None:
+        metrics.RIG_LOOKUPS.inc(result)
+
+
+def rig_lookup_counts() -> dict:
+    counts = {r: metrics.RIG_LOOKUPS.value(r) for r in RIG_RESULTS}
+    total = sum(counts.values())
+    counts["hit_rate"] = round(counts["hit"] / total, 4) if total else None
+    counts["devices"] = rig_cache.devices()
+    return counts
+
+
+def record_scan_failure(reason: str):
+    """Count a sheet that could not be read (quality-gate rejections separately too)."""
+    metrics.SCAN_FAILURES.inc(reason)
+    if reason in REJECT_REASONS:
+        metrics.QUALITY_REJECTIONS.inc(reason)
+
+
+def record_sheet_stats(stats):
+    """Count the `stats` a prepare_sheet worker returned (None when cached)."""
+    if stats is None:
+        return
+    if stats["attempt"] is not None:
+        record_marker_attempt(stats["attempt"])
+    record_rig_lookup(stats.get("rig"))
+    metrics.merge(stats["timings"])
+
+
+SCAN_ERRORS = {
+    "invalid_image": "Format gambar tidak valid atau file rusak.",
+    "markers_not_found": "Kertas LJK tidak terdeteksi. Pastikan foto jelas & 4 marker sudut terlihat.",
+    "image_overexposed": "Foto terlalu terang. Hindari flash atau cahaya langsung ke kertas.",
+    "image_underexposed": "Foto terlalu gelap. Ambil foto di tempat yang lebih terang.",
+    "image_blurry": "Foto buram. Pegang kamera dengan stabil dan pastikan fokus.",
+    "corners_not_visible": "Sudut LJK tidak terlihat. Pastikan seluruh lembar (4 marker sudut) masuk foto.",
+}
+
+
+def build_scan_response(result, student_answers, student_name, student_id):
+    details_list = []
+    if result is None:
+        # Answers stage skipped: nothing to grade
+        result = {"score": None}
+    if "details" in result:
+        for q_num, info in result["details"].items():
+            details_list.append({
+                "question_no": int(q_num),
+                "student_answer": str(info["student"]) if info["student"] else "-",
+                "correct_answer": str(info["correct"]) if info["correct"] else "?",
+                "status": str(info["status"]),
+            })
+
+    return {
+        "score": result.get("score", 0),
+        "student_name": student_name,
+        "student_id": student_id,
+        "summary": result.get("summary", {}),
+        "student_answers": student_answers,
+        "details": details_list,
+    }
+
+
+def parse_stages(value, default=STAGES):
+    """
+    Parse a comma-separated stage list ("answers,name,id") into a frozenset.
+    Empty/None means `default`. Raises ValueError on unknown stage names.
+    """
+    if value is None or not str(value).strip():
+        return frozenset(default)
+    stages = {s.strip().lower() for s in str(value).split(",") if s.strip()}
+    unknown = stages - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}. "
+                         f"Valid: {', '.join(STAGES)}")
+    return frozenset(stages)
+
+
+def decode_image(contents: bytes):
+    """
+    Decode raw upload bytes straight to a grayscale ndarray (every stage works
+    on gray, so no 3-channel copy is kept). Returns None if undecodable.
+    """
+    with timed("decode"):
+        nparr = np.frombuffer(contents, np.uint8)
+        return cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+
+
+def _to_gray(image: np.ndarray):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _sheet_rows(stages):
+    """Row band (y0, y1) covering what `stages` read, or None for the whole canvas."""
+    bands = [STAGE_ROWS[s] for s in stages or () if s in STAGE_ROWS]
+    if not bands:
+        return None
+    return min(y0 for y0, _ in bands), max(y1 for _, y1 in bands)
+
+
+def quality_rejection(image: np.ndarray):
+    """Reason the image-quality gate turns `image` away, or None."""
+    if not QUALITY_GATE_ENABLED:
+        return None
+    with timed("quality_gate"):
+        reason, measured = check_quality(_to_gray(image))
+    if reason is not None:
+        print(f"[pipeline] Quality gate: {reason} "
+              f"(sharpness={measured['sharpness']:.1f}, dark={measured['dark_level']:.0f}, "
+              f"bright={measured['bright_level']:.0f}).")
+    return reason
+
+
+def _warp_sheet(gray, M_warp, enhance, artifacts, stages=None):
+    """
+    Warp the ORIGINAL grayscale image (not binary) and optionally enhance it.
+    With `stages` that read only a narrow band (Name/ID), only those canvas
+    rows are warped (the rest is white paper); debugging (`artifacts`)
+    always gets the full sheet.
+    """
+    rows = _sheet_rows(stages) if artifacts is None else None
+    # A band covering most of the sheet (anything with answers) saves little
+    # over the full warp and needs a white canvas besides, so only narrow
+    # bands take the band path
+    if rows is not None and rows[1] - rows[0] > 1414 // 2:
+        rows = None
+    # Outside the source frame counts as white paper (same as padding it)
+    with timed("warp"):
+        if rows is None:
+            warped_gray = cv2.warpPerspective(gray, M_warp, (1000, 1414),
+                                              borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+        else:
+            y0, y1 = rows
+            shift = np.array([[1, 0, 0], [0, 1, -y0], [0, 0, 1]], dtype=M_warp.dtype)
+            warped_gray = np.full((1414, 1000), 255, dtype=np.uint8)
+            band = warped_gray[y0:y1]
+            # Warped straight into the canvas rows, no intermediate band copy
+            cv2.warpPerspective(gray, shift @ M_warp, (1000, y1 - y0), dst=band,
+                                borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+    # Enhance for answer detection
+    warped_ready = None
+    if enhance:
+        with timed("preprocess_for_answers"):
+            warped_ready = preprocess_for_answers(warped_gray)
+
+    if artifacts is not None:
+        artifacts["warped_gray"] = warped_gray
+        if warped_ready is not None:
+            artifacts["warped_ready"] = warped_ready
+
+    return warped_ready, warped_gray
+
+
+def find_paper_coarse(gray: np.ndarray, max_side: int = COARSE_MAX_SIDE, artifacts=None):
+    """
+    Coarse-to-fine marker search: locate the markers on a downscaled copy,
+    then refine each one in a small full-resolution window.
+    Returns M_warp for the full-resolution image, or None when the frame is
+    already small enough or no marker set is found on the small copy.
+    """
+    scale = max_side / max(gray.shape[:2]) if max_side > 0 else 1.0
+    if scale >= 1.0:
+        return None
+
+    with timed("preprocess_for_markers"):
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        thresh = threshold_markers(marker_blur(small))
+    if artifacts is not None:
+        artifacts["marker_thresh"] = thresh
+    with timed("find_paper"):
+        markers = locate_markers(thresh)
+        if markers is None:
+            return None
+        return warp_from_centers(refine_markers(gray, markers, scale))
+
+
+def locate_paper(gray: np.ndarray, artifacts=None, device_id=None):
+    """
+    Marker-search cascade. Each intermediate is computed at most once and
+    reused by the next attempt. Returns (M_warp, attempt) where attempt is
+    one of MARKER_ATTEMPTS; M_warp is None when every attempt failed.
+    With a `device_id` (fixed rig), the markers of that device's last sheet
+    are verified first and the full search only runs if they are not there.
+    """
+    rig = device_id if RIG_MODE_ENABLED else None
+    if rig is not None:
+        with timed("rig_verify"):
+            M_warp = rig_cache.locate(rig, gray)
+        if M_warp is not None:
+            return M_warp, "rig"
+
+    M_warp, attempt = _search_paper(gray, artifacts)
+    if rig is not None and M_warp is not None:
+        rig_cache.learn(rig, gray, M_warp)
+    return M_warp, attempt
+
+
+def _search_paper(gray, artifacts):
+    # --- Attempt 0: coarse-to-fine on a downscaled copy (large photos only) ---
+    M_warp = find_paper_coarse(gray, artifacts=artifacts)
+    if M_warp is not None:
+        return M_warp, "coarse"
+
+    # --- Attempt 1: direct, full resolution ---
+    with timed("preprocess_for_markers"):
+        blur = marker_blur(gray)
+        thresh = threshold_markers(blur)
+    if artifacts is not None:
+        artifacts["marker_thresh"] = thresh
+    with timed("find_paper"):
+        M_warp = find_paper(thresh)
+    if M_warp is not None:
+        return M_warp, "direct"
+
+    # --- Attempt 2: white padding (handles aggressive auto-crop scanners) ---
+    # Only the threshold needs redoing: pad the blurred image, not the source,
+    # then shift M_warp back so it applies to the unpadded gray image.
+    PAD = 50
+    with timed("preprocess_for_markers"):
+        padded = cv2.copyMakeBorder(blur, PAD, PAD, PAD, PAD, cv2.BORDER_CONSTANT, value=255)
+        thresh = threshold_markers(padded)
+    if artifacts is not None:
+        artifacts["marker_thresh"] = thresh
+    with timed("find_paper"):
+        M_warp = find_paper(thresh)
+    if M_warp is not None:
+        shift = np.array([[1, 0, PAD], [0, 1, PAD], [0, 0, 1]], dtype=M_warp.dtype)
+        return M_warp @ shift, "padded"
+
+    return None, "not_found"
+
+
+def find_paper_with_fallback(image: np.ndarray, enhance: bool = True, artifacts=None,
+                             stages=None, device_id=None):
+    """
+    Returns (warped_ready, warped_gray) or None. With enhance=False the
+    answer-detection preprocessing is skipped and warped_ready is None.
+    With `stages`, warped_gray only holds the rows those stages read.
+    If an `artifacts` dict is given, stage images are kept there for debugging.
+    `device_id` enables the fixed-rig marker cache (see locate_paper).
+    `image` may be grayscale or BGR.
+    """
+    gray = _to_gray(image)
+    M_warp, attempt = locate_paper(gray, artifacts=artifacts, device_id=device_id)
+    record_marker_attempt(attempt)
+    record_rig_lookup(rig_result(attempt, device_id))
+
+    if M_warp is None:
+        return None
+    print(f"[pipeline] Markers found ({attempt} attempt).")
+    return _warp_sheet(gray, M_warp, enhance, artifacts, stages)
+
+
+def process_ljk(image: np.ndarray, num_questions: int = 30, debug: bool = False,
+                stages=STAGES, artifacts=None):
+    """
+    Full OMR pipeline. Returns (answers, warped_ready, student_name, student_id),
+    or all None when the markers are not found. Stages left out of `stages`
+    are never computed: skipped answers come back as {} (warped_ready None),
+    skipped name/id as None. Pass an `artifacts` dict to collect stage images
+    in memory (nothing is ever written to disk).
+    """
+    result = find_paper_with_fallback(image, enhance="answers" in stages, artifacts=artifacts,
+                                      stages=stages)
+
+    if result is None:
+        return None, None, None, None
+
+    warped_ready, warped_gray = result
+
+    # Detect answers on enhanced grayscale
+    answers = {}
+    if "answers" in stages:
+        with timed("detect_answers"):
+            answers = detect_answers(warped_ready, num_questions=num_questions, debug=debug,
+                                     artifacts=artifacts)
+
+    # Perform Name & ID OCR
+    student_name = student_id = None
+    if "name" in stages or "id" in stages:
+        from omr_core.ocr import extract_name_and_id
+        student_name, student_id = extract_name_and_id(
+            warped_gray, read_name="name" in stages, read_id="id" in stages,
+            artifacts=artifacts)
+
+    return answers, warped_ready, student_name, student_id
+
+
+def init_batch_worker():
+    """
+    Process-pool initializer. Each worker already owns a whole core, so keep
+    OpenCV single-threaded to avoid oversubscribing the machine.
+    """
+    cv2.setNumThreads(1)
+
+
+def scan_sheet(contents: bytes, answer_key: dict, num_questions: int = 30,
+               stages=STAGES, artifacts=None, device_id=None):
+    """
+    Decode, read and grade one sheet. Only takes and returns picklable values
+    so it can run in a worker process (`artifacts` only works in-process).
+    `device_id` names the fixed rig the photo comes from, if any.
+    Returns (error, student_answers, student_name, student_id, grade_result,
+    scores); grade_result and the (questions x 5) bubble scores are None when
+    the answers stage is skipped.
+    """
+    image = decode_image(contents)
+    if image is None:
+        return "invalid_image", None, None, None, None, None
+    rejected = quality_rejection(image)
+    if rejected is not None:
+        return rejected, None, None, None, None, None
+
+    result = find_paper_with_fallback(image, enhance="answers" in stages, artifacts=artifacts,
+                                      stages=stages, device_id=device_id)
+    if result is None:
+        return "markers_not_found", None, None, None, None, None
+    return _read_warped(*result, answer_key, num_questions, stages, artifacts)
+
+
+def read_located_sheet(image: np.ndarray, M_warp, answer_key: dict, num_questions: int = 30,
+                       stages=STAGES):
+    """
+    scan_sheet for a sheet whose M_warp is already known (e.g. markers
+    tracked over a live camera stream): warp, read and grade. Same return
+    value as scan_sheet.
+    """
+    warped = _warp_sheet(_to_gray(image), M_warp, "answers" in stages, None, stages)
+    return _read_warped(*warped, answer_key, num_questions, stages, None)
+
+
+def _read_warped(warped_ready, warped_gray, answer_key, num_questions, stages, artifacts):
+    student_answers, scores, grade = {}, None, None
+    if "answers" in stages:
+        with timed("detect_answers"):
+            student_answers, scores = detect_answers(
+                warped_ready, num_questions=num_questions, artifacts=artifacts,
+                return_scores=True)
+        with timed("grade"):
+            grade = grade_answers(student_answers, answer_key)
+
+    student_name = student_id = None
+    if "name" in stages or "id" in stages:
+        from omr_core.ocr import extract_name_and_id
+        student_name, student_id = extract_name_and_id(
+            warped_gray, read_name="name" in stages, read_id="id" in stages,
+            artifacts=artifacts)
+
+    return None, student_answers, student_name, student_id, grade, scores
+
+
+def prepare_sheet(contents: bytes, num_questions: int = 30, stages=STAGES, device_id=None):
+    """
+    Batch worker: decode, detect answers and cut the Name/ID crops.
+    OCR is left to the caller so it can be batched across many sheets.
+    Returns (error, student_answers, (name_crop, id_crop) or None, stats,
+    scores); `stats` is {"attempt", "rig", "timings"} (marker-search attempt,
+    fixed-rig lookup result and stage timings) for the parent process to
+    count with record_sheet_stats, `scores` the bubble score matrix (None
+    without answers stage). The rig cache is per worker process.
+    """
+    with metrics.collect() as timings:
+        outcome = _prepare_sheet(contents, num_questions, stages, device_id)
+    error, student_answers, crops, attempt, scores = outcome
+    stats = {"attempt": attempt, "rig": rig_result(attempt, device_id), "timings": timings}
+    return error, student_answers, crops, stats, scores
+
+
+def _prepare_sheet(contents, num_questions, stages, device_id=None):
+    image = decode_image(contents)
+    if image is None:
+        return "invalid_image", None, None, None, None
+    rejected = quality_rejection(image)
+    if rejected is not None:
+        return rejected, None, None, None, None
+
+    M_warp, attempt = locate_paper(image, device_id=device_id)
+    if M_warp is None:
+        return "markers_not_found", None, None, attempt, None
+
+    warped_ready, warped_gray = _warp_sheet(image, M_warp, "answers" in stages, None, stages)
+    student_answers, scores = {}, None
+    if "answers" in stages:
+        with timed("detect_answers"):
+            student_answers, scores = detect_answers(
+                warped_ready, num_questions=num_questions, return_scores=True)
+
+    crops = None
+    if "name" in stages or "id" in stages:
+        from omr_core.ocr import crop_name_and_id
+        crops = crop_name_and_id(warped_gray)
+    return None, student_answers, crops, attempt, scores
+
+
+def collect_batch_results(filenames, outcomes, names_ids, answer_key, stages):
+    """
+    Turn prepare_sheet outcomes (or exceptions) plus OCR texts
+    {index: (name, id)} into per-sheet responses in upload order.
+    Returns (results, failed).
+    """
+    # Grade every readable sheet in one vectorized pass
+    ok = [i for i, o in enumerate(outcomes) if not isinstance(o, BaseException) and o[0] is None]
+    grades = None
+    if "answers" in stages:
+        with timed("grade"):
+            grades = GradeBatch.from_answers([outcomes[i][1] for i in ok], answer_key)
+    grade_row = {index: row for row, index in enumerate(ok)}
+
+    results = []
+    failed = []
+    for index, (filename, outcome) in enumerate(zip(filenames, outcomes)):
+        if isinstance(outcome, BaseException):
+            print(f"[batch] Error on {filename}: {outcome}")
+            reason, message = "internal_error", f"Gagal memproses LJK: {outcome}"
+        else:
+            error, student_answers = outcome[:2]
+            if error is None:
+                student_name, student_id = names_ids.get(index, (None, None))
+                result = None
+                if grades is not None:
+                    result = grades.result(grade_row[index])
+                entry = {"index": index, "filename": filename, "status": "ok"}
+                entry.update(build_scan_response(
+                    result, student_answers, student_name, student_id))
+                results.append(entry)
+                continue
+            reason, message = error, SCAN_ERRORS[error]
+
+        failed.append({"index": index, "filename": filename, "reason": reason})
+        results.append({"index": index, "filename": filename,
+                        "status": "error", "reason": reason, "detail": message})
+
+    return results, failed
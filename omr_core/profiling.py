@@ -0,0 +1,163 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+# Stack sampling period of the collapsed-stack profile (seconds)
+SAMPLE_INTERVAL = float(os.getenv("OMR_PROFILE_SAMPLE_INTERVAL", "0.002"))
+
+PROFILE_KINDS = {
+    "pstats": "application/octet-stream",  # python -m pstats / snakeviz
+    "collapsed": "text/plain",             # flamegraph.pl / speedscope
+}
+
+_PROFILE_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{3}[0-9a-f]{5}$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stack of one thread every `interval` into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="omr-profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def profile_call(func, *args, interval: float = SAMPLE_INTERVAL):
+    """
+    Run func(*args) in the calling thread under cProfile and a stack sampler.
+    Returns (result, profile, collapsed_stacks, seconds). Time spent inside
+    OpenCV/NumPy calls is attributed to the Python frame that made the call.
+    """
+    sampler = _StackSampler(threading.get_ident(), interval)
+    profile = cProfile.Profile()
+    sampler.start()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        result = func(*args)
+    finally:
+        profile.disable()
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+    return result, profile, sampler.stacks, elapsed
+
+
+def _write_atomic(path: str, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        os.close(fd)
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _text_writer(text: str):
+    def write(path):
+        with open(path, "w") as f:
+            f.write(text)
+    return write
+
+
+class ProfileStore:
+    """
+    Saved request profiles: <root>/<profile_id>.pstats, .collapsed and .json
+    (metadata). Only the newest `max_profiles` are kept.
+    """
+
+    def __init__(self, root: str, max_profiles: int = 20):
+        if max_profiles < 1:
+            raise ValueError(f"max_profiles must be at least 1, got {max_profiles}")
+        self.root = root
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_id() -> str:
+        # Time (to the millisecond) first, so ids sort oldest-to-newest
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        return f"{stamp}-{int(now * 1000) % 1000:03d}{uuid.uuid4().hex[:5]}"
+
+    def _path(self, profile_id: str, kind: str) -> str:
+        return os.path.join(self.root, f"{profile_id}.{kind}")
+
+    def save(self, profile, collapsed, meta: dict) -> str:
+        """Write one profile; returns its id."""
+        profile_id = self.new_id()
+        meta = {"profile_id": profile_id,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "samples": sum(collapsed.values()), **meta}
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            _write_atomic(self._path(profile_id, "pstats"), profile.dump_stats)
+
+            lines = "".join(f"{stack} {count}\n" for stack, count in collapsed.most_common())
+            _write_atomic(self._path(profile_id, "collapsed"), _text_writer(lines))
+            # Metadata last: a profile is only listed once all its files exist
+            _write_atomic(self._path(profile_id, "json"), _text_writer(json.dumps(meta)))
+            self._prune()
+        return profile_id
+
+    def _prune(self):
+        ids = self._ids()
+        for profile_id in ids[:max(len(ids) - self.max_profiles, 0)]:
+            for kind in ("json", *PROFILE_KINDS):
+                try:
+                    os.remove(self._path(profile_id, kind))
+                except OSError:
+                    pass
+
+    def _ids(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.root)
+                      if name.endswith(".json") and _PROFILE_ID_RE.match(name[:-len(".json")]))
+
+    def list(self):
+        """Metadata of the saved profiles, newest first."""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(self._path(profile_id, "json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def path(self, profile_id: str, kind: str):
+        """File of one profile, or None if unknown/pruned."""
+        if kind not in PROFILE_KINDS or not _PROFILE_ID_RE.match(profile_id):
+            return None
+        path = self._path(profile_id, kind)
+        return path if os.path.exists(path) else None
@@ -0,0 +1,101 @@
+import os
+
+import cv2
+import numpy as np
+
+
+# Cheap pre-check run on a thumbnail before the marker search, so photos that
+# cannot be read are turned away in milliseconds instead of after the whole
+# cascade. Deliberately lenient: anything it lets through still meets the
+# marker search, which stays the final word.
+QUALITY_GATE_ENABLED = os.getenv("OMR_QUALITY_GATE", "1") != "0"
+
+# Long side of the thumbnail every check runs on
+THUMB_SIDE = int(os.getenv("OMR_QUALITY_THUMB_SIDE", "512"))
+
+# Variance of the Laplacian of the thumbnail. Sharp sheets score in the
+# thousands; bubble readings start to drift once it falls to ~10.
+MIN_SHARPNESS = float(os.getenv("OMR_QUALITY_MIN_SHARPNESS", "12"))
+
+# Overexposed: even the darkest 1% of pixels (markers, ink) is this bright
+OVEREXPOSED_LEVEL = float(os.getenv("OMR_QUALITY_OVEREXPOSED_LEVEL", "200"))
+# Underexposed: even the brightest 1% of pixels (the paper) is this dark
+UNDEREXPOSED_LEVEL = float(os.getenv("OMR_QUALITY_UNDEREXPOSED_LEVEL", "60"))
+
+# Every quadrant must hold a solid dark blob (its corner marker) at most this
+# fraction of the paper brightness, once thin lines and text are blurred out
+CORNER_DARKNESS = float(os.getenv("OMR_QUALITY_CORNER_DARKNESS", "0.45"))
+CORNER_BLUR = 0.012  # box blur size, fraction of the thumbnail long side
+
+# Rejection reasons, cheapest check first
+REJECT_REASONS = ("image_overexposed", "image_underexposed", "image_blurry",
+                  "corners_not_visible")
+
+
+def _thumbnail(gray, side=THUMB_SIDE):
+    # Integer-factor area reduction first (OpenCV's fast path), then the rest
+    h, w = gray.shape[:2]
+    factor = max(h, w) // side
+    if factor >= 2:
+        h, w = h - h % factor, w - w % factor
+        gray = cv2.resize(gray[:h, :w], (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+    scale = side / max(gray.shape[:2])
+    if scale >= 1.0:
+        return gray
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def _percentiles(gray, fractions):
+    cumulative = np.cumsum(cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel())
+    return [int(np.searchsorted(cumulative, f * cumulative[-1])) for f in fractions]
+
+
+def _laplacian_variance(thumb):
+    return float(cv2.Laplacian(thumb, cv2.CV_64F).var())
+
+
+def sharpness(gray):
+    """Focus measure of a grayscale photo (same scale as MIN_SHARPNESS)."""
+    return _laplacian_variance(_thumbnail(gray))
+
+
+def measure_quality(gray):
+    """
+    Quality measurements of a grayscale photo, taken on a thumbnail:
+    sharpness, dark/bright levels (1st/99th percentile), paper level and the
+    darkness of each quadrant's darkest blob relative to the paper.
+    """
+    thumb = _thumbnail(gray)
+    dark, bright, paper = _percentiles(thumb, (0.01, 0.99, 0.90))
+
+    k = max(3, round(max(thumb.shape) * CORNER_BLUR))
+    blurred = cv2.blur(thumb, (k, k))
+    h, w = blurred.shape
+    quadrants = (blurred[:h // 2, :w // 2], blurred[:h // 2, w // 2:],
+                 blurred[h // 2:, :w // 2], blurred[h // 2:, w // 2:])
+    corners = [float(q.min()) / max(float(paper), 1.0) for q in quadrants]
+
+    return {
+        "sharpness": _laplacian_variance(thumb),
+        "dark_level": float(dark),
+        "bright_level": float(bright),
+        "paper_level": float(paper),
+        "corner_darkness": corners,  # TL, TR, BL, BR
+    }
+
+
+def check_quality(gray):
+    """
+    Returns (reason, measurements): reason is one of REJECT_REASONS, or None
+    when the photo is worth running the pipeline on.
+    """
+    m = measure_quality(gray)
+    if m["dark_level"] > OVEREXPOSED_LEVEL:
+        return "image_overexposed", m
+    if m["bright_level"] < UNDEREXPOSED_LEVEL:
+        return "image_underexposed", m
+    if m["sharpness"] < MIN_SHARPNESS:
+        return "image_blurry", m
+    if max(m["corner_darkness"]) > CORNER_DARKNESS:
+        return "corners_not_visible", m
+    return None, m
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Bump when pipeline changes make previously cached readings stale
+CACHE_VERSION = 3
+
+
+def content_hash(contents: bytes) -> str:
+    """Identity of an uploaded file (sha256 of its bytes)."""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def result_cache_key(digest: str, num_questions: int, stages) -> str:
+    """Key from content_hash() plus every parameter that changes the reading."""
+    params = f"{digest}|v{CACHE_VERSION}|{num_questions}|{','.join(sorted(stages))}"
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Pipeline readings keyed by result_cache_key, so re-submitted photos skip
+    OpenCV and OCR. A value is (error, student_answers, student_name,
+    student_id, scores), i.e. everything except grading, which always
+    re-runs against the key supplied with the request.
+
+    Entries live in an in-process LRU of `max_entries`. With `disk_dir` set
+    they are also written there as <key>.json (atomically, shared between
+    processes and restarts); the least recently used files are deleted once
+    the directory grows past `disk_max_bytes`.
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: str = None,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> value
+        self._disk_index = None      # key -> size, built lazily from disk_dir
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.disk_dir is not None
+
+    # -- serialization ----------------------------------------------------
+
+    @staticmethod
+    def _dump(value) -> bytes:
+        error, answers, name, student_id, scores = value
+        return json.dumps({
+            "error": error,
+            "answers": None if answers is None else {str(q): a for q, a in answers.items()},
+            "name": name,
+            "id": student_id,
+            "scores": None if scores is None else np.asarray(scores).tolist(),
+        }).encode()
+
+    @staticmethod
+    def _load(raw: bytes):
+        data = json.loads(raw)
+        answers = data["answers"]
+        if answers is not None:
+            answers = {int(q): a for q, a in answers.items()}
+        scores = data.get("scores")
+        if scores is not None:
+            scores = np.array(scores, dtype=np.float64).reshape(-1, 5)
+        return data["error"], answers, data["name"], data["id"], scores
+
+    # -- disk tier ---------------------------------------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _ensure_disk_index(self):
+        if self._disk_index is not None:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len(".json")], st.st_size))
+        # Oldest first, so iteration order doubles as LRU order
+        self._disk_index = OrderedDict((k, size) for _, k, size in sorted(entries))
+        self._disk_bytes = sum(self._disk_index.values())
+
+    def _disk_get(self, key: str):
+        self._ensure_disk_index()
+        try:
+            with open(self._path(key), "rb") as f:
+                raw = f.read()
+            os.utime(self._path(key))  # mtime = last use, for eviction after restart
+        except OSError:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+            return None
+        if key in self._disk_index:
+            self._disk_index.move_to_end(key)
+        return self._load(raw)
+
+    def _disk_put(self, key: str, raw: bytes):
+        self._ensure_disk_index()
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._disk_bytes += len(raw) - self._disk_index.pop(key, 0)
+        self._disk_index[key] = len(raw)
+        while self._disk_bytes > self.disk_max_bytes and len(self._disk_index) > 1:
+            old_key, size = self._disk_index.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    # -- public API ----------------------------------------------------------
+
+    def get(self, key: str):
+        """Cached (error, answers, name, id, scores) or None."""
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            elif self.disk_dir is not None:
+                value = self._disk_get(key)
+                if value is not None and self.max_entries > 0:
+                    self._remember(key, value)
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def _remember(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def put(self, key: str, value):
+        with self._lock:
+            if self.max_entries > 0:
+                self._remember(key, value)
+            if self.disk_dir is not None:
+                try:
+                    self._disk_put(key, self._dump(value))
+                except OSError as e:
+                    print(f"[cache] Disk write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._items),
+                "disk_entries": len(self._disk_index or ()),
+                "disk_bytes": self._disk_bytes,
+            }
@@ -0,0 +1,105 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from omr_core.detect_sheet import (
+    MARKER_SIZE, marker_size_error, order_points, quad_shape, track_markers, warp_from_centers,
+)
+
+
+# Fixed rigs (document camera, mounted scanner): sheets land in almost the same
+# place every time, so with a device id the markers are first looked for in
+# small windows around where they were on that device's last sheet. The full
+# marker search only runs when one of them is not found there.
+RIG_MODE_ENABLED = os.getenv("OMR_RIG_MODE", "1") != "0"
+
+# Devices remembered per process (least recently used dropped first)
+RIG_MAX_DEVICES = int(os.getenv("OMR_RIG_MAX_DEVICES", "64"))
+
+# Search window around each cached marker, in marker sides
+RIG_REACH = float(os.getenv("OMR_RIG_REACH", "2.0"))
+
+# Verified markers must still frame a sheet (same limits as the stream
+# tracker): height/width of the quad within RIG_MAX_SHAPE_ERROR of the
+# sheet's, marker size within RIG_MAX_SIZE_ERROR of MARKER_SIZE
+RIG_MAX_SHAPE_ERROR = float(os.getenv("OMR_RIG_MAX_SHAPE_ERROR", "0.15"))
+RIG_MAX_SIZE_ERROR = float(os.getenv("OMR_RIG_MAX_SIZE_ERROR", "0.12"))
+
+# Lookup results: the cached markers were verified (hit) or the full search ran
+RIG_RESULTS = ("hit", "miss")
+
+# Marker centers = canvas corners
+_CANVAS_CORNERS = np.array([[[0, 0], [1000, 0], [1000, 1414], [0, 1414]]], dtype="float32")
+
+
+def markers_from_warp(gray, M_warp):
+    """
+    The four markers M_warp was computed from, re-located in `gray` around
+    the canvas corners mapped back into the image. Returns [TL, TR, BR, BL]
+    markers {"center", "area"}, or None if one is not found there.
+    """
+    centers = cv2.perspectiveTransform(_CANVAS_CORNERS, np.linalg.inv(M_warp))[0]
+    area = float(cv2.contourArea(centers)) * MARKER_SIZE ** 2
+    return track_markers(gray, [{"center": (float(x), float(y)), "area": area}
+                                for x, y in centers], reach=1.0)
+
+
+def plausible_markers(markers) -> bool:
+    """Whether four markers form the sheet's quad (not e.g. a bumped sheet's blobs)."""
+    quad = order_points(np.array([m["center"] for m in markers], dtype="float32"))
+    _, shape_error = quad_shape(quad)
+    return (shape_error <= RIG_MAX_SHAPE_ERROR
+            and marker_size_error(markers, quad) <= RIG_MAX_SIZE_ERROR)
+
+
+class RigCache:
+    """
+    Last good marker set of each device, for images of the same size.
+    Shared by the pipeline threads of one process.
+    """
+
+    def __init__(self, max_devices: int = RIG_MAX_DEVICES):
+        self.max_devices = max_devices
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # device_id -> (image shape, markers)
+
+    def locate(self, device_id: str, gray):
+        """
+        M_warp from the device's cached markers, verified in small windows of
+        `gray` (positions follow the rig's slow drift), or None when they are
+        not all found there or no longer form the sheet's quad.
+        """
+        with self._lock:
+            entry = self._items.get(device_id)
+            if entry is not None:
+                self._items.move_to_end(device_id)
+        if entry is None or entry[0] != gray.shape[:2]:
+            return None
+        markers = track_markers(gray, entry[1], reach=RIG_REACH)
+        if markers is None or not plausible_markers(markers):
+            return None
+        self._put(device_id, gray.shape[:2], markers)
+        return warp_from_centers([m["center"] for m in markers])
+
+    def learn(self, device_id: str, gray, M_warp):
+        """Remember the markers a full search found for the device."""
+        markers = markers_from_warp(gray, M_warp)
+        if markers is not None:
+            self._put(device_id, gray.shape[:2], markers)
+
+    def _put(self, device_id, shape, markers):
+        with self._lock:
+            self._items[device_id] = (shape, markers)
+            self._items.move_to_end(device_id)
+            while len(self._items) > self.max_devices:
+                self._items.popitem(last=False)
+
+    def devices(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+rig_cache = RigCache()
@@ -0,0 +1,204 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from omr_core.answer_keys import validate_exam_id
+from omr_core.detect_answers import decide_codes
+from omr_core.grading import ANSWER_LABELS, EMPTY, GradeBatch
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+
+class ScoreStore:
+    """
+    Raw bubble score matrices per exam, so an exam can be regraded with a
+    corrected key or retuned thresholds without rescanning any sheet.
+
+    On disk each exam is a directory <root>/<exam_id>/ with
+        scores.f32   append-only float32 rows of 5 option scores
+        index.jsonl  one line per sheet: {"hash", "offset", "n_questions",
+                     "filename", "name", "id", "scanned_at"}
+    `offset` is the sheet's first row in scores.f32. A sheet (by upload
+    content hash) is stored once per exam. Appends hold an exclusive lock on
+    index.jsonl, so the API and job-worker processes can share a store.
+
+    Retention: an exam keeps at most `max_sheets` sheets (later ones are not
+    stored), and only the `max_exams` most recently scanned exams are kept.
+    """
+
+    def __init__(self, root: str, max_exams: int = 100, max_sheets: int = 5000):
+        if max_exams < 1 or max_sheets < 1:
+            raise ValueError(f"max_exams and max_sheets must be at least 1, "
+                             f"got {max_exams} and {max_sheets}")
+        self.root = root
+        self.max_exams = max_exams
+        self.max_sheets = max_sheets
+        self._lock = threading.Lock()
+        # exam_id -> (index.jsonl inode, bytes of it already read, set of hashes)
+        self._known = {}
+
+    def _dir(self, exam_id: str) -> str:
+        return os.path.join(self.root, validate_exam_id(exam_id))
+
+    def _known_hashes(self, exam_id: str, index_file):
+        """Hashes of an exam, reading only index lines appended since last time."""
+        inode = os.fstat(index_file.fileno()).st_ino
+        known_inode, read_bytes, hashes = self._known.get(exam_id, (None, 0, set()))
+        if known_inode != inode:  # first use, or the exam was evicted and started over
+            read_bytes, hashes = 0, set()
+        index_file.seek(read_bytes)
+        for line in index_file.read().splitlines():
+            if line.strip():
+                hashes.add(json.loads(line)["hash"])
+        self._known[exam_id] = (inode, index_file.tell(), hashes)
+        return hashes
+
+    def add_many(self, exam_id: str, sheets) -> int:
+        """
+        Append sheets [{"hash", "scores", "filename", "name", "id"}, ...] to an
+        exam, skipping hashes it already has and sheets past `max_sheets`.
+        Returns the number stored.
+        """
+        if not sheets:
+            return 0
+        exam_dir = self._dir(exam_id)
+        is_new_exam = not os.path.isdir(exam_dir)
+        os.makedirs(exam_dir, exist_ok=True)
+        stored = self._append(exam_id, exam_dir, sheets)
+        if is_new_exam:
+            self._prune(keep=exam_id)
+        return stored
+
+    def _append(self, exam_id: str, exam_dir: str, sheets) -> int:
+        with self._lock, open(os.path.join(exam_dir, "index.jsonl"), "a+") as index_file:
+            if fcntl is not None:
+                fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                known = self._known_hashes(exam_id, index_file)
+                new, seen = [], set()
+                for sheet in sheets:
+                    if sheet["hash"] not in known and sheet["hash"] not in seen:
+                        seen.add(sheet["hash"])
+                        new.append(sheet)
+                room = max(self.max_sheets - len(known), 0)
+                if len(new) > room:
+                    print(f"[scores] Exam {exam_id} holds {self.max_sheets} sheets, "
+                          f"not storing {len(new) - room} more.")
+                    new = new[:room]
+                if not new:
+                    return 0
+                known.update(sheet["hash"] for sheet in new)
+
+                with open(os.path.join(exam_dir, "scores.f32"), "ab") as data_file:
+                    offset = data_file.tell() // (5 * 4)
+                    lines = []
+                    for sheet in new:
+                        scores = np.asarray(sheet["scores"], dtype=np.float32).reshape(-1, 5)
+                        data_file.write(scores.tobytes())
+                        lines.append(json.dumps({
+                            "hash": sheet["hash"],
+                            "offset": offset,
+                            "n_questions": len(scores),
+                            "filename": sheet.get("filename"),
+                            "name": sheet.get("name"),
+                            "id": sheet.get("id"),
+                            "scanned_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                        }) + "\n")
+                        offset += len(scores)
+                    data_file.flush()
+                    os.fsync(data_file.fileno())
+
+                # Index lines only ever point at rows that are already on disk
+                index_file.write("".join(lines))
+                index_file.flush()
+                self._known[exam_id] = (os.fstat(index_file.fileno()).st_ino,
+                                        index_file.tell(), known)
+                return len(new)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(index_file, fcntl.LOCK_UN)
+
+    def load(self, exam_id: str):
+        """
+        (entries, rows) of an exam: index entries in scan order and a read-only
+        memory map of all score rows (n x 5). Returns ([], empty) if unknown.
+        """
+        exam_dir = self._dir(exam_id)
+        index_path = os.path.join(exam_dir, "index.jsonl")
+        data_path = os.path.join(exam_dir, "scores.f32")
+        if not os.path.exists(index_path) or not os.path.exists(data_path) \
+                or not os.path.getsize(data_path):
+            return [], np.zeros((0, 5), dtype=np.float32)
+
+        with open(index_path, "r") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        # Whole rows only: a crash mid-append can leave a partial row at the end
+        n_rows = os.path.getsize(data_path) // (5 * 4)
+        rows = np.memmap(data_path, dtype=np.float32, mode="r", shape=(n_rows, 5))
+        return entries, rows
+
+    def _prune(self, keep: str):
+        """Drop the least recently scanned exams beyond `max_exams`."""
+        by_age = []
+        for exam_id in self.exam_ids():
+            try:
+                mtime = os.path.getmtime(os.path.join(self.root, exam_id, "index.jsonl"))
+            except OSError:
+                continue
+            if exam_id != keep:
+                by_age.append((mtime, exam_id))
+        by_age.sort()
+        for _, exam_id in by_age[:max(len(by_age) + 1 - self.max_exams, 0)]:
+            print(f"[scores] Dropping stored scores of exam {exam_id} (retention).")
+            shutil.rmtree(os.path.join(self.root, exam_id), ignore_errors=True)
+            with self._lock:
+                self._known.pop(exam_id, None)
+
+    def exam_ids(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(os.path.join(self.root, name, "index.jsonl")))
+
+
+def regrade_exam(store: ScoreStore, exam_id: str, answer_key: dict, **thresholds):
+    """
+    Re-apply the answer decision rules (optionally with other `thresholds`,
+    see decide_codes) and grading to every stored sheet of an exam. All
+    questions of all sheets are decided and graded in vectorized passes.
+    Returns a list of {"hash", "filename", "student_name", "student_id",
+    "student_answers", "grade"} in scan order (grades without details).
+    """
+    entries, rows = store.load(exam_id)
+    if not entries:
+        return []
+
+    counts = np.array([e["n_questions"] for e in entries])
+    row_idx = np.concatenate([np.arange(e["offset"], e["offset"] + e["n_questions"])
+                              for e in entries])
+    flat_codes = decide_codes(rows[row_idx], **thresholds)
+
+    # (sheets x questions) code matrix; shorter sheets are padded with EMPTY
+    codes = np.full((len(entries), counts.max()), EMPTY, dtype=np.int8)
+    codes[np.arange(counts.max()) < counts[:, None]] = flat_codes
+    grades = GradeBatch.from_question_codes(codes, answer_key)
+
+    results = []
+    for i, e in enumerate(entries):
+        labels = codes[i, :counts[i]].tolist()
+        results.append({
+            "hash": e["hash"],
+            "filename": e.get("filename"),
+            "student_name": e.get("name"),
+            "student_id": e.get("id"),
+            "student_answers": {q + 1: ANSWER_LABELS[c] for q, c in enumerate(labels)},
+            "grade": grades.result(i, details=False),
+        })
+    return results
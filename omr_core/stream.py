@@ -0,0 +1,170 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from omr_core import metrics
+from omr_core.detect_sheet import (
+    locate_markers, marker_size_error, order_points, quad_shape, track_markers,
+    warp_from_centers,
+)
+from omr_core.metrics import timed
+from omr_core.pipeline import COARSE_MAX_SIDE, decode_image
+from omr_core.preprocess import marker_blur, threshold_markers
+from omr_core.quality import sharpness
+
+
+# A sheet is read once it has been aligned, sharp and still for this many
+# consecutive frames
+STABLE_FRAMES = int(os.getenv("OMR_STREAM_STABLE_FRAMES", "3"))
+
+# Still: no marker moved more than this fraction of the frame diagonal
+MAX_MOTION = float(os.getenv("OMR_STREAM_MAX_MOTION", "0.01"))
+
+# Aligned: the marker quad covers at least this fraction of the frame,
+# opposite sides differ in length by at most MAX_TILT (camera held parallel)
+# and its height/width is within MAX_SHAPE_ERROR of the sheet's 1414/1000
+# (also rejects most wrong marker sets picked when a corner is cut off)
+MIN_FILL = float(os.getenv("OMR_STREAM_MIN_FILL", "0.3"))
+MAX_TILT = float(os.getenv("OMR_STREAM_MAX_TILT", "0.15"))
+MAX_SHAPE_ERROR = float(os.getenv("OMR_STREAM_MAX_SHAPE_ERROR", "0.15"))
+
+# Marker side / sqrt(quad area) within MAX_SIZE_ERROR of MARKER_SIZE; a wrong
+# set (bubbles picked when a corner is cut off) is below 0.03
+MAX_SIZE_ERROR = float(os.getenv("OMR_STREAM_MAX_SIZE_ERROR", "0.12"))
+
+# Stricter than the upload quality gate: the capture should be a good photo
+MIN_SHARPNESS = float(os.getenv("OMR_STREAM_MIN_SHARPNESS", "100"))
+
+HINTS = {
+    "not_found": "Arahkan kamera ke LJK sampai keempat marker sudut terlihat.",
+    "too_far": "Dekatkan kamera ke LJK.",
+    "tilted": "Posisikan kamera sejajar dengan kertas (jangan miring).",
+    "not_sheet": "Pastikan seluruh lembar LJK masuk ke dalam frame.",
+    "blurry": "Gambar buram, pastikan kamera fokus.",
+    "moving": "Tahan kamera tetap diam.",
+    "hold": "Tahan posisi...",
+    "capture": "Memindai LJK...",
+    "done": "LJK sudah dipindai. Ganti lembar berikutnya.",
+}
+
+
+def search_markers(gray):
+    """
+    Full marker search on one frame (on a downscaled copy for large frames,
+    like find_paper_coarse). Returns [TL, TR, BR, BL] markers
+    {"center", "area"} in frame coordinates, or None.
+    """
+    scale = COARSE_MAX_SIDE / max(gray.shape[:2]) if COARSE_MAX_SIDE > 0 else 1.0
+    small = gray
+    if scale < 1.0:
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        scale = 1.0
+
+    markers = locate_markers(threshold_markers(marker_blur(small)))
+    if markers is None:
+        return None
+    markers = [{"center": (m["center"][0] / scale, m["center"][1] / scale),
+                "area": m["area"] / (scale * scale)} for m in markers]
+    # Sub-pixel centers from the full-resolution frame where possible
+    return track_markers(gray, markers, reach=1.5) or markers
+
+
+class StreamTracker:
+    """
+    State of one live camera stream. Frames are fed in order; between frames
+    the markers are only looked for in small windows around their previous
+    positions, and searched for in the whole frame only when they are lost.
+    Each sheet is captured once per acquisition: a new capture needs the
+    tracking to be lost first (the next sheet being put in front of the camera).
+    """
+
+    def __init__(self):
+        self.markers = None
+        self.stable = 0
+        self.armed = True
+        self.frames = 0
+
+    def rearm(self):
+        """Allow the current sheet to be captured again (e.g. its read failed)."""
+        self.armed = True
+        self.stable = 0
+
+    def process(self, contents: bytes):
+        """
+        Track the sheet in one encoded frame. Returns (feedback, gray, M_warp):
+        `feedback` is the per-frame JSON report; M_warp is only set on the frame
+        that should be read now, else None.
+        """
+        start = time.perf_counter()
+        self.frames += 1
+        gray = decode_image(contents)
+        if gray is None:
+            return {"frame": self.frames, "error": "invalid_image"}, None, None
+
+        previous, markers, how = self.markers, None, "tracked"
+        if previous is not None:
+            with timed("stream_track"):
+                markers = track_markers(gray, previous)
+        if markers is None:
+            how = "searched"
+            with timed("stream_search"):
+                markers = search_markers(gray)
+        if how != "tracked":
+            # (Re)acquired sheet: may be the next one, so it can be captured again
+            self.stable, self.armed = 0, True
+        if markers is None:
+            how = "lost"
+        self.markers = markers
+        metrics.STREAM_FRAMES.inc(how)
+
+        feedback = {"frame": self.frames, "markers_found": markers is not None, "tracking": how}
+        if markers is None:
+            feedback.update(capture=False, hint=HINTS["not_found"],
+                            latency_ms=round((time.perf_counter() - start) * 1000, 1))
+            return feedback, gray, None
+
+        h, w = gray.shape[:2]
+        quad = order_points(np.array([m["center"] for m in markers], dtype="float32"))
+        fill = float(cv2.contourArea(quad)) / (w * h)
+        tilt, shape_error = quad_shape(quad)
+        size_error = marker_size_error(markers, quad)
+        sheet = shape_error <= MAX_SHAPE_ERROR and size_error <= MAX_SIZE_ERROR
+        if not sheet and how == "searched":
+            # Wrong marker set: search again on the next frame instead of tracking it
+            self.markers = None
+        motion = None
+        if how == "tracked":
+            moved = [np.hypot(m["center"][0] - p["center"][0], m["center"][1] - p["center"][1])
+                     for m, p in zip(markers, previous)]
+            motion = float(max(moved)) / float(np.hypot(w, h))
+        focus = sharpness(gray)
+
+        checks = (("not_sheet", sheet),
+                  ("too_far", fill >= MIN_FILL), ("tilted", tilt <= MAX_TILT),
+                  ("blurry", focus >= MIN_SHARPNESS),
+                  ("moving", motion is not None and motion <= MAX_MOTION))
+        failed = [name for name, ok in checks if not ok]
+        self.stable = 0 if failed else self.stable + 1
+        capture = self.armed and self.stable >= STABLE_FRAMES
+        if capture:
+            self.armed = False
+
+        if not self.armed and not capture:
+            hint = HINTS["done"]
+        else:
+            hint = HINTS[failed[0] if failed else ("capture" if capture else "hold")]
+        feedback.update(
+            corners=[[round(float(x), 1), round(float(y), 1)] for x, y in quad],
+            fill=round(fill, 3), tilt=round(tilt, 3), shape_error=round(shape_error, 3),
+            marker_size_error=round(size_error, 3),
+            motion=None if motion is None else round(motion, 4),
+            sharpness=round(focus, 1),
+            aligned=not {"not_sheet", "too_far", "tilted"} & set(failed),
+            sharp="blurry" not in failed, still="moving" not in failed,
+            stable_frames=self.stable, capture=capture, hint=hint,
+            latency_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+        return feedback, gray, warp_from_centers(quad) if capture else None
@@ -0,0 +1,343 @@
+"""
+test_benchmark.py — Benchmark suite OMR
+=======================================
+Suite "stages" (default): ukur tiap stage pipeline (decode, quality_gate,
+preprocess_for_markers, find_paper, locate_paper, locate_paper_rig dengan
+cache fixed-rig sudah terisi, warp, preprocess_for_answers, detect_answers,
+extract_name_and_id, grade_answers) plus process_ljk penuh, pada semua
+sample image di repo.
+Dilaporkan min / median / p95 per panggilan dan peak memory (tracemalloc,
+satu run terpisah supaya timing tidak ikut melambat). Hasil disimpan ke
+JSON, dan bisa dibandingkan dengan baseline: exit code 1 kalau median
+sebuah stage lebih lambat dari baseline melebihi --threshold.
+
+    python test_benchmark.py --repeat 20 --json bench.json
+    python test_benchmark.py --baseline bench_baseline.json --threshold 0.2
+    python test_benchmark.py --baseline bench_baseline.json --update-baseline
+
+Suite "legacy": bandingkan detect_answers (integral image, vectorized)
+dengan implementasi loop lama per sel. Hasil jawaban WAJIB identik;
+script berhenti kalau ada yang beda.
+
+    python test_benchmark.py --suite legacy [--repeat 200]
+
+Baseline hanya bermakna di mesin (dan jumlah thread OpenCV) yang sama.
+extract_name_and_id dilewati kalau paddleocr tidak terpasang.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from omr_core.detect_answers import (
+    detect_answers, OPTIONS, ROW_Y_CENTERS, OPTION_BOUNDS,
+    Z_THRESH, MIN_ABS_DIFF, MIN_STD_SCORE,
+)
+from omr_core.detect_sheet import find_paper
+from omr_core.grading import grade_answers
+from omr_core.pipeline import (
+    decode_image, find_paper_with_fallback, locate_paper, process_ljk, _warp_sheet,
+)
+from omr_core.preprocess import preprocess_for_markers, preprocess_for_answers
+from omr_core.quality import check_quality
+
+SAMPLE_IMAGES = [
+    "sample.png", "IMG_3344.PNG", "IMG_3345.PNG", "IMG_3346.PNG",
+    "Kunjab.jpg", "LJK_REVISI.png",
+]
+
+
+# ---------------------------------------------------------------------------
+# Reference: the original per-cell loop (scalar NumPy calls per bubble)
+# ---------------------------------------------------------------------------
+def _legacy_read_column(working_gray, x_start, x_end, n_questions):
+    col_w = x_end - x_start
+    answers = []
+    for q_idx in range(n_questions):
+        yc = ROW_Y_CENTERS[q_idx]
+        yt, yb = yc - 35, yc + 35
+        scores = []
+        for (xs_r, xe_r) in OPTION_BOUNDS:
+            xt = x_start + int(col_w * xs_r)
+            xb = x_start + int(col_w * xe_r)
+            cell = working_gray[yt + 8: yb - 8, xt + 8: xb - 8]
+            scores.append(255.0 - np.mean(cell) if cell.size else 0.0)
+
+        max_score = max(scores)
+        mean_score = np.mean(scores)
+        std_score = np.std(scores)
+        if std_score < MIN_STD_SCORE:
+            filled = []
+        else:
+            threshold = mean_score + Z_THRESH * std_score
+            filled = [i for i, s in enumerate(scores)
+                      if s >= threshold and (s - mean_score) >= MIN_ABS_DIFF]
+
+        scores_sorted = sorted(scores)
+        second_max = scores_sorted[-2]
+        if len(filled) == 0:
+            answer = None
+        else:
+            mean_other = np.mean(scores_sorted[:-2])
+            if second_max >= max_score * 0.85 and (second_max - mean_other) > 10.0:
+                answer = "DOUBLE"
+            elif len(filled) == 1:
+                answer = OPTIONS[filled[0]]
+            else:
+                answer = OPTIONS[scores.index(max_score)]
+        answers.append(answer)
+    return answers
+
+
+def legacy_detect_answers(warped_ready, num_questions=30):
+    w = warped_ready.shape[1]
+    all_answers = {}
+    col1 = _legacy_read_column(warped_ready, int(w * 0.090), int(w * 0.350), min(num_questions, 15))
+    for i, a in enumerate(col1):
+        all_answers[i + 1] = a
+    if num_questions > 15:
+        col2 = _legacy_read_column(warped_ready, 594, 854, min(num_questions - 15, 15))
+        for i, a in enumerate(col2):
+            all_answers[15 + i + 1] = a
+    return all_answers
+
+
+def _time_per_call(func, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_detect_answers(repeat):
+    print("\n=============================================")
+    print("  BENCHMARK detect_answers (per sheet)")
+    print("=============================================")
+    print(f"  {'Image':<16} | {'legacy':>9} | {'vector':>9} | speedup")
+    print("  ---------------------------------------------")
+
+    total_legacy = total_vector = 0.0
+    for name in SAMPLE_IMAGES:
+        if not os.path.exists(name):
+            continue
+        result = find_paper_with_fallback(cv2.imread(name))
+        if result is None:
+            print(f"  {name:<16} | marker tidak terdeteksi, skip")
+            continue
+        warped_ready, _ = result
+
+        expected = legacy_detect_answers(warped_ready)
+        actual = detect_answers(warped_ready)
+        if expected != actual:
+            raise SystemExit(f"  MISMATCH pada {name}:\n  legacy={expected}\n  vector={actual}")
+
+        t_legacy = _time_per_call(legacy_detect_answers, warped_ready, repeat)
+        t_vector = _time_per_call(detect_answers, warped_ready, repeat)
+        total_legacy += t_legacy
+        total_vector += t_vector
+        print(f"  {name:<16} | {t_legacy * 1e3:7.3f}ms | {t_vector * 1e3:7.3f}ms | {t_legacy / t_vector:5.1f}x")
+
+    if total_vector > 0:
+        print("  ---------------------------------------------")
+        print(f"  {'TOTAL':<16} | {total_legacy * 1e3:7.3f}ms | {total_vector * 1e3:7.3f}ms | "
+              f"{total_legacy / total_vector:5.1f}x")
+    print("=============================================\n")
+
+
+# ---------------------------------------------------------------------------
+# Stage suite
+# ---------------------------------------------------------------------------
+BENCH_KEY = {q: "ABCDE"[(q - 1) % 5] for q in range(1, 31)}
+
+
+def _ocr_available():
+    try:
+        import paddleocr  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _measure(func, repeat, warmup):
+    """Per-call timings in ms plus peak traced memory (KiB) of one extra call."""
+    # Stage code prints progress; keep it out of the report (and out of the timing noise)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            func()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1e3)
+
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    timings = np.array(timings)
+    return {
+        "min_ms": round(float(timings.min()), 3),
+        "median_ms": round(float(np.median(timings)), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _stage_calls(name, with_ocr):
+    """[(stage, zero-arg callable)] for one sample image, inputs precomputed once."""
+    with open(name, "rb") as f:
+        contents = f.read()
+    image = decode_image(contents)
+    if image is None:
+        return None
+    with contextlib.redirect_stdout(io.StringIO()):
+        M_warp, _ = locate_paper(image)
+        # Fills the fixed-rig cache for this image's "device"
+        locate_paper(image, device_id=name)
+    if M_warp is None:
+        return None
+    stages = ("answers", "name", "id") if with_ocr else ("answers",)
+    thresh = preprocess_for_markers(image)
+    warped_ready, warped_gray = _warp_sheet(image, M_warp, True, None, stages)
+    answers = detect_answers(warped_ready)
+
+    calls = [
+        ("decode", lambda: decode_image(contents)),
+        ("quality_gate", lambda: check_quality(image)),
+        ("preprocess_for_markers", lambda: preprocess_for_markers(image)),
+        ("find_paper", lambda: find_paper(thresh)),
+        ("locate_paper", lambda: locate_paper(image)),
+        ("locate_paper_rig", lambda: locate_paper(image, device_id=name)),
+        ("warp", lambda: _warp_sheet(image, M_warp, False, None, stages)),
+        ("warp_full", lambda: _warp_sheet(image, M_warp, False, None)),
+        ("preprocess_for_answers", lambda: preprocess_for_answers(warped_gray)),
+        ("preprocess_answers_full", lambda: preprocess_for_answers(warped_gray, 1)),
+        ("detect_answers", lambda: detect_answers(warped_ready)),
+        ("grade_answers", lambda: grade_answers(answers, BENCH_KEY)),
+    ]
+    if with_ocr:
+        from omr_core.ocr import extract_name_and_id
+        calls.append(("extract_name_and_id", lambda: extract_name_and_id(warped_gray)))
+    calls.append(("process_ljk", lambda: process_ljk(decode_image(contents), stages=stages)))
+    return calls
+
+
+def bench_stages(repeat, warmup):
+    with_ocr = _ocr_available()
+    print("\n=====================================================================")
+    print("  BENCHMARK per stage (ms per call, peak memory per call)")
+    if not with_ocr:
+        print("  paddleocr tidak terpasang: extract_name_and_id dilewati")
+    print("=====================================================================")
+
+    results = {}
+    for name in SAMPLE_IMAGES:
+        if not os.path.exists(name):
+            continue
+        calls = _stage_calls(name, with_ocr)
+        if calls is None:
+            print(f"\n  {name}: marker tidak terdeteksi, skip")
+            continue
+        print(f"\n  {name}")
+        print(f"  {'stage':<24} | {'min':>8} | {'median':>8} | {'p95':>8} | {'peak':>9}")
+        print("  ---------------------------------------------------------------------")
+        results[name] = {}
+        for stage, func in calls:
+            r = _measure(func, repeat, warmup)
+            results[name][stage] = r
+            print(f"  {stage:<24} | {r['min_ms']:8.2f} | {r['median_ms']:8.2f} | "
+                  f"{r['p95_ms']:8.2f} | {r['peak_kib'] / 1024:6.1f}MiB")
+    print("=====================================================================\n")
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cv_threads": cv2.getNumThreads(),
+            "repeat": repeat,
+            "warmup": warmup,
+            "ocr": with_ocr,
+        },
+        "results": results,
+    }
+
+
+def compare_to_baseline(report, baseline, threshold, min_delta_ms):
+    """
+    Print median changes against a baseline report. Returns the regressions:
+    stages slower by more than `threshold` (fraction) AND `min_delta_ms`.
+    """
+    print("=====================================================================")
+    print(f"  VS BASELINE ({baseline['meta'].get('created_at', '?')}), "
+          f"threshold +{threshold * 100:.0f}% / {min_delta_ms}ms")
+    print("=====================================================================")
+    regressions = []
+    for name, stages in report["results"].items():
+        for stage, r in stages.items():
+            base = baseline["results"].get(name, {}).get(stage)
+            if base is None:
+                continue
+            before, after = base["median_ms"], r["median_ms"]
+            change = (after - before) / before if before > 0 else 0.0
+            regressed = change > threshold and after - before > min_delta_ms
+            flag = "  << REGRESI" if regressed else ""
+            print(f"  {name:<16} {stage:<24} {before:8.2f} -> {after:8.2f}ms "
+                  f"({change * 100:+6.1f}%){flag}")
+            if regressed:
+                regressions.append({"image": name, "stage": stage,
+                                    "baseline_ms": before, "median_ms": after})
+    print("=====================================================================\n")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OMR benchmarks")
+    parser.add_argument("--suite", choices=("stages", "legacy"), default="stages")
+    parser.add_argument("--repeat", type=int, default=None,
+                        help="calls per measurement (default: 20 stages, 200 legacy)")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--json", default="bench_results.json", help="write the report here")
+    parser.add_argument("--baseline", help="baseline report (JSON) to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed median slowdown vs baseline, as a fraction (0.2 = +20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="ignore slowdowns smaller than this (timer noise)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write this run to --baseline instead of comparing")
+    args = parser.parse_args()
+
+    if args.suite == "legacy":
+        bench_detect_answers(args.repeat or 200)
+        raise SystemExit(0)
+
+    report = bench_stages(args.repeat or 20, args.warmup)
+    with open(args.json, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"  Hasil disimpan ke {args.json}")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"  Baseline diperbarui: {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"  {len(regressions)} stage lebih lambat dari baseline.")
+            raise SystemExit(1)
+        print("  Tidak ada regresi.")
@@ -1,9 +1,40 @@
+"""
+test_ocr.py — OCR Name & ID
+===========================
+Default: jalankan extract_name_and_id pada IMG_3345 dan simpan crop yang
+sudah dibersihkan untuk diperiksa.
+
+    python test_ocr.py
+
+--compare: bandingkan pembacaan recognizer saja (det=False, yang dipakai
+pipeline) dengan PaddleOCR lengkap (detector + recognizer) pada crop yang
+sama, untuk semua sample lembar tulisan tangan, terhadap isian sebenarnya.
+Exit code 1 kalau recognizer saja benar di lebih sedikit field daripada
+det+rec (mis. garis pemisah sel terbaca sebagai '1').
+
+    python test_ocr.py --compare
+"""
+
+import argparse
+import contextlib
+import io
 import cv2
 import numpy as np
 import sys
 import os
 
-from omr_core.ocr import extract_name_and_id
+from omr_core.ocr import (
+    _clean_id, _clean_name, crop_name_and_id, extract_name_and_id, get_ocr_engine,
+    read_names_and_ids,
+)
+from omr_core.pipeline import find_paper_with_fallback
+
+# Sample sheets with a handwritten Name/ID: (name, id) actually written
+HANDWRITTEN_SAMPLES = {
+    "IMG_3344.PNG": ("ABCDEFGHIJKLM", "0123456789"),
+    "IMG_3345.PNG": ("FARHAN", "2457879"),
+    "IMG_3346.PNG": ("PUTRANTO", "987654"),
+}
 
 def run_ocr_test():
     # Load reference warped sheet using absolute path relative to this script
@@ -24,7 +55,8 @@ def run_ocr_test():
 
     # Execute extraction directly on the raw image
     print("Running Name & ID extraction pipeline on raw IMG_3344.PNG...")
-    name_text, id_text = extract_name_and_id(gray_img)
+    artifacts = {}
+    name_text, id_text = extract_name_and_id(gray_img, artifacts=artifacts)
 
     print("\n=============================================")
     print("  RAW OCR EXTRACTION RESULT")
@@ -33,12 +65,61 @@ def run_ocr_test():
     print(f"  Extracted ID  : '{id_text}'")
     print("=============================================\n")
 
-    # Cleaned outputs are written to the script directory:
+    # Cleaned crops are kept in memory by the pipeline; save them here for inspection
     cleaned_name_path = os.path.join(script_dir, "scratch_ocr_cleaned_name.png")
     cleaned_id_path = os.path.join(script_dir, "scratch_ocr_cleaned_id.png")
+    cv2.imwrite(cleaned_name_path, artifacts["ocr_name"])
+    cv2.imwrite(cleaned_id_path, artifacts["ocr_id"])
     print("Preprocessed crops saved to:")
     print(f"  - {cleaned_name_path}")
     print(f"  - {cleaned_id_path}")
 
+
+def _detect_and_recognize(crop):
+    """Full PaddleOCR (text detector + recognizer), boxes joined left to right."""
+    res = get_ocr_engine().ocr(cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR), det=True, rec=True, cls=False)
+    lines = sorted(res[0] or [], key=lambda line: min(p[0] for p in line[0]))
+    return " ".join(line[1][0] for line in lines)
+
+
+def run_compare():
+    print("\n=============================================")
+    print("  OCR: recognizer saja vs det+rec")
+    print("=============================================")
+    print(f"  {'Image':<14} | {'field':<5} | {'expected':<14} | {'rec':<16} | det+rec")
+    print("  ---------------------------------------------")
+
+    correct = {"rec": 0, "det": 0}
+    for name, expected in HANDWRITTEN_SAMPLES.items():
+        if not os.path.exists(name):
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = find_paper_with_fallback(cv2.imread(name))
+        if result is None:
+            print(f"  {name:<14} | marker tidak terdeteksi, skip")
+            continue
+        crops = crop_name_and_id(result[1])
+        rec_texts = read_names_and_ids([crops])[0]
+        for field, crop, clean, want, got_rec in zip(
+                ("name", "id"), crops, (_clean_name, _clean_id), expected, rec_texts):
+            got_det = clean(_detect_and_recognize(crop))
+            # Spaces between handwritten letters carry no information
+            correct["rec"] += got_rec.replace(" ", "") == want
+            correct["det"] += got_det.replace(" ", "") == want
+            print(f"  {name:<14} | {field:<5} | {want:<14} | {got_rec:<16} | {got_det}")
+
+    print("  ---------------------------------------------")
+    print(f"  Benar: rec {correct['rec']}, det+rec {correct['det']}")
+    if correct["rec"] < correct["det"]:
+        raise SystemExit("  Recognizer saja lebih buruk dari det+rec")
+
+
 if __name__ == "__main__":
-    run_ocr_test()
+    parser = argparse.ArgumentParser(description="OMR Name & ID OCR check")
+    parser.add_argument("--compare", action="store_true",
+                        help="recognizer saja vs det+rec pada sample tulisan tangan")
+    args = parser.parse_args()
+    if args.compare:
+        run_compare()
+    else:
+        run_ocr_test()
@@ -45,12 +45,12 @@ def process_full_debug(image):
     # TAHAP 2: DETEKSI SUDUT & WARP
     # =========================================================
     debug_corners = original_bgr.copy()
-    detect_result = find_paper(thresh_clean, debug_image=debug_corners)
+    M_warp = find_paper(thresh_clean, debug_image=debug_corners)
     cv2.imwrite("06_detect_corners.jpg", debug_corners)
     steps.append(("4. M: Detect Corners", debug_corners))
 
-    if detect_result is not None:
-        warped_biner, M_warp = detect_result
+    if M_warp is not None:
+        warped_biner = cv2.warpPerspective(thresh_clean, M_warp, (1000, 1414))
         cv2.imwrite("07_warped_biner.jpg", warped_biner)
         steps.append(("5. M: Warped Biner", warped_biner))
         
@@ -124,10 +124,11 @@ def process_full_debug(image):
         print(f"  Student ID  : '{student_id}'")
         print("=============================================\n")
 
-        detect_answers(warped_ready, num_questions=30, debug=True)
+        artifacts = {}
+        detect_answers(warped_ready, num_questions=30, debug=True, artifacts=artifacts)
         
-        if os.path.exists("debug_grid_overlay.png"):
-            final_res = cv2.imread("debug_grid_overlay.png")
+        if "grid_overlay" in artifacts:
+            final_res = artifacts["grid_overlay"].copy()
             # Overlay name & ID on the top section of the warped final debug image
             cv2.putText(final_res, f"OCR Name: {student_name}", (80, 80), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), 2)
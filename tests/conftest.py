@@ -0,0 +1,36 @@
+import contextlib
+import io
+import os
+
+import pytest
+
+from omr_core.pipeline import decode_image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_IMAGES = [
+    "sample.png", "IMG_3344.PNG", "IMG_3345.PNG", "IMG_3346.PNG",
+    "Kunjab.jpg", "LJK_REVISI.png",
+]
+
+
+def sample_path(name: str) -> str:
+    return os.path.join(ROOT, name)
+
+
+def read_sample(name: str) -> bytes:
+    with open(sample_path(name), "rb") as f:
+        return f.read()
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the marker search's per-candidate prints."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@pytest.fixture(scope="session")
+def sample_gray():
+    """Decoded grayscale IMG_3344.PNG (shared, do not modify)."""
+    return decode_image(read_sample("IMG_3344.PNG"))
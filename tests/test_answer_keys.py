@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+from omr_core.answer_keys import AnswerKeyFormatError, AnswerKeyStore, DEFAULT_EXAM_ID
+
+
+def test_put_bumps_version(tmp_path):
+    store = AnswerKeyStore(str(tmp_path))
+    assert store.get("uts-1") is None
+    assert store.put("uts-1", {"1": "A", "2": "B"}) == 1
+    assert store.put("uts-1", {"1": "C"}) == 2
+    assert store.get("uts-1") == ({1: "C"}, 2)
+    assert AnswerKeyStore(str(tmp_path)).get("uts-1") == ({1: "C"}, 2)
+    assert store.exam_ids() == ["uts-1"]
+
+
+def test_legacy_file_is_version_zero_of_default(tmp_path):
+    legacy = tmp_path / "answer_key.json"
+    legacy.write_text(json.dumps({"1": "A", "2": "E"}))
+    store = AnswerKeyStore(str(tmp_path / "keys"), legacy_path=str(legacy))
+    assert store.get() == ({1: "A", 2: "E"}, 0)
+    assert store.put(DEFAULT_EXAM_ID, {"1": "B"}) == 1
+    assert store.get() == ({1: "B"}, 1)
+
+
+def test_picks_up_changes_from_other_processes(tmp_path):
+    store = AnswerKeyStore(str(tmp_path), recheck_seconds=0)
+    other = AnswerKeyStore(str(tmp_path))
+    store.put("uas", {"1": "A"})
+    other.put("uas", {"1": "D", "2": "D"})
+    assert store.get("uas") == ({1: "D", 2: "D"}, 2)
+
+
+def test_corrupt_file(tmp_path):
+    store = AnswerKeyStore(str(tmp_path))
+    with open(os.path.join(tmp_path, "rusak.json"), "w") as f:
+        f.write("{not json")
+    with pytest.raises(AnswerKeyFormatError):
+        store.get("rusak")
+    # Uploading a new key replaces it
+    assert store.put("rusak", {"1": "A"}) == 1
+
+
+@pytest.mark.parametrize("exam_id", ["", "../etc", ".hidden", "a/b", "x" * 65])
+def test_rejects_unsafe_exam_ids(tmp_path, exam_id):
+    store = AnswerKeyStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.get(exam_id)
+    with pytest.raises(ValueError):
+        store.put(exam_id, {"1": "A"})
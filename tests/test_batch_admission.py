@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+QUEUE_LIMIT = main.PIPELINE_CONCURRENCY + main.PIPELINE_QUEUE_SIZE
+
+
+def _post(client, stages):
+    files = [("files", (f"{i}.png", b"sheet %d" % i, "image/png")) for i in range(3)]
+    return client.post("/scan-batch", files=files, data={"stages": stages})
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    """/scan-batch with in-thread sheet preparation; yields the uploads prepared."""
+    prepared = []
+
+    def prepare(contents, num_questions, stages, device_id):
+        prepared.append(contents)
+        return None, {}, ("name crop", "id crop"), None, None
+
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(main, "result_cache", main.ResultCache(max_entries=0))
+    monkeypatch.setattr(main, "get_batch_pool", lambda: pool)
+    monkeypatch.setattr(main, "prepare_sheet", prepare)
+    monkeypatch.setattr(main, "read_names_and_ids",
+                        lambda pairs, name, sid: [("BUDI", "123")] * len(pairs))
+    yield prepared
+    pool.shutdown()
+
+
+def test_busy_queue_rejects_before_preparing(batch, monkeypatch):
+    monkeypatch.setattr(main, "_pipeline_pending", QUEUE_LIMIT)
+    response = _post(TestClient(main.app), "name,id")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(main.PIPELINE_RETRY_AFTER)
+    assert batch == []
+
+
+def test_ocr_pass_runs_even_if_queue_fills_meanwhile(batch, monkeypatch):
+    real_check = main.check_pipeline_admission
+
+    def check_then_fill():
+        real_check()
+        # Single-sheet requests fill the queue while the sheets are prepared
+        monkeypatch.setattr(main, "_pipeline_pending", QUEUE_LIMIT)
+
+    monkeypatch.setattr(main, "check_pipeline_admission", check_then_fill)
+    response = _post(TestClient(main.app), "name,id")
+    assert response.status_code == 200
+    assert [r["student_name"] for r in response.json()["results"]] == ["BUDI"] * 3
+
+
+def test_answers_only_batch_ignores_pipeline_queue(batch, monkeypatch):
+    monkeypatch.setattr(main, "_pipeline_pending", QUEUE_LIMIT)
+    assert _post(TestClient(main.app), "answers").status_code == 200
+    assert len(batch) == 3
@@ -0,0 +1,65 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import Headers, UploadFile
+
+import main
+
+
+def _upload(name, data, content_type):
+    return UploadFile(io.BytesIO(data), size=len(data), filename=name,
+                      headers=Headers({"content-type": content_type}))
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return _upload("batch.zip", buf.getvalue(), "application/zip")
+
+
+def _read(files):
+    return asyncio.run(main.read_batch_uploads(files))
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_MAX_BYTES", 1000)
+    monkeypatch.setattr(main, "BATCH_MAX_BYTES", 2500)
+    # Oversized members must be rejected before they are inflated
+    reads = []
+    real_read = zipfile.ZipFile.read
+    monkeypatch.setattr(zipfile.ZipFile, "read",
+                        lambda zf, info: reads.append(info.filename) or real_read(zf, info))
+    return reads
+
+
+def test_expands_zip_in_order(limits):
+    items = _read([_upload("a.png", b"a" * 10, "image/png"),
+                   _zip([("b.jpg", b"b" * 900), ("notes.txt", b"x"), ("c.png", b"c" * 900)])])
+    assert [(name, len(data)) for name, data in items] == [("a.png", 10), ("b.jpg", 900),
+                                                           ("c.png", 900)]
+
+
+def test_rejects_oversized_zip_member(limits):
+    with pytest.raises(HTTPException) as e:
+        _read([_zip([("bomb.png", b"\0" * 10_000_000)])])
+    assert e.value.status_code == 413
+    assert limits == []
+
+
+def test_rejects_batch_over_total_size(limits):
+    with pytest.raises(HTTPException) as e:
+        _read([_zip([(f"{i}.png", b"\0" * 900) for i in range(5)])])
+    assert e.value.status_code == 413
+    assert limits == ["0.png", "1.png"]
+
+
+def test_rejects_oversized_image(limits):
+    with pytest.raises(HTTPException) as e:
+        _read([_upload("big.png", b"\0" * 1001, "image/png")])
+    assert e.value.status_code == 413
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+
+from conftest import SAMPLE_IMAGES, quiet, sample_path
+from omr_core.detect_answers import (
+    OPTION_BOUNDS, ROW_Y_CENTERS, answers_from_scores, decide_codes, detect_answers,
+    score_bubbles,
+)
+from omr_core.pipeline import find_paper_with_fallback
+from test_benchmark import legacy_detect_answers
+
+
+def _random_canvas(rng):
+    """1000x1414 canvas with every bubble painted empty, faint, filled or in between."""
+    canvas = np.full((1414, 1000), 245, dtype=np.uint8)
+    for x_start, x_end in ((90, 350), (594, 854)):
+        col_w = x_end - x_start
+        for yc in ROW_Y_CENTERS:
+            for xs_r, xe_r in OPTION_BOUNDS:
+                level = rng.choice([rng.integers(225, 250), rng.integers(150, 225),
+                                    rng.integers(20, 90)], p=[0.6, 0.15, 0.25])
+                canvas[yc - 27:yc + 27, x_start + int(col_w * xs_r) + 8:
+                       x_start + int(col_w * xe_r) - 8] = level
+    noise = rng.normal(0, 6, canvas.shape)
+    return np.clip(canvas + noise, 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("name", SAMPLE_IMAGES)
+def test_matches_legacy_loop_on_samples(name):
+    with quiet():
+        result = find_paper_with_fallback(cv2.imread(sample_path(name)))
+    assert result is not None
+    warped_ready, _ = result
+    assert detect_answers(warped_ready) == legacy_detect_answers(warped_ready)
+
+
+def test_matches_legacy_loop_on_random_canvases():
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        canvas = _random_canvas(rng)
+        for num_questions in (30, 20, 15, 7):
+            assert (detect_answers(canvas, num_questions)
+                    == legacy_detect_answers(canvas, num_questions))
+
+
+def test_decide_codes_rows_are_independent():
+    rng = np.random.default_rng(1)
+    sheets = [score_bubbles(_random_canvas(rng)) for _ in range(5)]
+    batched = decide_codes(np.concatenate(sheets))
+    assert batched.tolist() == np.concatenate([decide_codes(s) for s in sheets]).tolist()
+
+
+def test_answers_from_scores_matches_detect_answers():
+    canvas = _random_canvas(np.random.default_rng(2))
+    answers = detect_answers(canvas)
+    assert answers_from_scores(score_bubbles(canvas)) == [answers[q] for q in range(1, 31)]
+
+
+def test_decide_codes_empty_and_uniform_rows():
+    assert decide_codes(np.zeros((0, 5))).tolist() == []
+    assert answers_from_scores([[10.0, 10.5, 9.8, 10.2, 10.1]]) == [None]
+    assert answers_from_scores([[5.0, 180.0, 6.0, 4.0, 5.0]]) == ["B"]
+    assert answers_from_scores([[5.0, 180.0, 6.0, 175.0, 5.0]]) == ["DOUBLE"]
@@ -0,0 +1,124 @@
+import sqlite3
+import time
+
+import pytest
+
+from conftest import quiet, read_sample
+from omr_core import jobs
+from omr_core.jobs import ClaimLost, JobQueue, run_job
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    q.init()
+    return q
+
+
+def _submit(queue, items=(("a.png", b"x"),)):
+    return queue.submit(list(items), {1: "A"}, 1, {"answers"}, exam_id="uts")
+
+
+def test_claims_oldest_first(queue):
+    first, second = _submit(queue), _submit(queue)
+    assert queue.depth() == 2
+    job_id, params, attempt = queue.claim()
+    assert (job_id, attempt) == (first, 1)
+    assert params == {"answer_key": {"1": "A"}, "num_questions": 1,
+                      "stages": ["answers"], "exam_id": "uts"}
+    assert queue.get(first)["status"] == "running"
+    assert queue.claim()[0] == second
+    assert queue.claim() is None
+
+
+def test_finish_drops_images(queue):
+    job_id = _submit(queue)
+    queue.claim()
+    assert queue.finish(job_id, 1, result={"processed": 1})
+    job = queue.get(job_id)
+    assert (job["status"], job["done"], job["processed"]) == ("done", 1, 1)
+    assert queue.load_images(job_id) == []
+
+    failed = _submit(queue)
+    queue.claim()
+    queue.finish(failed, 1, error="boom")
+    assert queue.get(failed)["status"] == "failed"
+    assert queue.get(failed)["error"] == "boom"
+
+
+def test_restart_requeues_running_jobs(queue):
+    job_id = _submit(queue)
+    queue.claim()
+    queue.init()
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.claim()[0] == job_id
+
+
+def test_stale_running_job_is_requeued(queue, monkeypatch):
+    job_id = _submit(queue)
+    queue.claim()
+    assert queue.claim() is None
+    monkeypatch.setattr(jobs, "JOB_STALE_AFTER", 0.0)
+    time.sleep(0.01)
+    assert queue.claim()[0] == job_id
+
+
+def test_heartbeat_keeps_long_job_claimed(queue, monkeypatch):
+    job_id = _submit(queue)
+    _, _, attempt = queue.claim()
+    monkeypatch.setattr(jobs, "JOB_STALE_AFTER", 0.05)
+    for _ in range(3):
+        time.sleep(0.03)
+        queue.set_progress(job_id, attempt, 1)
+        assert queue.claim() is None
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_superseded_worker_cannot_finish(queue, monkeypatch):
+    job_id = _submit(queue)
+    _, _, first = queue.claim()
+    monkeypatch.setattr(jobs, "JOB_STALE_AFTER", 0.0)
+    time.sleep(0.01)
+    _, _, second = queue.claim()
+    monkeypatch.setattr(jobs, "JOB_STALE_AFTER", 1800.0)
+    with pytest.raises(ClaimLost):
+        queue.heartbeat(job_id, first)
+    assert not queue.finish(job_id, first, error="late")
+    assert queue.get(job_id)["status"] == "running"
+    assert queue.finish(job_id, second, result={"processed": 1})
+    assert queue.get(job_id)["status"] == "done"
+
+
+def test_init_adds_heartbeat_column_to_old_queue(tmp_path):
+    db = str(tmp_path / "old.sqlite3")
+    old_schema = jobs._SCHEMA.replace("    heartbeat_at  REAL,", "")
+    sqlite3.connect(db).executescript(old_schema)
+    queue = JobQueue(db)
+    queue.init()
+    job_id = _submit(queue)
+    queue.heartbeat(job_id, queue.claim()[2])
+
+
+def test_job_interrupted_too_often_fails(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    job_id = _submit(queue)
+    for _ in range(2):
+        assert queue.claim()[0] == job_id
+        queue.init()
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and "2" in job["error"]
+    assert queue.load_images(job_id) == []
+    assert queue.claim() is None
+
+
+def test_run_job_reads_every_sheet(queue):
+    job_id = queue.submit([("ljk.png", read_sample("IMG_3344.PNG")), ("rusak.png", b"x")],
+                          {q: "A" for q in range(1, 31)}, 30, {"answers"})
+    claimed_id, params, attempt = queue.claim()
+    with quiet():
+        result = run_job(queue, claimed_id, attempt, params)
+    assert claimed_id == job_id
+    assert result["processed"] == 1
+    assert [f["filename"] for f in result["failed"]] == ["rusak.png"]
+    assert result["results"][0]["filename"] == "ljk.png"
+    assert queue.get(job_id)["done"] == 2
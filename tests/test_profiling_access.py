@@ -0,0 +1,54 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """/scan with a stub pipeline that records the sheets it was given."""
+    scanned = []
+
+    def scan(contents, answer_key, num_questions, stages, artifacts, device_id):
+        scanned.append(contents)
+        return None, {1: "A"}, None, None, main.grade_answers({1: "A"}, answer_key), None
+
+    monkeypatch.setattr(main, "result_cache", main.ResultCache(max_entries=0))
+    monkeypatch.setattr(main, "scan_sheet", scan)
+    client = TestClient(main.app)
+    client.scanned = scanned
+    return client
+
+
+def _scan(client, headers=None, params=None):
+    return client.post("/scan", files={"file": ("ljk.png", b"sheet", "image/png")},
+                       data={"stages": "answers", "answer_key_json": '{"1": "A"}'},
+                       headers=headers, params=params)
+
+
+def test_scan_ignores_profile_header_while_profiling_is_off(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_TOKEN", None)
+    response = _scan(client, headers={"X-OMR-Profile": "anything"})
+    assert response.status_code == 200
+    assert "profile_id" not in response.json()
+    assert client.scanned == [b"sheet"]
+
+
+def test_scan_rejects_wrong_profile_token(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_TOKEN", "s3cret")
+    assert _scan(client, headers={"X-OMR-Profile": "wrong"}).status_code == 403
+    assert client.scanned == []
+
+
+def test_profile_token_is_only_read_from_header(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(main.profile_store, "list", lambda: [])
+    assert client.get("/profiles", params={"profile": "s3cret"}).status_code == 403
+    assert client.get("/profiles", headers={"X-OMR-Profile": "s3cret"}).status_code == 200
+    # A token in the query string is not a profiling request
+    assert _scan(client, params={"profile": "s3cret"}).status_code == 200
+
+
+def test_profiles_endpoints_404_while_profiling_is_off(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_TOKEN", None)
+    assert client.get("/profiles", headers={"X-OMR-Profile": "x"}).status_code == 404
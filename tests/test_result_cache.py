@@ -0,0 +1,62 @@
+import numpy as np
+
+from omr_core.result_cache import ResultCache, content_hash, result_cache_key
+
+
+def _value(n=3):
+    scores = np.arange(n * 5, dtype=np.float64).reshape(n, 5)
+    return None, {q: "A" for q in range(1, n + 1)}, "BUDI", "123", scores
+
+
+def _assert_same(a, b):
+    assert a[:4] == b[:4]
+    np.testing.assert_array_equal(a[4], b[4])
+
+
+def test_key_covers_every_reading_parameter():
+    digest = content_hash(b"photo")
+    key = result_cache_key(digest, 30, {"answers", "name"})
+    assert key == result_cache_key(digest, 30, ["name", "answers"])
+    assert key != result_cache_key(digest, 20, {"answers", "name"})
+    assert key != result_cache_key(digest, 30, {"answers"})
+    assert key != result_cache_key(content_hash(b"other"), 30, {"answers", "name"})
+
+
+def test_memory_lru():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", _value())
+    cache.put("b", _value())
+    assert cache.get("a") is not None
+    cache.put("c", _value())
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 1, 2)
+
+
+def test_disabled_without_memory_or_disk():
+    cache = ResultCache(max_entries=0)
+    assert not cache.enabled
+    cache.put("a", _value())
+    assert cache.get("a") is None
+
+
+def test_disk_survives_restart(tmp_path):
+    ResultCache(disk_dir=str(tmp_path)).put("a", _value())
+    restarted = ResultCache(max_entries=0, disk_dir=str(tmp_path))
+    _assert_same(restarted.get("a"), _value())
+    failed = ("not_found", None, None, None, None)
+    restarted.put("b", failed)
+    assert ResultCache(disk_dir=str(tmp_path)).get("b") == failed
+
+
+def test_disk_evicts_least_recently_used(tmp_path):
+    size = len(ResultCache._dump(_value()))
+    cache = ResultCache(max_entries=0, disk_dir=str(tmp_path), disk_max_bytes=2 * size)
+    cache.put("a", _value())
+    cache.put("b", _value())
+    assert cache.get("a") is not None
+    cache.put("c", _value())
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.json", "c.json"]
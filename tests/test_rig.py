@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+import pytest
+
+from conftest import quiet
+from omr_core import rig
+from omr_core.pipeline import locate_paper
+from omr_core.rig import RigCache, markers_from_warp, plausible_markers
+
+
+def _shift(gray, dx, dy):
+    M = np.float32([[1, 0, dx], [0, 1, dy]])
+    return cv2.warpAffine(gray, M, gray.shape[::-1], borderMode=cv2.BORDER_REPLICATE)
+
+
+def _corners(M_warp):
+    canvas = np.float32([[[0, 0], [1000, 0], [1000, 1414], [0, 1414]]])
+    return cv2.perspectiveTransform(canvas, np.linalg.inv(M_warp))[0]
+
+
+@pytest.fixture
+def learned(sample_gray):
+    """A RigCache that has learned device "cam" from a full search of the sample."""
+    with quiet():
+        M_warp, attempt = locate_paper(sample_gray)
+    assert M_warp is not None and attempt != "rig"
+    cache = RigCache()
+    cache.learn("cam", sample_gray, M_warp)
+    return cache, M_warp
+
+
+def test_hit_on_same_and_slightly_moved_sheet(learned, sample_gray):
+    cache, M_warp = learned
+    M_same = cache.locate("cam", sample_gray)
+    assert M_same is not None
+    assert np.abs(_corners(M_same) - _corners(M_warp)).max() < 3
+
+    M_moved = cache.locate("cam", _shift(sample_gray, 12, -8))
+    assert M_moved is not None
+    assert np.abs(_corners(M_moved) - _corners(M_warp) - [12, -8]).max() < 3
+
+
+def test_miss_on_unknown_device_other_size_or_no_sheet(learned, sample_gray):
+    cache, _ = learned
+    assert cache.locate("other", sample_gray) is None
+    assert cache.locate("cam", sample_gray[:-10]) is None
+    assert cache.locate("cam", np.full_like(sample_gray, 200)) is None
+
+
+def test_miss_when_sheet_moved_past_reach(learned, sample_gray):
+    cache, _ = learned
+    assert cache.locate("cam", _shift(sample_gray, 250, 0)) is None
+
+
+def test_rejects_markers_that_no_longer_frame_the_sheet(learned, sample_gray, monkeypatch):
+    cache, M_warp = learned
+    markers = markers_from_warp(sample_gray, M_warp)
+    assert plausible_markers(markers)
+
+    # Bottom markers found halfway up: right blobs, wrong quad
+    squashed = [dict(m) for m in markers]
+    for m, top in ((squashed[2], markers[1]), (squashed[3], markers[0])):
+        m["center"] = (m["center"][0], (m["center"][1] + top["center"][1]) / 2)
+    assert not plausible_markers(squashed)
+
+    # Blobs far smaller than markers at the right places
+    tiny = [dict(m, area=m["area"] / 9) for m in markers]
+    assert not plausible_markers(tiny)
+
+    monkeypatch.setattr(rig, "track_markers", lambda gray, markers, reach: squashed)
+    assert cache.locate("cam", sample_gray) is None
+
+
+def test_lru_drops_least_recent_device(learned, sample_gray):
+    _, M_warp = learned
+    cache = RigCache(max_devices=2)
+    for device in ("a", "b"):
+        cache.learn(device, sample_gray, M_warp)
+    assert cache.locate("a", sample_gray) is not None
+    cache.learn("c", sample_gray, M_warp)
+    assert cache.devices() == 2
+    assert cache.locate("b", sample_gray) is None
+    assert cache.locate("a", sample_gray) is not None
+
+
+def test_locate_paper_uses_rig_on_second_sheet(sample_gray, monkeypatch):
+    monkeypatch.setattr("omr_core.pipeline.rig_cache", RigCache())
+    with quiet():
+        _, first = locate_paper(sample_gray, device_id="desk-1")
+        M_warp, second = locate_paper(sample_gray, device_id="desk-1")
+    assert first != "rig"
+    assert second == "rig" and M_warp is not None
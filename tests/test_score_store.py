@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+from omr_core.score_store import ScoreStore
+
+
+def _sheets(*hashes):
+    return [{"hash": h, "scores": np.full((3, 5), i, dtype=np.float32), "filename": f"{h}.png"}
+            for i, h in enumerate(hashes)]
+
+
+def test_stores_each_sheet_once(tmp_path):
+    store = ScoreStore(str(tmp_path))
+    assert store.add_many("uts", _sheets("a", "b", "a")) == 2
+    assert store.add_many("uts", _sheets("b", "c")) == 1
+    entries, rows = store.load("uts")
+    assert [e["hash"] for e in entries] == ["a", "b", "c"]
+    assert rows.shape == (9, 5)
+
+
+def test_sheets_past_cap_are_not_stored(tmp_path):
+    store = ScoreStore(str(tmp_path), max_sheets=3)
+    assert store.add_many("uts", _sheets("a", "b")) == 2
+    assert store.add_many("uts", _sheets("a", "c", "d")) == 1
+    assert [e["hash"] for e in store.load("uts")[0]] == ["a", "b", "c"]
+
+
+def test_least_recently_scanned_exams_are_dropped(tmp_path):
+    store = ScoreStore(str(tmp_path), max_exams=2)
+    for age, exam_id in ((300, "uh1"), (200, "uh2")):
+        store.add_many(exam_id, _sheets("a"))
+        index = os.path.join(str(tmp_path), exam_id, "index.jsonl")
+        os.utime(index, (os.path.getmtime(index) - age,) * 2)
+    store.add_many("uh1", _sheets("b"))  # uh1 scanned again: uh2 is now the oldest
+    store.add_many("uts", _sheets("a"))
+    assert store.exam_ids() == ["uh1", "uts"]
+
+    # An evicted exam starts over when it is scanned again
+    assert store.add_many("uh2", _sheets("a")) == 1
+    assert store.exam_ids() == ["uh2", "uts"]
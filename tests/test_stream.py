@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import pytest
+
+from conftest import quiet, read_sample
+from omr_core.stream import HINTS, STABLE_FRAMES, StreamTracker
+
+
+def _encode(gray):
+    ok, buf = cv2.imencode(".png", gray)
+    assert ok
+    return buf.tobytes()
+
+
+def _feed(tracker, frames):
+    with quiet():
+        return [tracker.process(frame) for frame in frames]
+
+
+@pytest.fixture(scope="module")
+def sheet_frame():
+    return read_sample("IMG_3344.PNG")
+
+
+def test_still_sheet_is_captured_once(sheet_frame):
+    tracker = StreamTracker()
+    steps = _feed(tracker, [sheet_frame] * (STABLE_FRAMES + 3))
+
+    tracking = [feedback["tracking"] for feedback, _, _ in steps]
+    assert tracking == ["searched"] + ["tracked"] * (STABLE_FRAMES + 2)
+    captured = [M_warp is not None for _, _, M_warp in steps]
+    assert captured == [False] * STABLE_FRAMES + [True] + [False, False]
+    # No motion measured on the first frame, so it is never stable
+    assert steps[0][0]["hint"] == HINTS["moving"]
+    assert steps[STABLE_FRAMES][0]["capture"]
+    assert steps[-1][0]["hint"] == HINTS["done"]
+
+
+def test_next_sheet_is_captured_after_tracking_is_lost(sheet_frame):
+    blank = _encode(np.full((600, 400), 230, dtype=np.uint8))
+    tracker = StreamTracker()
+    steps = _feed(tracker, [sheet_frame] * (STABLE_FRAMES + 1) + [blank]
+                  + [sheet_frame] * (STABLE_FRAMES + 1))
+    lost = steps[STABLE_FRAMES + 1][0]
+    assert lost["tracking"] == "lost" and lost["hint"] == HINTS["not_found"]
+    assert sum(M_warp is not None for _, _, M_warp in steps) == 2
+
+
+def test_rearm_allows_recapture(sheet_frame):
+    tracker = StreamTracker()
+    _feed(tracker, [sheet_frame] * (STABLE_FRAMES + 1))
+    tracker.rearm()
+    steps = _feed(tracker, [sheet_frame] * STABLE_FRAMES)
+    assert steps[-1][2] is not None
+
+
+def test_invalid_frame():
+    feedback, gray, M_warp = StreamTracker().process(b"not an image")
+    assert feedback == {"frame": 1, "error": "invalid_image"}
+    assert gray is None and M_warp is None
+
+
+def test_cut_off_sheet_is_not_tracked(sheet_frame):
+    gray = cv2.imdecode(np.frombuffer(sheet_frame, np.uint8), cv2.IMREAD_GRAYSCALE)
+    # Bottom third out of frame: bottom markers missing
+    tracker = StreamTracker()
+    steps = _feed(tracker, [_encode(gray[: gray.shape[0] * 2 // 3])] * (STABLE_FRAMES + 1))
+    assert all(M_warp is None for _, _, M_warp in steps)
+    assert all(not feedback.get("aligned") for feedback, _, _ in steps)
+
+
+def test_websocket_survives_failing_frame(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    def process(self, contents):
+        if contents == b"bad":
+            raise ValueError("boom")
+        return {"frame": 2}, None, None
+
+    monkeypatch.setattr(StreamTracker, "process", process)
+    with TestClient(main.app).websocket_connect("/stream?stages=name,id") as ws:
+        ws.send_bytes(b"bad")
+        error = ws.receive_json()
+        assert error["type"] == "error" and "boom" in error["detail"]
+        ws.send_bytes(b"good")
+        assert ws.receive_json() == {"type": "frame", "frame": 2}